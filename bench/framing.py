@@ -0,0 +1,58 @@
+# Deadline line framing micro-benchmark
+#
+# Feeds 1 MB bursts of IRC traffic into the line framing of YeOldeIRCClient
+# and reports the amount of lines per second, compared to the old
+# string slicing approach.
+#
+# Usage: python bench/framing.py [bursts]
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from irc import YeOldeLineBuffer
+
+BURST_SIZE = 1024 * 1024
+
+def makeBurst():
+    line = ':nick!user@host.example.org PRIVMSG #deadline :' + \
+        'the quick brown fox jumps over the lazy dog ' * 2 + '\r\n'
+    return line * (BURST_SIZE / len(line))
+
+def sliceFraming(bursts, burst):
+    count = 0
+    stream = ''
+    for n in xrange(bursts):
+        stream += burst
+        i = stream.find('\r\n')
+        while i > -1:
+            cmd = stream[:i]
+            stream = stream[i + 2:]
+            count += 1
+            i = stream.find('\r\n')
+    return count
+
+def bufferFraming(bursts, burst):
+    count = 0
+    lines = YeOldeLineBuffer()
+    for n in xrange(bursts):
+        lines.feed(burst)
+        for cmd in lines:
+            count += 1
+    return count
+
+def measure(name, func, bursts, burst):
+    start = time()
+    count = func(bursts, burst)
+    elapsed = time() - start
+    print "%-8s %8d lines in %7.3fs, %10.0f lines/s" % \
+        (name, count, elapsed, count / elapsed)
+
+if __name__ == '__main__':
+    bursts = 4
+    if len(sys.argv) > 1:
+        bursts = int(sys.argv[1])
+    burst = makeBurst()
+    measure('slice', sliceFraming, bursts, burst)
+    measure('buffer', bufferFraming, bursts, burst)
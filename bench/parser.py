@@ -0,0 +1,79 @@
+# Deadline IRC message parser benchmark
+#
+# Compares parseMessage with a naive split based parser on a traffic
+# corpus. The naive parser is measured returning a bare tuple, and
+# building the IRCMessage that parseMessage returns, which takes most of
+# the difference between the two. By default a built-in sample of typical server traffic is used,
+# a recorded session (one raw line per line) can be passed instead.
+#
+# Usage: python bench/parser.py [corpus] [rounds]
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from irc import IRCMessage, parseMessage, parseTags
+
+SAMPLE = """\
+:irc.example.org NOTICE * :*** Looking up your hostname...
+:irc.example.org 001 deadline :Welcome to the Example IRC Network deadline!deadline@host.example.org
+:irc.example.org 005 deadline CHANTYPES=# EXCEPTS INVEX CHANMODES=eIbq,k,flj,CFLMPQScgimnprstz :are supported by this server
+:irc.example.org 353 deadline = #deadline :deadline @op +voice alice bob carol dave eve mallory
+:irc.example.org 366 deadline #deadline :End of /NAMES list.
+PING :irc.example.org
+:alice!alice@uva.example.nl PRIVMSG #deadline :has anyone seen the slides for tomorrow?
+:bob!~bob@dsl-1-2-3-4.example.com PRIVMSG #deadline :.weather amsterdam
+:carol!carol@gateway/web/freenode/ip.1.2.3.4 JOIN #deadline
+:dave!dave@host.example.org PART #deadline :Leaving
+:eve!eve@host.example.org QUIT :Ping timeout: 240 seconds
+:mallory!m@evil.example.org NICK :mallory_
+:op!op@staff.example.org MODE #deadline +o alice
+:op!op@staff.example.org KICK #deadline mallory_ :flooding
+@time=2011-10-09T12:00:00.000Z;account=alice :alice!alice@uva.example.nl PRIVMSG #deadline :tagged message with \\s escapes
+:alice!alice@uva.example.nl PRIVMSG deadline :\x01VERSION\x01
+"""
+
+def naiveParse(line):
+    tags = prefix = None
+    if line.startswith('@'):
+        tagstr, line = line[1:].split(' ', 1)
+        tags = parseTags(tagstr)
+    if line.startswith(':'):
+        prefix, line = line[1:].split(' ', 1)
+    if ' :' in line:
+        line, trailing = line.split(' :', 1)
+        params = line.split()
+        params.append(trailing)
+    else:
+        params = line.split()
+    command = params.pop(0).upper()
+    return tags, prefix, command, params
+
+def naiveMessage(line):
+    tags, prefix, command, params = naiveParse(line)
+    return IRCMessage(command, params, prefix, tags)
+
+def measure(name, func, corpus, rounds):
+    start = time()
+    for n in xrange(rounds):
+        for line in corpus:
+            func(line)
+    elapsed = time() - start
+    count = len(corpus) * rounds
+    print "%-9s %8d lines in %7.3fs, %10.0f lines/s" % \
+        (name, count, elapsed, count / elapsed)
+
+if __name__ == '__main__':
+    rounds = 20000
+    if len(sys.argv) > 1:
+        corpus = [l.rstrip('\r\n') for l in open(sys.argv[1])]
+        rounds = 10
+    else:
+        corpus = SAMPLE.splitlines()
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    corpus = [line for line in corpus if line.strip()]
+    measure('split', naiveParse, corpus, rounds)
+    measure('split+msg', naiveMessage, corpus, rounds)
+    measure('parser', parseMessage, corpus, rounds)
@@ -0,0 +1,49 @@
+# Deadline resize reflow benchmark
+#
+# Measures the time a window full of messages needs to rebuild its line
+# index after a resize, before it can draw (the visible part) and until
+# the whole index is rebuilt.
+#
+# Usage: python bench/reflow.py [messages] [rounds]
+
+import os
+import sys
+import random
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from gui import DeadWindow, DeadMessage, DM_NOTICE
+
+WORDS = ['hello', 'the', 'a', 'deadline', 'http://example.org/some/long/path',
+    'irc', 'message', 'of', 'reasonable', 'length', 'x' * 40]
+
+def fill(count):
+    random.seed(0)
+    window = DeadWindow("bench", count)
+    for n in xrange(count):
+        window.addMessage(DeadMessage(DM_NOTICE, ' '.join(
+            random.choice(WORDS) for i in xrange(random.randint(1, 40)))))
+    return window
+
+def measure(window, rounds):
+    visible = total = 0.0
+    for n in xrange(rounds):
+        window.y = window.x = 0
+        window.height = 50
+        window.width = 80 + n % 2 * 40
+        start = time()
+        window.updateLineIndex()
+        visible += time() - start
+        window.finishReflow()
+        total += time() - start
+    print "%8d messages, visible in %7.3fms, complete in %7.3fms" % \
+        (len(window.messages), visible * 1000 / rounds, total * 1000 / rounds)
+
+if __name__ == '__main__':
+    count = 10000
+    rounds = 20
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    measure(fill(count), rounds)
@@ -2,5 +2,15 @@
 
 from gui import DeadGUI, TITLE_MODE_CENTERED
 from irc import YeOldeIRCClient
+from resolver import DeadResolver
+from events import DeadEventQueue, DeadEvent, DeferredCall
+from poller import DeadMultiplexer, createPoller, POLL_READ, POLL_WRITE
+from pool import DeadWorkerPool, futures
+from rules import DeadRule, DeadRuleSet, offloaded
+from acl import DeadACL, DeadAccess
+from state import YeOldeIRCState, YeOldeIRCChannel, YeOldeIRCUser
+from log import DeadLog, DeadLogWriter
+from search import DeadSearch, DeadSearchIndex
+from history import DeadHistory
 from mulsoc import SocketMultiplexer
 
@@ -10,26 +10,84 @@ due to their implementation of the POSIX select() function"""
 
 # Import all required stuff
 from __init__ import *
-from socket import gethostbyname
+from socket import AF_INET, AF_INET6
+from collections import OrderedDict
+from irc import CHANNEL_PREFIXES
 import sys
 
+# Run on an asyncio event loop, or on the best readiness backend of this
+# platform unless one is given with --poller=<select|poll|epoll>
+if '--asyncio' in sys.argv[1:]:
+    from aio import AsyncioMultiplexer as Multiplexer, asyncioSocket
+    IRCClient = asyncioSocket(YeOldeIRCClient)
+    multiplexer_args = ()
+else:
+    from poller import DeadMultiplexer as Multiplexer, polledSocket, POLLERS
+    IRCClient = polledSocket(YeOldeIRCClient)
+    multiplexer_args = ()
+    for arg in sys.argv[1:]:
+        if arg.startswith('--poller='):
+            if arg[9:] not in POLLERS:
+                print "Unknown poller '%s', use one of: %s" % (arg[9:],
+                    ', '.join(sorted(POLLERS)))
+                exit(1)
+            multiplexer_args = (arg[9:],)
+
 # Fetch the system locale settings, so ncurses can do its job correctly
 # UTF8 strings to be precise
 # For more info see: http://docs.python.org/3.1/library/curses.html
 import locale
 locale.setlocale(locale.LC_ALL, '')
 
-class Deadline(SocketMultiplexer):
+class Deadline(Multiplexer):
     """
         Deadline IRC bot v0.1
 
         Application class
     """
 
+    # Directory the scrollback logs of network windows are kept in, and
+    # the file the prompt history is kept in
+    LOG_DIR = os.path.expanduser('~/.deadline/logs')
+    HISTORY_FILE = os.path.expanduser('~/.deadline/history')
+
+    # Query windows kept open, each holding an open log. When another
+    # user starts talking to us, the least recently used one is closed.
+    MAX_QUERIES = 32
+
     def __init__(self):
-        SocketMultiplexer.__init__(self, YeOldeIRCClient)
+        Multiplexer.__init__(self, self.createClient, *multiplexer_args)
         self.addReader(StandardInput())
-        self.msock = None
+        self.resolver = DeadResolver(self)
+        self.logwriter = DeadLogWriter(self)
+
+        # Pool for offloaded rules, these run inline without futures
+        self.pool = None
+        if futures is not None:
+            self.pool = DeadWorkerPool(self)
+
+        # Rules applied to the messages of all networks
+        self.rules = DeadRuleSet()
+        self.rules.addKeyword('version', DeadRule(self.versionRule))
+
+        # Scrollback search, shown in a window of its own
+        self.search = DeadSearch(gui)
+
+        # Connections by network name, the GUI window of every connection,
+        # networks of which the server is being looked up, and the network
+        # the connection being set up belongs to.
+        self.networks = {}
+        self.windows = {}
+        self.resolving = set()
+        self.connecting = None
+
+        # Channel and query windows by (network, case mapped name), and
+        # the (network, name) every such window talks to.
+        self.routes = {}
+        self.targets = {}
+
+        # Query windows, least recently used first
+        self.queries = OrderedDict()
 
     # Das Entrypoint
     def run(self):
@@ -37,6 +95,9 @@ class Deadline(SocketMultiplexer):
         gui.registerCommand('quit', self.quitCall)
         gui.registerCommand('connect', self.connectCall)
         gui.registerCommand('raw', self.rawCall)
+        gui.registerCommand('join', self.joinCall)
+        gui.registerCommand('search', self.search.searchCall)
+        gui.registerCommand('close', self.closeCall)
 
         # Initialize main window
         mainwin = gui.getMainWindow()
@@ -46,6 +107,15 @@ class Deadline(SocketMultiplexer):
         mainwin.addNotice("You can type '/quit' to quit," +
             " or type something else to simply see it" +
             " show up in this window :-)")
+        gui.onNoExecute = self.sayCall
+        gui.setEventQueue(self.eq)
+        try:
+            if not os.path.isdir(os.path.dirname(self.HISTORY_FILE)):
+                os.makedirs(os.path.dirname(self.HISTORY_FILE))
+        except OSError:
+            pass
+        else:
+            gui.setHistoryStore(DeadHistory(self.HISTORY_FILE, self.eq))
         gui.show()
         self.startMultiplex()
 
@@ -54,42 +124,327 @@ class Deadline(SocketMultiplexer):
             Handles SIGWINCH for terminal resizing.
         """
         gui.stdscr.touchwin()
-        while gui.inputEvent():
-            pass
+        gui.inputEvent()
 
     def quitCall(self, str):
+        gui.store.close()
+        for window in self.windows.values() + self.routes.values():
+            if window.log is not None:
+                window.log.close()
+        self.logwriter.close()
+        self.resolver.close()
+        if self.pool is not None:
+            self.pool.close()
         self.stopMultiplex()
 
-    def connectCall(self, server):
-        ip = gethostbyname(server)
-        self.connect(ip, 6667)
+    def createClient(self, *args, **kwargs):
+        """
+            Socket factory, tags every new client with the network
+            it is being connected to.
+        """
 
-    def rawCall(self, cmd):
-        self.msock.sendRaw(cmd)
+        client = IRCClient(*args, **kwargs)
+        if self.connecting is not None:
+            client.network = self.connecting
+            client.rules = self.rules
+        return client
 
-    def debugSendRaw(self, cmd):
-        gui.getMainWindow().addOutgoing(cmd)
-        gui.stdscr.touchwin()
-        gui.redrawFromScratch()
-        gui.stdscr.refresh()
+    def clientConnected(self, client):
+        """
+            Registers 'client' for its network once it is connected, so
+            failed connects never leave a network registered.
+        """
 
-    def debugRecvRaw(self, cmd):
-        gui.getMainWindow().addIncoming(cmd)
-        gui.stdscr.touchwin()
-        gui.redrawFromScratch()
-        gui.stdscr.refresh()
+        if client.network in self.networks:
+            self.windows[client.network].addNotice(
+                "Already connected to network '%s'" % client.network)
+            client.close()
+            return False
+        self.networks[client.network] = client
+        self.windows[client.network].addNotice("Connected")
+        gui.scheduleRender()
+        return True
+
+    def onConnectError(self, client, error):
+        self.windows[client.network].addNotice("Unable to connect: %s" %
+            error)
+        gui.scheduleRender()
+
+    def connectCall(self, args):
+        """
+            /connect <server> [port] [network]
+        """
+
+        args = (args or '').split()
+        if not args or len(args) > 3:
+            gui.getCurrentWindow().addNotice(
+                "Usage: /connect <server> [port] [network]")
+            return
+        server = args[0]
+        port = 6667
+        if len(args) > 1:
+            try:
+                port = int(args[1])
+            except ValueError:
+                gui.getCurrentWindow().addNotice("Invalid port '%s'" % args[1])
+                return
+        network = args[2] if len(args) > 2 else server
+        if network in self.networks or network in self.resolving:
+            gui.getCurrentWindow().addNotice(
+                "Already connected to network '%s'" % network)
+            return
+
+        if network not in self.windows:
+            self.windows[network] = gui.createWindow(network,
+                log = self.openLog(network))
+        window = self.windows[network]
+        window.setTitle("%s (%s:%d)" % (network, server, port))
+        window.addNotice("Looking up %s" % server)
+        gui.setCurrentWindow(window)
+
+        self.resolving.add(network)
+        self.resolver.resolve(server, port, self.connectResolved,
+            network = network, server = server)
+
+    def openLog(self, name):
+        """
+            Opens the scrollback log for window 'name', returns None if
+            it can not be opened.
+        """
+
+        try:
+            if not os.path.isdir(self.LOG_DIR):
+                os.makedirs(self.LOG_DIR)
+            return DeadLog(os.path.join(self.LOG_DIR,
+                name.replace(os.sep, '_')), self.eq, self.logwriter)
+        except (IOError, OSError) as e:
+            gui.getCurrentWindow().addNotice(
+                "Unable to open log for %s: %s" % (name, e))
+            return None
+
+    def connectResolved(self, addresses, error, network, server):
+        self.resolving.discard(network)
+        window = self.windows[network]
+        if error is not None:
+            window.addNotice("Unable to resolve %s: %s" % (server, error))
+            gui.scheduleRender()
+            return
+
+        # Both multiplexers connect over IPv4 as well as IPv6, prefer
+        # IPv4 since broken IPv6 routes are more common.
+        sockaddrs = [sockaddr for family in (AF_INET, AF_INET6)
+            for f, sockaddr in addresses if f == family]
+        if not sockaddrs:
+            window.addNotice("No usable address for %s" % server)
+            gui.scheduleRender()
+            return
+        ip, port = sockaddrs[0][:2]
+        window.addNotice("Connecting to %s (%s) port %d" % (server, ip, port))
+        gui.scheduleRender()
+
+        self.connecting = network
+        try:
+            self.connect(ip, port)
+        except (IOError, OSError) as e:
+            window.addNotice("Unable to connect: %s" % e)
+        finally:
+            self.connecting = None
+
+    def getNetwork(self, args):
+        """
+            Determines the network a command applies to, either given by
+            a leading -network argument or by the current window.
+
+            Returns a (client, args) tuple, client being None when the
+            network can not be determined.
+        """
+
+        args = args or ''
+        if args.startswith('-'):
+            name, _, args = args[1:].partition(' ')
+            client = self.networks.get(name)
+            if client is None:
+                gui.getCurrentWindow().addNotice(
+                    "Not connected to network '%s'" % name)
+            return client, args.strip()
+
+        window = gui.getCurrentWindow()
+        if window in self.targets:
+            client = self.networks.get(self.targets[window][0])
+            if client is not None:
+                return client, args
+        for client in self.networks.itervalues():
+            if self.windows.get(client.network) is window:
+                return client, args
+        if len(self.networks) == 1:
+            return self.networks.values()[0], args
+        window.addNotice("Not connected, or no network given" +
+            " (use -network)")
+        return None, args
+
+    def rawCall(self, args):
+        """
+            /raw [-network] <command>
+        """
+
+        client, cmd = self.getNetwork(args)
+        if client is not None and cmd:
+            client.sendRaw(cmd)
+
+    def joinCall(self, args):
+        """
+            /join [-network] <channel>
+        """
+
+        client, channel = self.getNetwork(args)
+        if client is not None and channel:
+            client.sendJoin(channel)
+
+    def sayCall(self, text):
+        """
+            Sends text typed into a channel or query window to its
+            channel or user, other windows just show it.
+        """
+
+        window = gui.getCurrentWindow()
+        if window not in self.targets:
+            return True
+        network, name = self.targets[window]
+        client = self.networks.get(network)
+        if client is None:
+            window.addNotice("Not connected to network '%s'" % network)
+            return False
+        client.sendMessage(name, text)
+        window.addChat(client.state.nick or '', text)
+        return False
+
+    def getWindow(self, client, name):
+        """
+            Returns the window of channel or query 'name' on the network
+            of 'client', creating it if necessary.
+        """
+
+        key = (client.network, client.state.lower(name))
+        window = self.routes.get(key)
+        query = name[:1] not in CHANNEL_PREFIXES
+        if window is None:
+            if query:
+                self.closeQueries(Deadline.MAX_QUERIES - 1)
+            window = gui.createWindow(name,
+                log = self.openLog('%s %s' % (client.network, name)))
+            window.setTitle("%s on %s" % (name, client.network))
+            window.setLag(self.windows[client.network].lag)
+            self.routes[key] = window
+            self.targets[window] = (client.network, name)
+        if query:
+            self.queries.pop(window, None)
+            self.queries[window] = True
+        return window
+
+    def closeQueries(self, count):
+        """
+            Closes the least recently used query windows until at most
+            'count' are left, the current window is kept open.
+        """
+
+        current = gui.getCurrentWindow()
+        for window in self.queries.keys():
+            if len(self.queries) <= count:
+                break
+            if window is not current:
+                self.closeWindow(window)
+
+    def closeWindow(self, window):
+        """
+            Closes a channel, query or search window and its log.
+        """
+
+        self.targets.pop(window, None)
+        self.queries.pop(window, None)
+        for key, route in self.routes.items():
+            if route is window:
+                del self.routes[key]
+        self.search.forgetWindow(window)
+        if window.log is not None:
+            window.log.close()
+        gui.removeWindow(window)
+
+    def closeCall(self, args):
+        """
+            /close, closes the current window
+        """
+
+        window = gui.getCurrentWindow()
+        if window is gui.getMainWindow() or \
+                window in self.windows.values():
+            window.addNotice("Only channel, query and search windows" +
+                " can be closed")
+            return
+        self.closeWindow(window)
+        gui.scheduleRender()
+
+    def clientJoined(self, client, channel):
+        self.getWindow(client, channel).addNotice("Joined %s" % channel)
+        gui.scheduleRender()
+
+    def clientMessage(self, client, target, nick, text):
+        self.getWindow(client, target).addChat(nick, text)
+        gui.scheduleRender()
+
+    def clientEvent(self, client, channel, text):
+        """
+            Shows 'text' in the window of 'channel', or in the network
+            window if that channel has none.
+        """
+
+        key = (client.network, client.state.lower(channel))
+        window = self.routes.get(key, self.windows[client.network])
+        window.addNotice(text)
+        gui.scheduleRender()
+
+    def versionRule(self, nick, channel, arg):
+        return "Deadline v0.1"
+
+    def clientNotice(self, client, notice):
+        self.windows[client.network].addNotice(notice)
+        gui.scheduleRender()
+
+    def onClientDisconnect(self, client):
+        if self.networks.get(client.network) is client:
+            del self.networks[client.network]
+        self.windows[client.network].addNotice("Disconnected")
+        gui.scheduleRender()
+
+    def debugSendRaw(self, client, cmd):
+        self.windows[client.network].addOutgoing(cmd)
+        gui.scheduleRender()
+
+    def updateLag(self, client, lag):
+        """
+            Shows the lag of 'client' on its network window, and on all of
+            its channel and query windows.
+        """
+
+        self.windows[client.network].setLag(lag)
+        for (network, name), window in self.routes.iteritems():
+            if network == client.network:
+                window.setLag(lag)
+        gui.scheduleRender()
+
+    def debugRecvRaw(self, client, cmd):
+        self.windows[client.network].addIncoming(cmd)
+        gui.scheduleRender()
 
 class StandardInput(object):
     """
-        Standard input handler for SocketMultiplexer
+        Standard input handler for the multiplexer
     """
 
     def fileno(self):
         return sys.stdin.fileno()
 
     def handleRead(self):
-        while gui.inputEvent():
-            pass
+        gui.inputEvent()
 
 gui = DeadGUI()
 app = Deadline()
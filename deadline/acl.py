@@ -0,0 +1,215 @@
+# Deadline access control lists
+
+import re
+from collections import OrderedDict
+
+def splitMask(mask):
+    """
+        Splits a 'nick!user@host' mask into its three parts, missing parts
+        are taken to be '*'.
+    """
+
+    nick, _, rest = mask.partition('!')
+    if not _:
+        nick, rest = mask, ''
+    user, _, host = rest.rpartition('@')
+    if not _:
+        user, host = rest or '*', '*'
+    return nick or '*', user or '*', host or '*'
+
+def compileMask(mask):
+    """
+        Compiles an IRC wildcard mask, '*' matching any amount of
+        characters and '?' a single one, into a case insensitive regex.
+    """
+
+    pattern = ''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c)
+        for c in mask)
+    return re.compile(pattern + r'\Z', re.IGNORECASE | re.DOTALL)
+
+def isLiteral(part):
+    return '*' not in part and '?' not in part
+
+class DeadMask(object):
+    """
+        A single allow or deny entry of an ACL.
+    """
+
+    __slots__ = ('mask', 'allow', 'regex')
+
+    def __init__(self, mask, allow = True):
+        self.mask = '%s!%s@%s' % splitMask(mask)
+        self.allow = allow
+        self.regex = compileMask(self.mask)
+
+class DeadACL(object):
+    """
+        Access control list, a set of allow and deny masks.
+
+        A hostmask is allowed when it matches any allow mask and no deny
+        mask. Masks are indexed for lookup: masks with a literal nick are
+        kept in a dict by nick, masks with a literal host suffix in a trie
+        on the reversed host name segments, e.g. '*!*@*.uva.nl' is stored
+        under 'nl', 'uva'. Only the remaining masks are tried one by one.
+    """
+
+    def __init__(self):
+        self.masks = []
+        self.index = None
+
+    def __len__(self):
+        return len(self.masks)
+
+    def allow(self, mask):
+        self.masks.append(DeadMask(mask, True))
+        self.index = None
+
+    def deny(self, mask):
+        self.masks.append(DeadMask(mask, False))
+        self.index = None
+
+    def remove(self, mask):
+        """
+            Removes all entries for 'mask'.
+        """
+
+        mask = DeadMask(mask).mask.lower()
+        count = len(self.masks)
+        self.masks = [m for m in self.masks if m.mask.lower() != mask]
+        self.index = None
+        return len(self.masks) != count
+
+    def compile(self):
+        nicks = {}
+        hosts = {}
+        other = []
+        for entry in self.masks:
+            nick, user, host = splitMask(entry.mask)
+            if isLiteral(nick):
+                nicks.setdefault(nick.lower(), []).append(entry)
+                continue
+
+            # Literal host name segments, starting at the top level domain
+            segments = []
+            for segment in reversed(host.lower().split('.')):
+                if not isLiteral(segment):
+                    break
+                segments.append(segment)
+            if not segments:
+                other.append(entry)
+                continue
+            node = hosts
+            for segment in segments:
+                node = node.setdefault(segment, {})
+            node.setdefault(None, []).append(entry)
+        self.index = (nicks, hosts, other)
+
+    def candidates(self, nick, host):
+        """
+            Returns the entries that could possibly match.
+        """
+
+        if self.index is None:
+            self.compile()
+        nicks, hosts, other = self.index
+        result = list(nicks.get(nick.lower(), ()))
+        node = hosts
+        for segment in reversed(host.lower().split('.')):
+            node = node.get(segment)
+            if node is None:
+                break
+            result.extend(node.get(None, ()))
+        result.extend(other)
+        return result
+
+    def check(self, hostmask):
+        """
+            Returns whether 'hostmask' is allowed by this ACL.
+        """
+
+        nick, user, host = splitMask(hostmask)
+        hostmask = '%s!%s@%s' % (nick, user, host)
+        allowed = False
+        for entry in self.candidates(nick, host):
+            if entry.regex.match(hostmask):
+                if not entry.allow:
+                    return False
+                allowed = True
+        return allowed
+
+class DeadAccess(object):
+    """
+        Named ACLs with a cache of recent decisions.
+
+        Decisions are cached per (hostmask, ACL name) in an LRU cache,
+        which is invalidated when the ACLs change, and per user on
+        nick changes and quits.
+    """
+
+    CACHE_SIZE = 4096
+
+    def __init__(self):
+        self.acls = {}
+        self.cache = OrderedDict()
+
+        # Nick -> cache keys of that user
+        self.users = {}
+
+    def getACL(self, name):
+        """
+            Returns the ACL called 'name', creating it if necessary.
+            Call invalidate() after editing it.
+        """
+
+        if name not in self.acls:
+            self.acls[name] = DeadACL()
+        return self.acls[name]
+
+    def allow(self, name, mask):
+        self.getACL(name).allow(mask)
+        self.invalidate()
+
+    def deny(self, name, mask):
+        self.getACL(name).deny(mask)
+        self.invalidate()
+
+    def remove(self, name, mask):
+        removed = self.getACL(name).remove(mask)
+        self.invalidate()
+        return removed
+
+    def invalidate(self):
+        self.cache.clear()
+        self.users.clear()
+
+    def forgetUser(self, nick):
+        """
+            Drops the cached decisions of 'nick', call on NICK and QUIT.
+        """
+
+        for key in self.users.pop(nick.lower(), ()):
+            self.cache.pop(key, None)
+
+    def check(self, hostmask, name):
+        """
+            Returns whether 'hostmask' is allowed by the ACL called 'name',
+            unknown ACLs allow no one.
+        """
+
+        key = (hostmask, name)
+        decision = self.cache.pop(key, None)
+        if decision is None:
+            acl = self.acls.get(name)
+            decision = acl is not None and acl.check(hostmask)
+            if len(self.cache) >= DeadAccess.CACHE_SIZE:
+                old, _ = self.cache.popitem(False)
+                nick = splitMask(old[0])[0].lower()
+                keys = self.users.get(nick)
+                if keys is not None:
+                    keys.discard(old)
+                    if not keys:
+                        del self.users[nick]
+            self.users.setdefault(splitMask(hostmask)[0].lower(), set()). \
+                add(key)
+        self.cache[key] = decision
+        return decision
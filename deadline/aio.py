@@ -0,0 +1,165 @@
+# Deadline asyncio event loop adapter
+#
+# Runs Deadline on top of an asyncio (or trollius) event loop instead of
+# SocketMultiplexer, so asyncio based libraries can be used from within
+# Deadline without blocking it.
+
+import signal
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+if asyncio is not None:
+    ensure_future = getattr(asyncio, 'ensure_future', None) or \
+        getattr(asyncio, 'async')
+    Protocol = asyncio.Protocol
+else:
+    Protocol = object
+
+class AsyncioEventQueue(object):
+    """
+        DeadEventQueue interface mapped onto loop.call_later.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.handles = {}
+        self.next_eid = 0
+
+    def __len__(self):
+        return len(self.handles)
+
+    def scheduleEvent(self, event):
+        eid = self.next_eid
+        self.next_eid += 1
+        self.handles[eid] = self.loop.call_later(event.delay, self.fire,
+            eid, event)
+        return eid
+
+    def cancelEvent(self, eid):
+        handle = self.handles.pop(eid, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    def fire(self, eid, event):
+        del self.handles[eid]
+        event.execute()
+
+    def elapseTime(self, seconds = None):
+        # Timers are run by the event loop itself
+        pass
+
+    def getTimeout(self):
+        return None
+
+class AsyncioManagedSocket(Protocol):
+    """
+        asyncio protocol standing in for ManagedSocket.
+
+        Put in front of a ManagedSocket subclass, see asyncioSocket(), it
+        maps the protocol callbacks onto onConnect, onRecv and onDisconnect
+        and sends through the transport.
+    """
+
+    def __init__(self, muxer):
+        self.muxer = muxer
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.onConnect()
+
+    def data_received(self, data):
+        self.onRecv(data)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.onDisconnect()
+
+    def fileno(self):
+        return self.transport.get_extra_info('socket').fileno()
+
+    def send(self, data):
+        self.transport.write(data)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+asyncio_sockets = {}
+
+def asyncioSocket(cls):
+    """
+        Returns a variant of the ManagedSocket subclass 'cls' that runs on
+        AsyncioMultiplexer.
+    """
+
+    if cls not in asyncio_sockets:
+        asyncio_sockets[cls] = type('Asyncio' + cls.__name__,
+            (AsyncioManagedSocket, cls), {})
+    return asyncio_sockets[cls]
+
+class AsyncioMultiplexer(object):
+    """
+        SocketMultiplexer interface on top of an asyncio event loop.
+
+        Readers become add_reader callbacks, timers on the event queue
+        become loop.call_later calls, and sockets are asyncio protocols.
+        'factory' is called with the multiplexer as its only argument and
+        should return an AsyncioManagedSocket.
+    """
+
+    def __init__(self, factory, loop = None):
+        if asyncio is None:
+            raise ImportError("asyncio mode requires asyncio or trollius")
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.factory = factory
+        self.eq = AsyncioEventQueue(loop)
+
+    def addReader(self, reader):
+        self.loop.add_reader(reader.fileno(), reader.handleRead)
+
+    def removeReader(self, reader):
+        self.loop.remove_reader(reader.fileno())
+
+    def connect(self, ip, port):
+        sock = self.factory(self)
+        future = ensure_future(self.loop.create_connection(lambda: sock,
+            ip, port), loop = self.loop)
+        future.add_done_callback(lambda f: self.connected(sock, f))
+        return sock
+
+    def connected(self, sock, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.onConnectError(sock, future.exception())
+
+    def onConnectError(self, sock, error):
+        pass
+
+    def runCoroutine(self, coro):
+        """
+            Runs the coroutine 'coro' on the event loop, returns its future.
+        """
+        return ensure_future(coro, loop = self.loop)
+
+    def onSignal(self):
+        pass
+
+    def startMultiplex(self):
+        self.loop.add_signal_handler(signal.SIGWINCH, self.onSignal)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.remove_signal_handler(signal.SIGWINCH)
+
+    def stopMultiplex(self):
+        self.loop.stop()
@@ -0,0 +1,152 @@
+# Deadline event system
+
+import os
+import sys
+from heapq import heappush, heappop, heapify
+
+# CLOCK_MONOTONIC of clock_gettime, which Python 2 does not expose
+CLOCK_MONOTONIC = {'linux': 1, 'darwin': 6, 'freebsd': 4}
+
+try:
+    from time import monotonic
+except ImportError:
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        clock_id = CLOCK_MONOTONIC[sys.platform.rstrip('0123456789')]
+        libc = ctypes.CDLL(ctypes.util.find_library('rt') or
+            ctypes.util.find_library('c'), use_errno = True)
+        clock_gettime = libc.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        def monotonic():
+            """
+                Seconds on a clock that is never adjusted.
+            """
+
+            now = timespec()
+            if clock_gettime(clock_id, ctypes.byref(now)) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error))
+            return now.tv_sec + now.tv_nsec * 1e-9
+
+        monotonic()
+    except (ImportError, KeyError, OSError, AttributeError):
+        # Elapsed real time since an arbitrary point, in clock ticks
+        def monotonic():
+            return os.times()[4]
+
+class DeadEvent(object):
+    """
+        Base class for events.
+
+        'delay' is the amount of seconds that will pass before the event is
+        triggered, at which point execute() is called.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def execute(self):
+        pass
+
+class DeferredCall(DeadEvent):
+    """
+        Event calling func(**kwargs) once it is triggered.
+    """
+
+    def __init__(self, delay, func, **kwargs):
+        DeadEvent.__init__(self, delay)
+        self.func = func
+        self.kwargs = kwargs
+
+    def execute(self):
+        self.func(**self.kwargs)
+
+class DeadEventQueue(object):
+    """
+        Event queue ordered by absolute deadlines on a monotonic clock.
+
+        Events are kept in a binary heap, so scheduling is O(log n).
+        Cancelling is O(1), cancelled events stay in the heap until they
+        reach its top or until they make up half of it.
+    """
+
+    def __init__(self):
+        # Heap of [deadline, eid, event] entries, eids are increasing so
+        # they also keep events with equal deadlines in order.
+        self.heap = []
+        self.events = {}
+        self.next_eid = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def scheduleEvent(self, event):
+        """
+            Schedule 'event' for execution after event.delay seconds,
+            returns the EID of the event.
+        """
+
+        eid = self.next_eid
+        self.next_eid += 1
+        entry = [monotonic() + event.delay, eid, event]
+        self.events[eid] = entry
+        heappush(self.heap, entry)
+        return eid
+
+    def cancelEvent(self, eid):
+        """
+            Cancel the event carrying 'eid'.
+        """
+
+        entry = self.events.pop(eid, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        self.cancelled += 1
+        if self.cancelled > len(self.heap) / 2:
+            self.heap = [e for e in self.heap if e[2] is not None]
+            heapify(self.heap)
+            self.cancelled = 0
+        return True
+
+    def elapseTime(self, seconds = None):
+        """
+            Execute all events of which the deadline has passed.
+
+            Events scheduled while doing so are not executed before the next
+            call, even if their delay is zero, so events can reschedule
+            themselves. 'seconds' is ignored, since deadlines are absolute,
+            and is only accepted for compatibility.
+        """
+
+        now = monotonic()
+        last = self.next_eid
+        heap = self.heap
+        while heap and heap[0][0] <= now and heap[0][1] < last:
+            deadline, eid, event = heappop(heap)
+            if event is None:
+                self.cancelled -= 1
+                continue
+            del self.events[eid]
+            event.execute()
+
+    def getTimeout(self):
+        """
+            Returns the amount of seconds until the next event is due,
+            or None if no events are scheduled.
+        """
+
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heappop(heap)
+            self.cancelled -= 1
+        if not heap:
+            return None
+        return max(heap[0][0] - monotonic(), 0.0)
@@ -1,8 +1,15 @@
 # Deadline ncurses GUI library
 
+import sys
 import curses, curses.ascii
+from bisect import bisect_right
+from collections import deque
 from time import time, localtime
 
+from events import DeferredCall, monotonic
+from search import DeadSearchIndex
+from history import DeadHistory
+
 # The deadline ncurses interface is heavily based on the irssi chat client
 class DeadGUI(object):
     """
@@ -12,30 +19,61 @@ class DeadGUI(object):
     PROMPT_HISTORY_SIZE = 512
     PROMPT_BLOCK_SIZE = 4096
 
+    # Maximum amount of deferred redraws per second
+    RENDER_RATE = 30
+
+    # Bracketed paste mode, pasted text is surrounded by these sequences
+    PASTE_ENABLE, PASTE_DISABLE = '\x1b[?2004h', '\x1b[?2004l'
+    PASTE_START, PASTE_END = '\x1b[200~', '\x1b[201~'
+
     def __init__(self):
         self.visible = False
         self.stdscr = None
+
+        # Render scheduler state, and windows of which the line index is
+        # being rebuilt in the background
+        self.eq = None
+        self.render_pending = False
+        self.render_last = 0
+        self.reflowing = set()
         self.windows = []
         self.command = {}
         self.main_window = self.createWindow("Main")
+        self.main_window.visible = True
         self.current_window = 0
+        self.registerCommand('window', self.windowCall)
 
         self.onNoExecute = None
 
+        # Keys read ahead but not handled yet, the text of a paste in
+        # progress (None if not pasting), and the lines of a multi-line
+        # paste still to be executed.
+        self.keys = deque()
+        self.paste = None
+        self.pasted = deque()
+
         # Setup prompt
         self.prompt = "[Main]"
-        self.string = ""
+        self.buffer = DeadGapBuffer(DeadGUI.PROMPT_BLOCK_SIZE)
         self.position = 0
         self.hposition = 0
         self.view = 0
+        self.hdirty = False
 
-        # History is stored into a tuple
-        # (string, position, view, tmp_history)
-        # tmp_history is either None or a tuple containing another
-        # (string, position, view), which describes a temporary state
-        # of history
+        # History is stored as DeadHistoryEntry records, their edit is
+        # either None or another DeadHistoryEntry, which describes a
+        # temporary state of history
         self.history = []
 
+        # Every executed line, searchable with Ctrl-R
+        self.store = DeadHistory()
+
+        # The query of a reverse incremental search in progress (None if
+        # not searching), the line it found, and the prompt before it.
+        self.isearch = None
+        self.isearch_match = None
+        self.isearch_saved = None
+
         # This list contains the indexes of items that gained a temporary
         # history and therefore need to be set to None again.
         self.tmphistory = []
@@ -59,6 +97,8 @@ class DeadGUI(object):
         self.stdscr.keypad(1)
         self.visible = True
         self.__ncurses_init__()
+        sys.stdout.write(DeadGUI.PASTE_ENABLE)
+        sys.stdout.flush()
         return True
 
     def hide(self):
@@ -67,6 +107,8 @@ class DeadGUI(object):
         """
         if not self.visible:
             return False
+        sys.stdout.write(DeadGUI.PASTE_DISABLE)
+        sys.stdout.flush()
         self.stdscr.keypad(0)
         curses.nocbreak()
         curses.echo()
@@ -78,11 +120,88 @@ class DeadGUI(object):
     def getMainWindow(self):
         return self.main_window
 
-    def createWindow(self, name):
-        win = DeadWindow(name)
+    def getCurrentWindow(self):
+        return self.windows[self.current_window]
+
+    def setCurrentWindow(self, window):
+        """
+            Makes 'window' the window shown on screen.
+        """
+
+        self.getCurrentWindow().visible = False
+        self.current_window = self.windows.index(window)
+        window.visible = True
+        window.activity = ACTIVITY_NONE
+        window.unread = 0
+        self.prompt = "[%s]" % window.name
+        self.promptValidate()
+        if self.visible:
+            self.redrawFromScratch()
+            self.stdscr.refresh()
+
+    def createWindow(self, name, scrollback = None, log = None):
+        win = DeadWindow(name, scrollback, log)
+        win.onActivity = self.activityChanged
         self.windows.append(win)
         return win
 
+    def removeWindow(self, window):
+        """
+            Removes 'window', showing the window before it if it is the
+            current one. The main window can not be removed.
+        """
+
+        if window is self.main_window or window not in self.windows:
+            return False
+        current = self.getCurrentWindow()
+        if window is current:
+            current = self.windows[self.windows.index(window) - 1]
+            self.setCurrentWindow(current)
+        self.windows.remove(window)
+        self.current_window = self.windows.index(current)
+        self.reflowing.discard(window)
+
+        # Window numbers in the activity list have changed
+        current.damage |= DAMAGE_INFO
+        return True
+
+    def switchWindow(self, index):
+        """
+            Switches to window number 'index', counting from zero.
+        """
+
+        if 0 <= index < len(self.windows):
+            self.setCurrentWindow(self.windows[index])
+
+    def windowCall(self, args):
+        """
+            /window <number|name>
+        """
+
+        args = (args or '').strip()
+        if args.isdigit():
+            return self.switchWindow(int(args) - 1)
+        for window in self.windows:
+            if window.name.lower() == args.lower():
+                return self.setCurrentWindow(window)
+        self.getCurrentWindow().addNotice("No window '%s'" % args)
+
+    def activityChanged(self, window):
+        """
+            Called when a hidden window reaches a higher activity level,
+            so the activity list in the infobar needs to be redrawn.
+        """
+        self.getCurrentWindow().damage |= DAMAGE_INFO
+
+    def getActivity(self):
+        """
+            Returns (number, activity) tuples of the hidden windows with
+            unseen messages.
+        """
+
+        return [(i + 1, window.activity)
+            for i, window in enumerate(self.windows) if window.activity]
+
     def __ncurses_init__(self):
         """
             Setup ncurses library.
@@ -90,6 +209,7 @@ class DeadGUI(object):
 
         # Setup input handler
         self.stdscr.nodelay(1)
+        self.stdscr.idlok(1)
         self.special = {
             curses.KEY_RESIZE : self.resizeEvent,
             curses.KEY_BACKSPACE : self.promptBackspace,
@@ -108,6 +228,7 @@ class DeadGUI(object):
             # General control keys
             ord(curses.ascii.ctrl('N')) : self.promptRight,
             ord(curses.ascii.ctrl('P')) : self.promptLeft,
+            ord(curses.ascii.ctrl('R')) : self.promptSearch,
 
             # Backspace variations
             ord(curses.ascii.ctrl('H')) : self.promptBackspace,
@@ -135,34 +256,215 @@ class DeadGUI(object):
         self.stdscr.refresh()
 
     def resizeEvent(self):
+        # Drawn to the terminal by inputEvent
         self.stdscr.clear()
         self.height, self.width = self.stdscr.getmaxyx()
         self.promptValidate()
         self.redrawFromScratch()
-        self.stdscr.refresh()
 
     def redrawFromScratch(self):
         self.stdscr.clear()
         w = self.windows[self.current_window]
         w.setArea(0, 0, self.height - 1, self.width)
+        if w.reflow > w.messages.first:
+            self.scheduleReflow(w)
         w.redrawFromScratch(self)
         self.promptFromScratch()
 
+    def scheduleReflow(self, window):
+        """
+            Finishes rebuilding the line index of 'window' in the
+            background, REFLOW_CHUNK messages per event.
+        """
+
+        if self.eq is None:
+            return window.finishReflow()
+        if window not in self.reflowing:
+            self.reflowing.add(window)
+            self.eq.scheduleEvent(DeferredCall(0, self.reflowEvent,
+                window = window))
+
+    def reflowEvent(self, window):
+        if window.reflowChunk(DeadWindow.REFLOW_CHUNK):
+            self.eq.scheduleEvent(DeferredCall(0, self.reflowEvent,
+                window = window))
+        else:
+            self.reflowing.discard(window)
+
+    def redrawDamaged(self):
+        """
+            Redraws only the damaged parts of the current window, and
+            places the cursor back into the prompt.
+
+            Returns True if anything was drawn.
+        """
+
+        if not self.visible:
+            return False
+        w = self.windows[self.current_window]
+        if not w.redrawDamaged(self):
+            return False
+        self.promptCursor()
+        return True
+
+    def setEventQueue(self, eq):
+        """
+            Sets the event queue used to schedule deferred redraws.
+        """
+        self.eq = eq
+
+    def scheduleRender(self):
+        """
+            Schedules a redraw of all damaged regions.
+
+            All changes made before the redraw happens are coalesced
+            into a single frame, and no more than RENDER_RATE frames are
+            drawn per second. Without an event queue the redraw happens
+            immediately.
+        """
+
+        if self.render_pending:
+            return False
+        if self.eq is None:
+            self.renderFrame()
+            return True
+        due = self.render_last + 1.0 / DeadGUI.RENDER_RATE
+        delay = max(due - monotonic(), 0)
+        self.render_pending = True
+        self.eq.scheduleEvent(DeferredCall(delay, self.renderFrame))
+        return True
+
+    def renderFrame(self):
+        """
+            Draws a frame for the render scheduler.
+        """
+
+        self.render_pending = False
+        self.render_last = monotonic()
+        if self.redrawDamaged():
+            self.stdscr.refresh()
+
     def registerCommand(self, cmdname, func):
         self.command[cmdname] = func
 
+    def readKey(self):
+        if self.keys:
+            return self.keys.popleft()
+        return self.stdscr.getch()
+
     def inputEvent(self):
-        c = self.stdscr.getch()
+        """
+            Handles all keys waiting to be read, and then updates the
+            terminal once. Returns False if there were no keys.
+
+            Runs of ordinary characters are inserted into the prompt as a
+            single block.
+        """
+
+        c = self.readKey()
         if c == -1:
             return False
-        try:
-            self.special[c]()
-        except KeyError:
-            if c < 256:
-                self.promptInput(chr(c))
-        self.stdscr.refresh()
+        text = []
+        while c != -1:
+            handler = self.special.get(c)
+            if self.paste is None and self.isearch is None and \
+                    handler is None and 0 <= c < 256 and c != 27:
+                text.append(chr(c))
+            else:
+                if text:
+                    self.promptInsert(''.join(text))
+                    text = []
+                if self.paste is not None:
+                    self.pasteInput(c)
+                elif self.isearch is not None:
+                    self.searchInput(c, handler)
+                elif c == 27:
+                    self.escapeEvent()
+                elif handler is not None:
+                    handler()
+            c = self.readKey()
+        if text:
+            self.promptInsert(''.join(text))
+        self.stdscr.noutrefresh()
+        curses.doupdate()
         return True
 
+    def escapeEvent(self):
+        """
+            Handles a key sequence starting with escape, which might be
+            Alt and a digit, switching to that window, or the start of a
+            bracketed paste.
+        """
+
+        keys = []
+        for char in DeadGUI.PASTE_START[1:]:
+            c = self.readKey()
+            keys.append(c)
+            if c != ord(char):
+                break
+        else:
+            self.paste = []
+            return
+
+        if len(keys) == 1 and ord('0') <= keys[0] <= ord('9'):
+            # Alt-1 up to Alt-9, and Alt-0 for the tenth window
+            return self.switchWindow((keys[0] - ord('1')) % 10)
+
+        # Not a paste, the keys read ahead are handled as usual
+        self.keys.extend(c for c in keys if c != -1)
+
+    def pasteInput(self, c):
+        """
+            Collects a key of a bracketed paste.
+        """
+
+        if not 0 <= c < 256:
+            return
+        paste = self.paste
+        paste.append(chr(c))
+        if chr(c) == DeadGUI.PASTE_END[-1] and \
+                ''.join(paste[-len(DeadGUI.PASTE_END):]) == DeadGUI.PASTE_END:
+            del paste[-len(DeadGUI.PASTE_END):]
+            self.paste = None
+            self.promptPaste(''.join(paste))
+
+    def promptPaste(self, text):
+        """
+            Inserts pasted text into the prompt. The lines of a multi-line
+            paste are executed one by one, one per event, except for the
+            last, which is left in the prompt.
+        """
+
+        lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        self.promptInsert(lines[0])
+        if len(lines) == 1:
+            return
+        self.promptExecute()
+        if not self.pasted and self.eq is not None:
+            self.eq.scheduleEvent(DeferredCall(0, self.pasteExecute))
+        self.pasted.extend(lines[1:])
+        if self.eq is None:
+            while self.pasted:
+                self.pasteExecute()
+
+    def pasteExecute(self):
+        """
+            Executes the next line of a multi-line paste.
+        """
+
+        if not self.pasted:
+            return
+        self.promptInsert(self.pasted.popleft())
+        if self.pasted:
+            self.promptExecute()
+
+        # Run from the event queue, outside of inputEvent
+        if self.eq is not None:
+            if self.pasted:
+                self.eq.scheduleEvent(DeferredCall(0, self.pasteExecute))
+            if self.visible:
+                self.stdscr.refresh()
+
     # Prompt functionality
     def promptFromScratch(self):
         """
@@ -172,16 +474,22 @@ class DeadGUI(object):
         # Draw prompt message
         self.stdscr.addstr(self.height - 1, 0, self.prompt)
         self.stdscr.addstr(self.height - 1, len(self.prompt) + 1,
-            self.string[self.view:self.view + self.width -
-            len(self.prompt) - 2])
+            self.buffer.slice(self.view, self.view + self.width -
+            len(self.prompt) - 2))
 
         # Fill with spaces if nothing is here
-        if self.position == len(self.string):
+        if self.position == len(self.buffer):
             spacepos = len(self.prompt) + 1 + self.position - self.view
             self.stdscr.addstr(self.height - 1, spacepos, ' ' *
                 (self.width - 1 - spacepos))
 
-        # Place cursor
+        self.promptCursor()
+
+    def promptCursor(self):
+        """
+            Places the cursor at its position in the prompt.
+        """
+
         self.stdscr.move(self.height - 1, len(self.prompt) + 1 + self.position -
             self.view)
 
@@ -191,10 +499,8 @@ class DeadGUI(object):
         """
 
         self.hdirty = True
-        if len(self.string) == DeadGUI.PROMPT_BLOCK_SIZE:
+        if not self.buffer.insert(self.position, x):
             return
-        self.string = self.string[:self.position] + x + \
-            self.string[self.position:]
         self.position += 1;
         if self.promptValidate():
             self.promptFromScratch()
@@ -206,6 +512,21 @@ class DeadGUI(object):
             self.stdscr.move(self.height - 1, len(self.prompt) + 1 +
                 self.position - self.view)
 
+    def promptInsert(self, text):
+        """
+            Input a block of text to the prompt, as much of it as fits,
+            redrawing the prompt only once.
+        """
+
+        if len(text) == 1:
+            return self.promptInput(text)
+        self.hdirty = True
+        count = self.buffer.insert(self.position, text)
+        if count:
+            self.position += count
+            self.promptValidate()
+            self.promptFromScratch()
+
     def promptBackspace(self):
         """
             Execute a backspace movement in the prompt.
@@ -213,8 +534,7 @@ class DeadGUI(object):
 
         self.hdirty = True
         if self.position != 0:
-            self.string = self.string[:self.position - 1] + \
-                self.string[self.position:]
+            self.buffer.delete(self.position - 1, 1)
             self.position -= 1
             if self.promptValidate():
                 self.promptFromScratch()
@@ -242,7 +562,7 @@ class DeadGUI(object):
             Tries to move the prompt cursor to the right.
         """
 
-        if self.position != len(self.string):
+        if self.position != len(self.buffer):
             self.position += 1
             if self.promptValidate():
                 self.promptFromScratch()
@@ -250,18 +570,24 @@ class DeadGUI(object):
                 self.stdscr.move(self.height - 1, len(self.prompt) + 1 +
                     self.position - self.view)
 
+    def promptLoad(self, entry):
+        """
+            Loads the prompt state stored in history entry 'entry'.
+        """
+
+        self.buffer.set(entry.string)
+        self.position = entry.position
+        self.view = entry.view
+
     def readHistory(self):
         """
             Reads current selected history.
         """
 
-        hist = self.history[self.hposition]
-        thist = hist[3]
-        if thist is not None:
-            hist = thist
-        else:
-            hist = hist[:3]
-        self.string, self.position, self.view = hist
+        entry = self.history[self.hposition]
+        if entry.edit is not None:
+            entry = entry.edit
+        self.promptLoad(entry)
         self.hdirty = False
 
     def writeHistory(self):
@@ -270,11 +596,11 @@ class DeadGUI(object):
         """
 
         if self.hdirty:
-            hist = list(self.history[self.hposition])
-            if hist[3] is None:
+            entry = self.history[self.hposition]
+            if entry.edit is None:
                 self.tmphistory.append(self.hposition)
-            hist[3] = (self.string, self.position, self.view)
-            self.history[self.hposition] = tuple(hist)
+            entry.edit = DeadHistoryEntry(str(self.buffer), self.position,
+                self.view)
             self.hdirty = False
 
     def promptUp(self):
@@ -284,10 +610,11 @@ class DeadGUI(object):
 
         if self.hposition > 0:
             if self.hposition == len(self.history):
-                if self.string:
+                if len(self.buffer):
                     self.hdestroy += 1
-                    self.history.append((None, None, None, (self.string,
-                        self.position, self.view)))
+                    self.history.append(DeadHistoryEntry(None, None, None,
+                        DeadHistoryEntry(str(self.buffer), self.position,
+                        self.view)))
                 self.hposition -= 1
                 self.readHistory()
             else:
@@ -302,12 +629,13 @@ class DeadGUI(object):
         """
 
         if self.hposition == len(self.history):
-            if self.string:
+            if len(self.buffer):
                 self.hdestroy += 1
                 self.hposition += 1
-                self.history.append((None, None, None, (self.string,
-                    self.position, self.view)))
-                self.string, self.position, self.view = '', 0, 0
+                self.history.append(DeadHistoryEntry(None, None, None,
+                    DeadHistoryEntry(str(self.buffer), self.position,
+                    self.view)))
+                self.promptClear()
                 self.hdirty = False
                 self.promptFromScratch()
         else:
@@ -316,7 +644,7 @@ class DeadGUI(object):
             if self.hposition != len(self.history):
                 self.readHistory()
             else:
-                self.string, self.position, self.view = '', 0, 0
+                self.promptClear()
             self.promptFromScratch()
 
     # Verify that the prompt is in a displayable state
@@ -331,14 +659,17 @@ class DeadGUI(object):
         # We need the terminal to scroll the text
         # View defines how much our text is scrolled
         if self.position - self.view < 0:
-            self.view = self.view - self.width / 4
+            self.view = min(self.view - self.width / 4, self.position)
             if self.view < 0:
                 self.view = 0
             return True
 
-        # Same but now for to the right
-        if self.position - self.view > self.width - 2 - len(self.prompt):
-            self.view = self.view + self.width / 4
+        # Same but now for to the right, the cursor may have moved more
+        # than a quarter of the width when a block was inserted.
+        limit = self.width - 2 - len(self.prompt)
+        if self.position - self.view > limit:
+            self.view = max(self.view + self.width / 4,
+                self.position - limit)
             if self.view > self.position:
                 self.view = self.position
             return True
@@ -349,26 +680,27 @@ class DeadGUI(object):
             Executes the command typed into the prompt.
         """
 
-        if len(self.string):
-            if self.string[0] == '/' and len(self.string) > 1:
-                s = self.string.find(' ')
+        string = str(self.buffer)
+        if len(string):
+            if string[0] == '/' and len(string) > 1:
+                s = string.find(' ')
                 if s < 0:
-                    cmd = self.string
+                    cmd = string
                     args = None
                 else:
-                    cmd = self.string[:s]
-                    args = self.string[s + 1:].strip()
+                    cmd = string[:s]
+                    args = string[s + 1:].strip()
                 try:
                     self.command[cmd[1:]](args)
                 except KeyError:
-                    self.getMainWindow(). \
+                    self.getCurrentWindow(). \
                         addNotice("Unknown command '%s'" % cmd[1:])
             else:
                 execret = True
                 if self.onNoExecute is not None:
-                    execret = self.onNoExecute(self.string)
+                    execret = self.onNoExecute(string)
                 if execret:
-                    self.getMainWindow().addNotice(self.string)
+                    self.getCurrentWindow().addNotice(string)
 
             # The following to blocks of code reset the prompt history
             # to its after-modification mode.
@@ -376,53 +708,313 @@ class DeadGUI(object):
             # This deletes any added temporal lines by promptDown'ing
             # beyond the prompt history
             if self.hdestroy:
-                self.history = self.history[:-self.hdestroy]
+                del self.history[-self.hdestroy:]
+                self.hdestroy = 0
 
             # This deletes any temporal edit changes made to various
             # history lines.
             for i in self.tmphistory:
-                x = list(self.history[i])
-                x[3] = None
-                self.history[i] = tuple(x)
+                if i < len(self.history):
+                    self.history[i].edit = None
+            self.tmphistory = []
 
             # Store the executed statement in history.
             if len(self.history) == DeadGUI.PROMPT_HISTORY_SIZE:
                 self.history.pop(0)
             self.view = 0
-            self.position = len(self.string)
+            self.position = len(string)
             self.promptValidate()
-            self.history.append((self.string, self.position, self.view, None))
+            self.history.append(DeadHistoryEntry(string, self.position,
+                self.view))
             self.hposition = len(self.history)
+            self.store.append(string)
 
             # Prepare the prompt for a new line.
             self.promptClear()
-            self.redrawFromScratch()
+            self.promptFromScratch()
+            self.redrawDamaged()
+
+    def setHistoryStore(self, store):
+        """
+            Replaces the history store, the history it has on disk is
+            loaded in the background and put in front of the history.
+        """
+
+        for line in self.store.lines:
+            store.append(line)
+        self.store = store
+        store.load(self.historyLoaded)
+
+    def historyLoaded(self, lines):
+        room = DeadGUI.PROMPT_HISTORY_SIZE - len(self.history)
+        if room <= 0 or not lines:
+            return
+        entries = [DeadHistoryEntry(line, 0, 0) for line in lines[-room:]]
+        self.history[:0] = entries
+        self.hposition += len(entries)
+        self.tmphistory = [i + len(entries) for i in self.tmphistory]
+
+    def promptSearch(self):
+        """
+            Starts a reverse incremental search through the history
+            (Ctrl-R), the line found is shown in the prompt as the query
+            is typed.
+        """
+
+        self.isearch = ''
+        self.isearch_match = None
+        self.isearch_saved = (DeadHistoryEntry(str(self.buffer),
+            self.position, self.view), self.prompt)
+        self.searchUpdate()
+
+    def searchInput(self, c, handler):
+        """
+            Handles a key during a reverse incremental search.
+        """
+
+        if handler == self.promptSearch:
+            # Search further back
+            if self.isearch_match is not None:
+                self.searchUpdate(self.isearch_match)
+        elif handler == self.promptBackspace:
+            self.isearch = self.isearch[:-1]
+            self.searchUpdate()
+        elif c in (27, ord(curses.ascii.ctrl('G'))):
+            self.searchEnd()
+            self.promptLoad(self.isearch_saved[0])
+            self.promptFromScratch()
+        elif handler is not None:
+            # Any other key takes the line found and is handled as usual
+            self.searchEnd()
+            handler()
+        elif 32 <= c < 256:
+            self.isearch += chr(c)
+            before = self.isearch_match
+            self.searchUpdate(None if before is None else before + 1)
+
+    def searchUpdate(self, before = None):
+        """
+            Searches for the query before line 'before' and shows the
+            result in the prompt.
+        """
+
+        match = self.store.search(self.isearch, before)
+        if match is not None:
+            self.isearch_match = match
+            line = self.store.lines[match]
+            self.buffer.set(line)
+            self.position = max(line.find(self.isearch), 0)
+            self.prompt = "(search)'%s'" % self.isearch
+        else:
+            self.prompt = "(failed search)'%s'" % self.isearch
+        self.hdirty = True
+        self.view = 0
+        self.promptValidate()
+        self.stdscr.move(self.height - 1, 0)
+        self.stdscr.clrtoeol()
+        self.promptFromScratch()
+
+    def searchEnd(self):
+        """
+            Leaves search mode, keeping the line found in the prompt.
+        """
+
+        self.isearch = None
+        self.prompt = self.isearch_saved[1]
+        self.view = 0
+        self.promptValidate()
+        self.stdscr.move(self.height - 1, 0)
+        self.stdscr.clrtoeol()
+        self.promptFromScratch()
 
     def promptClear(self):
         """
             Clear the contents of the prompt.
         """
 
-        self.string = ""
+        self.buffer.set('')
         self.position = 0
         self.view = 0
 
     def scrollUp(self):
         amount = max((self.height - 3) / 2, 1)
         self.windows[self.current_window].scrollMessageArea(-amount)
-        self.redrawFromScratch()
+        self.redrawDamaged()
 
     def scrollDown(self):
         amount = max((self.height - 3) / 2, 1)
         self.windows[self.current_window].scrollMessageArea(amount)
-        self.redrawFromScratch()
+        self.redrawDamaged()
 
 
 TITLE_MODE_CENTERED, TITLE_MODE_LEFT, TITLE_MODE_RIGHT = range(3)
 
+# Activity levels of hidden windows
+ACTIVITY_NONE, ACTIVITY_TEXT, ACTIVITY_MESSAGE = range(3)
+
+# Window damage flags
+DAMAGE_TITLE, DAMAGE_MESSAGES, DAMAGE_INFO = 1, 2, 4
+DAMAGE_ALL = DAMAGE_TITLE | DAMAGE_MESSAGES | DAMAGE_INFO
+
+class DeadGapBuffer(object):
+    """
+        Gap buffer holding the text of the prompt.
+
+        The text is kept in a fixed capacity bytearray with a gap at the
+        last edit position, so typing or deleting at the cursor costs O(1)
+        and inserting a block of text O(length of the block), instead of
+        copying the whole text for every character.
+    """
+
+    __slots__ = ('data', 'gap', 'gap_end')
+
+    def __init__(self, capacity, text = ''):
+        self.data = bytearray(capacity)
+        self.gap = 0
+        self.gap_end = capacity
+        self.insert(0, text)
+
+    def __len__(self):
+        return len(self.data) - self.gap_end + self.gap
+
+    def __str__(self):
+        return str(self.data[:self.gap] + self.data[self.gap_end:])
+
+    def moveGap(self, pos):
+        gap, gap_end = self.gap, self.gap_end
+        if pos < gap:
+            self.data[gap_end - gap + pos:gap_end] = self.data[pos:gap]
+        elif pos > gap:
+            self.data[gap:pos] = self.data[gap_end:gap_end + pos - gap]
+        self.gap, self.gap_end = pos, gap_end + pos - gap
+
+    def insert(self, pos, text):
+        """
+            Inserts as much of 'text' at 'pos' as fits, returns the amount
+            of characters inserted.
+        """
+
+        count = min(len(text), self.gap_end - self.gap)
+        if count:
+            self.moveGap(pos)
+            self.data[self.gap:self.gap + count] = text[:count]
+            self.gap += count
+        return count
+
+    def delete(self, pos, count):
+        self.moveGap(pos)
+        self.gap_end = min(self.gap_end + count, len(self.data))
+
+    def set(self, text):
+        self.gap = 0
+        self.gap_end = len(self.data)
+        self.insert(0, text)
+
+    def slice(self, start, end):
+        """
+            Returns the text from 'start' up to 'end'.
+        """
+
+        end = min(end, len(self))
+        if end <= start:
+            return ''
+        gap, size = self.gap, self.gap_end - self.gap
+        if end <= gap:
+            return str(self.data[start:end])
+        if start >= gap:
+            return str(self.data[start + size:end + size])
+        return str(self.data[start:gap] + self.data[gap + size:end + size])
+
+class DeadHistoryEntry(object):
+    """
+        A line of prompt history.
+    """
+
+    __slots__ = ('string', 'position', 'view', 'edit')
+
+    def __init__(self, string, position, view, edit = None):
+        self.string = string
+        self.position = position
+        self.view = view
+        self.edit = edit
+
+class DeadRing(object):
+    """
+        Fixed capacity ring buffer.
+
+        Items are addressed by an absolute sequence number, which stays
+        valid until the item is evicted. Appending to a full ring evicts the
+        oldest item in O(1).
+    """
+
+    __slots__ = ('capacity', 'items', 'origin', 'first', 'end')
+
+    def __init__(self, capacity, first = 0):
+        self.capacity = capacity
+        self.items = []
+        self.origin = first
+        self.first = first
+        self.end = first
+
+    def __len__(self):
+        return self.end - self.first
+
+    def __iter__(self):
+        for seq in xrange(self.first, self.end):
+            yield self.items[(seq - self.origin) % self.capacity]
+
+    def __getitem__(self, seq):
+        if seq < self.first or seq >= self.end:
+            raise IndexError("sequence %d is not in the ring" % seq)
+        return self.items[(seq - self.origin) % self.capacity]
+
+    def __setitem__(self, seq, item):
+        if seq < self.first or seq >= self.end:
+            raise IndexError("sequence %d is not in the ring" % seq)
+        self.items[(seq - self.origin) % self.capacity] = item
+
+    def append(self, item):
+        """
+            Append 'item' to the ring, returns the evicted item if the ring
+            was full, None otherwise.
+        """
+
+        evicted = None
+        if self.end - self.first == self.capacity:
+            evicted = self[self.first]
+            self.first += 1
+
+        # The storage list grows lazily up until the capacity is reached
+        i = (self.end - self.origin) % self.capacity
+        if i == len(self.items):
+            self.items.append(item)
+        else:
+            self.items[i] = item
+        self.end += 1
+        return evicted
+
 class DeadWindow(object):
-    def __init__(self, name = "IHaveNoName"):
-        self.messages = []
+
+    SCROLLBACK_SIZE = 10000
+
+    # Maximum amount of messages paged in from the log
+    PAGE_CACHE_SIZE = 1024
+
+    # Amount of messages added to the line index per event while it is
+    # rebuilt in the background
+    REFLOW_CHUNK = 2000
+
+    def __init__(self, name = "IHaveNoName", scrollback = None, log = None):
+        if scrollback is None:
+            scrollback = DeadWindow.SCROLLBACK_SIZE
+
+        # Messages are numbered like the DeadLog they are written to, older
+        # messages are paged in from the log when scrolled to.
+        self.log = log
+        self.paged = {}
+        first = len(log) if log is not None else 0
+        self.messages = DeadRing(scrollback, first)
+        self.search = DeadSearchIndex(first)
         self.title = ""
         self.title_mode = TITLE_MODE_LEFT
         self.x, self.y, self.width, self.height = (0,) * 4
@@ -430,6 +1022,36 @@ class DeadWindow(object):
         self.scroll = None
         self.more = False
 
+        # Parts of the window that need to be redrawn, and the amount of
+        # lines appended to the bottom of the message area since it was
+        # last drawn.
+        self.damage = DAMAGE_ALL
+        self.appended = 0
+        self.clock = None
+
+        # Round-trip latency shown in the infobar, None if unknown
+        self.lag = None
+
+        # Whether the window is shown on screen. Hidden windows are not
+        # drawn, they count their unseen messages and report a rising
+        # activity level to onActivity(window) instead.
+        self.visible = False
+        self.activity = ACTIVITY_NONE
+        self.unread = 0
+        self.onActivity = None
+
+        # Cumulative line index for lines_width, lines[msg] contains the
+        # line number on which self.messages[msg] starts, lines_end being the
+        # line number following the last message. Line numbers are absolute,
+        # so the first line number might not be zero.
+        self.lines = DeadRing(scrollback, first)
+        self.lines_end = 0
+        self.lines_width = None
+
+        # While the line index is being rebuilt, only messages from
+        # 'reflow' on are in it.
+        self.reflow = first
+
     def addNotice(self, notice):
         self.addMessage(DeadMessage(DM_NOTICE, notice))
 
@@ -439,28 +1061,217 @@ class DeadWindow(object):
     def addOutgoing(self, outgoing):
         self.addMessage(DeadMessage(DM_OUTGOING, outgoing))
 
+    def addChat(self, nick, text):
+        self.addMessage(DeadMessage(DM_CHAT, "<%s> %s" % (nick, text)))
+
     def addMessage(self, message):
-        if len(self.messages) == 256:
-            self.messages.pop(0)
-        self.messages.append(message)
+        if self.log is not None:
+            self.log.append(message.timestamp, message.type, message.content)
+        seq = self.messages.end
+        evicted = self.messages.append(message)
+
+        # Only messages in memory are indexed, older logged messages are
+        # scanned by searches instead.
+        self.search.add(seq, message.content)
+        if evicted is not None:
+            self.search.remove(seq - self.messages.capacity, evicted.content)
+        if self.lines_width is not None:
+            h = message.getRenderSpec(self.lines_width)
+            self.lines.append(self.lines_end)
+            self.lines_end += h
+            if self.scroll is None and self.visible:
+                self.appended += h
+        if not self.visible:
+            self.unread += 1
+            activity = ACTIVITY_MESSAGE if message.type == DM_CHAT \
+                else ACTIVITY_TEXT
+            if activity > self.activity:
+                self.activity = activity
+                if self.onActivity is not None:
+                    self.onActivity(self)
         if self.scroll is not None:
-            self.more = True
+            # Scrolled past the oldest message, which just got evicted
+            if self.scroll[0] < self.messages.first and self.log is None:
+                self.scroll = (self.messages.first, 0)
+                self.damage |= DAMAGE_MESSAGES
+            if not self.more:
+                self.more = True
+                self.damage |= DAMAGE_INFO
 
     def setArea(self, y, x, height, width):
+        if (y, x, height, width) != (self.y, self.x, self.height, self.width):
+            self.damage = DAMAGE_ALL
         self.y, self.x = y, x
         self.height, self.width = height, width
+        self.updateLineIndex()
         self.scrollMessageArea(0)
 
+    def updateLineIndex(self):
+        """
+            Starts rebuilding the cumulative line index if the width of
+            the window has changed since it was last built.
+
+            The index is built backwards from the newest message, so only
+            the messages from the top of the message area on are indexed
+            right away. The rest is left to reflowChunk, until then the
+            window behaves as if older messages do not exist.
+        """
+
+        if self.lines_width == self.width:
+            return False
+        messages = self.messages
+        lines = DeadRing(messages.capacity, messages.first)
+        for seq in xrange(messages.first, messages.end):
+            lines.append(None)
+        self.lines = lines
+        self.lines_width = self.width
+        self.reflow = messages.end
+
+        # Index the messages on screen
+        top = messages.end
+        if self.scroll is not None:
+            top = max(self.scroll[0], messages.first)
+        area = self.height - 2
+        while self.reflow > top or (self.reflow > messages.first and
+                self.getLineCount() < area):
+            self.reflowChunk(1)
+        return True
+
+    def reflowChunk(self, count):
+        """
+            Adds up to 'count' more messages to the line index being
+            rebuilt, returns True if there are messages left.
+        """
+
+        messages, lines = self.messages, self.lines
+        width = self.lines_width
+        seq = max(self.reflow, messages.first)
+        stop = max(seq - count, messages.first)
+        start = lines[seq] if seq < messages.end else self.lines_end
+        while seq > stop:
+            seq -= 1
+            start -= messages[seq].getRenderSpec(width)
+            lines[seq] = start
+        self.reflow = seq
+        return seq > messages.first
+
+    def finishReflow(self):
+        while self.reflowChunk(DeadWindow.REFLOW_CHUNK):
+            pass
+
+    def getFirstLine(self):
+        """
+            Returns the oldest message that is in the line index.
+        """
+        return max(self.messages.first, self.reflow)
+
+    def getLineCount(self):
+        """
+            Returns the total amount of lines all messages take up.
+        """
+
+        first = self.getFirstLine()
+        if first == self.messages.end:
+            return 0
+        return self.lines_end - self.lines[first]
+
+    def findLine(self, line):
+        """
+            Returns a (msg, line) tuple describing which message and which
+            line within that message are displayed at line number 'line'.
+        """
+
+        first, end = self.getFirstLine(), self.messages.end
+        line += self.lines[first]
+        msg = min(bisect_right(self.lines, line, first, end), end) - 1
+        return msg, line - self.lines[msg]
+
+    def getMessage(self, seq):
+        """
+            Returns message 'seq', paging it in from the log if it is no
+            longer in memory.
+        """
+
+        if seq >= self.messages.first:
+            return self.messages[seq]
+        message = self.paged.get(seq)
+        if message is None:
+            if len(self.paged) >= DeadWindow.PAGE_CACHE_SIZE:
+                self.paged.clear()
+            timestamp, type, content = self.log.get(seq)
+            message = DeadMessage(type, content)
+            message.timestamp = timestamp
+            self.paged[seq] = message
+        return message
+
+    def inHistory(self):
+        """
+            Returns whether the window is scrolled past the messages in
+            memory, into those paged in from the log.
+        """
+        return self.scroll is not None and self.scroll[0] < self.messages.first
+
+    def getTopLine(self):
+        """
+            Returns the line number displayed at the top of the message area.
+        """
+
+        if self.scroll is None:
+            return max(self.getLineCount() - (self.height - 2), 0)
+        msg, line = self.scroll
+
+        # This is necessary since the width of the window might've been
+        # changed since the scroll state was computed
+        line = min(line, self.messages[msg].getRenderSpec(self.width))
+        return self.lines[msg] - self.lines[self.getFirstLine()] + line
+
     def setTitle(self, title):
         self.title = title
+        self.damage |= DAMAGE_TITLE
 
     def setTitleAlignment(self, alignment):
         self.title_mode = alignment
+        self.damage |= DAMAGE_TITLE
+
+    def setLag(self, lag):
+        self.lag = lag
+        self.damage |= DAMAGE_INFO
 
     def redrawFromScratch(self, gui):
         self.drawTitle(gui)
         self.drawMessageArea(gui)
         self.drawInfo(gui)
+        self.damage = 0
+        self.appended = 0
+
+    def redrawDamaged(self, gui):
+        """
+            Redraws the damaged parts of this window only.
+
+            Lines appended to the bottom of the message area are scrolled
+            in, instead of redrawing the entire message area.
+            Returns True if anything was drawn.
+        """
+
+        # Keep the clock in the infobar up to date
+        if localtime().tm_min != self.clock:
+            self.damage |= DAMAGE_INFO
+
+        damage, appended = self.damage, self.appended
+        if not damage and not appended:
+            return False
+        if damage & DAMAGE_TITLE:
+            self.drawTitle(gui)
+        if damage & DAMAGE_MESSAGES:
+            self.clearMessageArea(gui)
+            self.drawMessageArea(gui)
+        elif appended:
+            self.drawAppended(gui)
+        if damage & DAMAGE_INFO:
+            self.drawInfo(gui)
+        self.damage = 0
+        self.appended = 0
+        return True
 
     def drawTitle(self, gui):
         # Title bar
@@ -475,105 +1286,134 @@ class DeadWindow(object):
         gui.stdscr.addstr(self.y, self.x, str, gui.infobarcolour)
 
     def drawMessageArea(self, gui):
-        if self.scroll is None:
-            h = 0
-            msg = len(self.messages) 
-            while h < self.height - 2:
-
-                msg -= 1
-                if msg == -1:
-                    msg = 0
-                    h = self.height - 2
-                    break
+        if self.inHistory():
+            msg, line = self.scroll
+            line = min(line, self.getMessage(msg).getRenderSpec(self.width) - 1)
+            return self.drawMessages(gui, msg, line, self.y + 1,
+                self.height - 2)
+        return self.drawLines(gui, self.getTopLine(), self.y + 1,
+            self.height - 2)
 
-                h += self.messages[msg].getRenderSpec(self.width)
+    def drawLines(self, gui, line, y, count):
+        """
+            Renders 'count' lines of the message area starting at
+            line number 'line' onto row 'y'.
+        """
 
-            line = h - (self.height - 2)
-        else:
-            msg, line = self.scroll
+        if not self.messages or count <= 0:
+            return True
+        msg, line = self.findLine(line)
+        return self.drawMessages(gui, msg, line, y, count)
 
-        y = self.y + 1
-        for message in self.messages[msg:]:
-            h = min(message.getRenderSpec(self.width) - line,
-                self.height - y - 1)
+    def drawMessages(self, gui, msg, line, y, count):
+        """
+            Renders 'count' lines of the message area starting at
+            line 'line' of message 'msg' onto row 'y'.
+        """
+
+        for msg in xrange(msg, self.messages.end):
+            message = self.getMessage(msg)
+            h = min(message.getRenderSpec(self.width) - line, count)
             message.render(gui, y, self.x, h, self.width, line)
             line = 0
             y += h
-            if y >= self.height - 1:
+            count -= h
+            if count <= 0:
                 break
 
         return True
 
-    def scrollMessageArea(self, amount):
-        # Unconditionally fetch message position
-        if self.scroll is None:
-            if amount >= 0:
-                return True
-
-            # Fill the window in 'reverse' to figure out the top message
-            # and line
-            h = 0
-            msg = len(self.messages) - 1 
-            while h < self.height - 2:
-
-                # The window is not yet completely filled
-                # scrolling is meaningless
-                if msg == -1:
-                    return True
+    def drawAppended(self, gui):
+        """
+            Scrolls the lines appended since the last draw into the
+            message area, leaving the other lines untouched.
+        """
 
-                h += self.messages[msg].getRenderSpec(self.width)
-                msg -= 1
+        area = self.height - 2
+        total = self.getLineCount()
+        old = total - self.appended
+        top = max(total - area, 0)
+        shift = top - max(old - area, 0)
+        if shift >= area:
+            self.clearMessageArea(gui)
+            return self.drawMessageArea(gui)
+
+        if shift > 0:
+            gui.stdscr.setscrreg(self.y + 1, self.y + area)
+            gui.stdscr.scrollok(1)
+            gui.stdscr.scroll(shift)
+            gui.stdscr.scrollok(0)
+            gui.stdscr.setscrreg(0, gui.height - 1)
+
+        # Appended lines scrolled past the top are not drawn
+        first = max(old, top)
+        return self.drawLines(gui, first, self.y + 1 + first - top,
+            total - first)
+
+    def clearMessageArea(self, gui):
+        for y in xrange(self.y + 1, self.y + self.height - 1):
+            gui.stdscr.move(y, self.x)
+            gui.stdscr.clrtoeol()
 
-            line = h - (self.height - 2)
-        else:
+    def scrollMessageArea(self, amount):
+        if self.scroll is None and amount >= 0:
+            return True
+        if self.inHistory():
             msg, line = self.scroll
+            return self.scrollHistory(msg, line, amount)
+        line = self.getTopLine() + amount
+        if line < 0 and self.messages.first > 0 and self.log is not None \
+                and self.reflow <= self.messages.first:
+            return self.scrollHistory(self.messages.first, 0, line)
+        return self.scrollToLine(line)
+
+    def scrollHistory(self, msg, line, amount):
+        """
+            Scrolls 'amount' lines away from line 'line' of message 'msg',
+            where the logged messages involved are paged in one by one,
+            so the line numbers of the log never have to be computed.
+        """
 
-        # This is necessary since the width of the window might've been
-        # changed since last time this function was called
-        h = self.messages[msg].getRenderSpec(self.width)
-        line = min(line, h)
-
-        # Scroll down
-        if amount > 0:
-            # Allign to message border
-            amount -= h - line
+        line += amount
+        while line < 0 and msg > 0:
+            msg -= 1
+            line += self.getMessage(msg).getRenderSpec(self.width)
+        line = max(line, 0)
+        while msg < self.messages.first:
+            h = self.getMessage(msg).getRenderSpec(self.width)
+            if line < h:
+                break
+            line -= h
             msg += 1
-            line = 0
-            while amount > 0 and msg < len(self.messages):
-                amount -= self.messages[msg].getRenderSpec(self.width)
-                msg += 1
-
-        # Scroll up
-        if amount < 0:
-            # Allign to message border
-            amount += line
-            line = 0
-            while amount < 0 and msg > 0:
-                msg -= 1
-                amount += self.messages[msg].getRenderSpec(self.width)
-
-        # Hit the top
-        if amount < 0:
-            self.scroll = (0, 0)
-            return True
-
-        # Hit the bottom
-        if msg == len(self.messages):
-            self.scroll = None
-            return True
+        else:
+            # Back at the messages in memory
+            if not self.messages:
+                return self.scrollToLine(0)
+            self.finishReflow()
+            return self.scrollToLine(self.lines[msg] -
+                self.lines[self.messages.first] + line)
+
+        scroll = (msg, line)
+        if scroll != self.scroll:
+            self.scroll = scroll
+            self.damage |= DAMAGE_MESSAGES | DAMAGE_INFO
+        return True
 
-        # Scroll within current top message
-        self.scroll = (msg, amount)
+    def scrollToLine(self, line):
+        """
+            Scrolls the message area so 'line' is displayed at the top.
+        """
 
-        # Fill window and test for incomplete fills
-        h = self.messages[msg].getRenderSpec(self.width) - amount
-        msg += 1
-        while msg < len(self.messages):
-            h += self.messages[msg].getRenderSpec(self.width)
-            msg += 1
-        if h <= self.height - 2:
-            self.scroll = None
+        line = max(line, 0)
 
+        # Stick to the bottom when the window can be filled completely
+        if self.getLineCount() - line <= self.height - 2:
+            scroll = None
+        else:
+            scroll = self.findLine(line)
+        if scroll != self.scroll:
+            self.scroll = scroll
+            self.damage |= DAMAGE_MESSAGES | DAMAGE_INFO
         return True
 
     def drawInfo(self, gui):
@@ -586,6 +1426,7 @@ class DeadWindow(object):
 
         # Clock
         clock = localtime()
+        self.clock = clock.tm_min
         clockstr = "%(hour)02d:%(min)02d" % \
             {"hour" : clock.tm_hour, "min" : clock.tm_min}
         gui.stdscr.addch(self.y + self.height - 1, self.x + 1,
@@ -595,9 +1436,47 @@ class DeadWindow(object):
         gui.stdscr.addch(self.y + self.height - 1, self.x + 7,
             ']', gui.infohookcolour)
 
+        # Lag
+        x = 8
+        if self.lag is not None:
+            lagstr = "Lag %.2f" % self.lag
+            gui.stdscr.addstr(self.y + self.height - 1, self.x + x,
+                ' ', gui.infobarcolour)
+            gui.stdscr.addch(self.y + self.height - 1, self.x + x + 1,
+                '[', gui.infohookcolour)
+            gui.stdscr.addstr(self.y + self.height - 1, self.x + x + 2,
+                lagstr, gui.infobarcolour)
+            gui.stdscr.addch(self.y + self.height - 1,
+                self.x + x + 2 + len(lagstr), ']', gui.infohookcolour)
+            x += 3 + len(lagstr)
+
+        # Activity of hidden windows, windows with messages in bold
+        activity = gui.getActivity()
+        if activity:
+            gui.stdscr.addstr(self.y + self.height - 1, self.x + x,
+                ' ', gui.infobarcolour)
+            gui.stdscr.addch(self.y + self.height - 1, self.x + x + 1,
+                '[', gui.infohookcolour)
+            gui.stdscr.addstr(self.y + self.height - 1, self.x + x + 2,
+                'Act: ', gui.infobarcolour)
+            x += 7
+            for i, (number, level) in enumerate(activity):
+                numstr = str(number) + (',' if i + 1 < len(activity) else '')
+                if x + len(numstr) + 12 > self.width:
+                    break
+                colour = gui.infobarcolour
+                if level == ACTIVITY_MESSAGE:
+                    colour |= curses.A_BOLD
+                gui.stdscr.addstr(self.y + self.height - 1, self.x + x,
+                    numstr, colour)
+                x += len(numstr)
+            gui.stdscr.addch(self.y + self.height - 1, self.x + x,
+                ']', gui.infohookcolour)
+            x += 1
+
         # Infobar
-        gui.stdscr.addstr(self.y + self.height - 1, self.x + 8,
-            ' ' * (self.width - 8), gui.infobarcolour)
+        gui.stdscr.addstr(self.y + self.height - 1, self.x + x,
+            ' ' * (self.width - x), gui.infobarcolour)
 
         if self.more:
             gui.stdscr.addstr(self.y + self.height - 1, self.width - 11,
@@ -606,11 +1485,21 @@ class DeadWindow(object):
 DM_RAW, DM_NOTICE, DM_CHAT, DM_INCOMING, DM_OUTGOING = range(5)
 
 class DeadMessage(object):
+
+    # Messages are kept around in large amounts, so keep them compact
+    __slots__ = ('timestamp', 'type', 'content', 'wrap_width', 'wrap')
+
+    prefix_length = 9
+
     def __init__(self, type = DM_RAW, content = "Your code is bugged ;-)"):
         self.timestamp = time()
         self.type = type
         self.content = content
-        self.prefix_length = 9
+
+        # Wrapped line cache, a flat tuple of (start, end, indent) triples
+        # describing every rendered line for wrap_width.
+        self.wrap_width = None
+        self.wrap = None
 
     def breakString(self, text, width):
         """
@@ -623,55 +1512,104 @@ class DeadMessage(object):
             to be displayed and the remainder.
         """
 
-        if width > len(text):
-            return text, ""
+        end, rest = self.breakOffsets(text, 0, width)
+        return text[:end], text[rest:]
+
+    def breakOffsets(self, text, start, width):
+        """
+            Offset based version of breakString, this does not copy
+            any part of 'text'.
+
+            Breaks text[start:] for the given width and returns a tuple
+            containing the end offset of the displayed part and the
+            start offset of the remainder. At least one character is
+            displayed, however narrow 'width' is.
+        """
+
+        width = max(width, 1)
+        length = len(text)
+        if width > length - start:
+            return length, length
 
         # Find last space
-        i = width - 1
-        while i >= 0 and text[i] != ' ':
-            i -= 1
-        if i == -1:
-            return text[:width], text[width:].lstrip()
-        rest = text[i + 1:]
-        breakpoint = i
-
-        # Throw away trailing spaces
-        i -= 1
-        while i >= 0 and text[i] == ' ':
-            i -= 1
-        if i == -1:
-            broken = text[:breakpoint]
+        i = text.rfind(' ', start, start + width)
+        if i < 0:
+            end = rest = start + width
         else:
-            broken = text[:i + 1]
-        return broken, rest.lstrip()
+            rest = i + 1
+
+            # Throw away trailing spaces
+            end = i
+            while end > start and text[end - 1] == ' ':
+                end -= 1
+            if end == start:
+                end = i
+
+        # Strip leading whitespace from the remainder
+        while rest < length and text[rest].isspace():
+            rest += 1
+        return end, rest
+
+    def getWrap(self, width):
+        """
+            Returns the wrapped lines of this message for the given width
+            as a flat tuple of (start, end, indent) triples.
+
+            The result is cached, it is only recomputed when the width
+            changes.
+        """
+
+        if self.wrap_width == width:
+            return self.wrap
+
+        text = self.content
+        length = len(text)
+        end, rest = self.breakOffsets(text, 0, width - self.prefix_length)
+        wrap = [0, end, self.prefix_length]
+        while rest < length:
+            start = rest
+            if end == rest:
+                end, rest = self.breakOffsets(text, start, width)
+                wrap.extend((start, end, 0))
+            else:
+                end, rest = self.breakOffsets(text, start,
+                    width - self.prefix_length)
+                wrap.extend((start, end, self.prefix_length))
+
+        self.wrap_width = width
+        self.wrap = tuple(wrap)
+        return self.wrap
 
     def getRenderSpec(self, width):
         """
             Compute how many lines of text this message will take
             for the given width.
+
+            Unless the wrapped lines are cached for this width, the lines
+            are only counted, so reflowing many messages does not build
+            and cache the wrapped lines of every one of them.
         """
-        lines = 1
-        prebreak = self.content
-        broken, rest = self.breakString(prebreak,
-            width - self.prefix_length)
-        while len(rest):
-            lines += 1
-            if len(broken) + len(rest) == len(prebreak):
-                prebreak = rest
-                broken, rest = self.breakString(prebreak, width)
+
+        if self.wrap_width == width:
+            return len(self.wrap) / 3
+        text = self.content
+        length = len(text)
+        end, rest = self.breakOffsets(text, 0, width - self.prefix_length)
+        count = 1
+        while rest < length:
+            if end == rest:
+                end, rest = self.breakOffsets(text, rest, width)
             else:
-                prebreak = rest
-                broken, rest = self.breakString(
-                    prebreak, width - self.prefix_length)
-        return lines
+                end, rest = self.breakOffsets(text, rest,
+                    width - self.prefix_length)
+            count += 1
+        return count
 
     def render(self, gui, y, x, height, width, startline):
         """
             Render a message object to the GUI.
         """
-        prebreak = self.content
-        broken, rest = self.breakString(prebreak,
-            width - self.prefix_length)
+        text = self.content
         if startline == 0:
             clock = localtime(self.timestamp)
             clockstr = "%(hour)02d:%(min)02d" % \
@@ -685,23 +1623,9 @@ class DeadMessage(object):
                 gui.stdscr.addstr(y, x + 6, '<< ', gui.outgoingcolour)
             else:
                 gui.stdscr.addstr(y, x + 6, '** ')
-            gui.stdscr.addstr(y, x + self.prefix_length, broken)
+        wrap = self.getWrap(width)
+        end = min(startline + height, len(wrap) / 3)
+        for i in xrange(startline * 3, end * 3, 3):
+            gui.stdscr.addstr(y, x + wrap[i + 2], text[wrap[i]:wrap[i + 1]])
             y += 1
-        lines = 1
-        while len(rest):
-            if len(broken) + len(rest) == len(prebreak):
-                prebreak = rest
-                broken, rest = self.breakString(prebreak, width)
-                if lines >= startline and lines < startline + height:
-                    gui.stdscr.addstr(y, x, broken)
-                    y += 1
-            else:
-                prebreak = rest
-                broken, rest = self.breakString(
-                    prebreak, width - self.prefix_length)
-                if lines >= startline and lines < startline + height:
-                    gui.stdscr.addstr(y, x + self.prefix_length, broken)
-                    y += 1
-            lines += 1
         return True
-
@@ -0,0 +1,160 @@
+# Deadline persistent prompt history
+
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+from events import DeferredCall
+
+class DeadHistory(object):
+    """
+        Prompt history store.
+
+        Every executed line is appended to the file at 'path', in batches
+        written every FLUSH_INTERVAL seconds from the event queue. At
+        startup the file is read LOAD_CHUNK lines per event, so a large
+        history does not delay the GUI. Without a path lines are only
+        kept in memory.
+
+        Lines are indexed by every three character substring they
+        contain, so a substring search only has to check the lines
+        containing the rarest trigram of the query.
+    """
+
+    FLUSH_INTERVAL = 1.0
+    LOAD_CHUNK = 1000
+
+    def __init__(self, path = None, eq = None):
+        self.path = path
+        self.eq = eq
+        self.lines = []
+
+        # Trigram -> ascending array of line numbers
+        self.trigrams = {}
+
+        # Lines not yet written to the file, and those executed while the
+        # file was still being read.
+        self.pending = []
+        self.flush_eid = None
+        self.early = []
+        self.loading = None
+        self.loaded = path is None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def load(self, callback = None):
+        """
+            Starts reading the history file, calls callback(lines) with
+            the lines read when done.
+        """
+
+        if self.loaded:
+            if callback is not None:
+                callback([])
+            return
+        try:
+            self.loading = open(self.path, 'r')
+        except IOError:
+            self.loading = None
+        self.loadChunk(callback)
+
+    def loadChunk(self, callback):
+        while self.loading is not None:
+            count = 0
+            for line in islice(self.loading, DeadHistory.LOAD_CHUNK):
+                self.index(line.rstrip('\n'))
+                count += 1
+            if count < DeadHistory.LOAD_CHUNK:
+                self.loading.close()
+                self.loading = None
+            elif self.eq is not None:
+                self.eq.scheduleEvent(DeferredCall(0, self.loadChunk,
+                    callback = callback))
+                return
+
+        self.loaded = True
+        lines = list(self.lines)
+        for line in self.early:
+            self.index(line)
+        self.early = []
+        if self.pending:
+            self.scheduleFlush()
+        if callback is not None:
+            callback(lines)
+
+    def index(self, line):
+        id = len(self.lines)
+        self.lines.append(line)
+        trigrams = self.trigrams
+        for trigram in set(line[i:i + 3] for i in xrange(len(line) - 2)):
+            posting = trigrams.get(trigram)
+            if posting is None:
+                trigrams[trigram] = array('i', (id,))
+            else:
+                posting.append(id)
+
+    def append(self, line):
+        line = line.replace('\n', ' ')
+        if self.loaded:
+            self.index(line)
+        else:
+            self.early.append(line)
+        if self.path is None:
+            return
+        self.pending.append(line)
+
+        # Lines are only written once the file has been read, otherwise
+        # they would be read back as well.
+        if self.loaded:
+            self.scheduleFlush()
+
+    def scheduleFlush(self):
+        if self.flush_eid is None:
+            if self.eq is None:
+                return self.flush()
+            self.flush_eid = self.eq.scheduleEvent(
+                DeferredCall(DeadHistory.FLUSH_INTERVAL, self.flush))
+
+    def flush(self):
+        self.flush_eid = None
+        if not self.pending:
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(''.join(line + '\n' for line in self.pending))
+        except IOError:
+            pass
+        self.pending = []
+
+    def close(self):
+        if self.flush_eid is not None:
+            self.eq.cancelEvent(self.flush_eid)
+        self.flush()
+
+    def search(self, query, before = None):
+        """
+            Returns the number of the most recent line before line 'before'
+            containing 'query', or None if there is none.
+        """
+
+        if before is None:
+            before = len(self.lines)
+        lines = self.lines
+        if len(query) < 3:
+            for id in xrange(min(before, len(lines)) - 1, -1, -1):
+                if query in lines[id]:
+                    return id
+            return None
+
+        rarest = None
+        for i in xrange(len(query) - 2):
+            posting = self.trigrams.get(query[i:i + 3])
+            if posting is None:
+                return None
+            if rarest is None or len(posting) < len(rarest):
+                rarest = posting
+        for i in xrange(bisect_left(rarest, before) - 1, -1, -1):
+            if query in lines[rarest[i]]:
+                return rarest[i]
+        return None
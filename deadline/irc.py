@@ -2,37 +2,548 @@
 import socket
 import errno
 
-from mulsoc import ManagedSocket, DeferredCall
+from collections import deque
+
+from mulsoc import ManagedSocket
+from events import DeferredCall, monotonic
+from state import YeOldeIRCState
+from aio import asyncio
+
+class IRCMessage(object):
+    """
+        A single parsed IRC message.
+
+        'tags' is a dict of IRCv3 message tags or None, 'prefix' the
+        message source or None, 'command' the upper cased command or
+        numeric, and 'params' a list of parameters, the trailing
+        parameter included.
+    """
+
+    __slots__ = ('tags', 'prefix', 'command', 'params')
+
+    def __init__(self, command, params = None, prefix = None, tags = None):
+        self.tags = tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params if params is not None else []
+
+    def getNick(self):
+        """
+            Returns the nick part of the prefix.
+        """
+
+        if self.prefix is None:
+            return None
+        i = self.prefix.find('!')
+        if i < 0:
+            return self.prefix
+        return self.prefix[:i]
+
+    def __repr__(self):
+        return "IRCMessage(%r, %r, %r, %r)" % \
+            (self.command, self.params, self.prefix, self.tags)
+
+TAG_ESCAPES = {':' : ';', 's' : ' ', '\\' : '\\', 'r' : '\r', 'n' : '\n'}
+
+def unescapeTag(value):
+    """
+        Unescapes an IRCv3 message tag value.
+    """
+
+    if '\\' not in value:
+        return value
+    out = []
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c == '\\':
+            i += 1
+            if i < len(value):
+                out.append(TAG_ESCAPES.get(value[i], value[i]))
+        else:
+            out.append(c)
+        i += 1
+    return ''.join(out)
+
+def parseTags(tagstr):
+    """
+        Parses the tag section of a message, without its leading '@'.
+    """
+
+    tags = {}
+    for tag in tagstr.split(';'):
+        if not tag:
+            continue
+        i = tag.find('=')
+        if i < 0:
+            tags[tag] = ''
+        else:
+            tags[tag[:i]] = unescapeTag(tag[i + 1:])
+    return tags
+
+def parseMessage(line):
+    """
+        Parses a single IRC line into an IRCMessage.
+
+        The line is cut up with partition and split, which run in C,
+        rather than walked character by character. Returns None if the
+        line does not contain a command.
+    """
+
+    tags = None
+    prefix = None
+
+    # IRCv3 message tags
+    if line[:1] == '@':
+        tagstr, sep, line = line.partition(' ')
+        if not sep:
+            return None
+        tags = parseTags(tagstr[1:])
+        line = line.lstrip(' ')
+
+    # Message source
+    if line[:1] == ':':
+        prefix, sep, line = line.partition(' ')
+        if not sep:
+            return None
+        prefix = prefix[1:]
+        line = line.lstrip(' ')
+
+    # Command and parameters, the trailing parameter starts at the first
+    # ' :', the line starts with the command so that follows it.
+    i = line.find(' :')
+    if i < 0:
+        params = line.split()
+    else:
+        params = line[:i].split()
+        params.append(line[i + 2:])
+    if not params or line[:1] == ' ':
+        return None
+    command = params.pop(0)
+
+    return IRCMessage(command.upper(), params, prefix, tags)
+
+class YeOldeLineBuffer(object):
+    """
+        Splits a stream of received data into lines.
+
+        Data is collected into a bytearray with a read offset, so complete
+        lines are sliced out without copying the remainder of the buffer.
+        Lines can be terminated by either CRLF or a bare LF. Lines longer
+        than maxlength are discarded, so the buffer can not grow without
+        bounds.
+    """
+
+    # RFC 1459 allows 512 bytes per line, IRCv3 message tags
+    # add another 8191 bytes to that.
+    MAX_LINE_LENGTH = 8703
+
+    def __init__(self, maxlength = None):
+        if maxlength is None:
+            maxlength = YeOldeLineBuffer.MAX_LINE_LENGTH
+        self.maxlength = maxlength
+        self.buffer = bytearray()
+        self.offset = 0
+        self.discarding = False
+        self.overflows = 0
+
+    def feed(self, data):
+        """
+            Append received data to the buffer.
+        """
+
+        # Compact, this only moves the (partial) lines not read yet
+        if self.offset:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += data
+
+    def readLine(self):
+        """
+            Returns the next complete line, or None if there is none.
+        """
+
+        buf = self.buffer
+        while True:
+            start = self.offset
+            i = buf.find('\n', start)
+            if i < 0:
+                # Throw away the partial line if it is already too long,
+                # and skip the rest of it when it arrives.
+                if len(buf) - start > self.maxlength:
+                    self.overflows += 1
+                    self.discarding = True
+                    self.offset = len(buf)
+                return None
+            self.offset = i + 1
+
+            if self.discarding:
+                self.discarding = False
+                continue
+            if i > start and buf[i - 1] == 13:
+                i -= 1
+            if i - start > self.maxlength:
+                self.overflows += 1
+                continue
+            return str(buf[start:i])
+
+    def __iter__(self):
+        line = self.readLine()
+        while line is not None:
+            yield line
+            line = self.readLine()
+
+# Send queue priority lanes, lower lanes are sent first
+SEND_URGENT, SEND_NORMAL, SEND_BULK = range(3)
+
+SEND_PRIORITIES = {
+    'PING' : SEND_URGENT,
+    'PONG' : SEND_URGENT,
+    'QUIT' : SEND_URGENT,
+    'PRIVMSG' : SEND_BULK,
+    'NOTICE' : SEND_BULK
+}
+
+class YeOldeSendQueue(object):
+    """
+        Outbound line queue paced by a token bucket.
+
+        Every line sent costs a token, tokens are refilled at 'rate' per
+        second up to 'burst'. Lines are queued in priority lanes, and the
+        urgent lane may always be sent, even when the bucket is empty, so
+        keepalives and quits are never held back by bulk traffic. The
+        bucket never goes below empty though, so a burst of urgent lines
+        does not stall other traffic for longer than a single token takes.
+    """
+
+    # Most servers allow a burst of about 5 lines, followed by one line
+    # every 2 seconds.
+    RATE = 0.5
+    BURST = 5.0
+
+    def __init__(self, rate = None, burst = None):
+        self.rate = rate if rate is not None else YeOldeSendQueue.RATE
+        self.burst = burst if burst is not None else YeOldeSendQueue.BURST
+        self.tokens = self.burst
+        self.stamp = monotonic()
+        self.lanes = [deque() for lane in xrange(SEND_BULK + 1)]
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def push(self, item, priority = SEND_NORMAL):
+        self.lanes[priority].append(item)
+
+    def refill(self, now):
+        self.tokens = min(self.tokens + (now - self.stamp) * self.rate,
+            self.burst)
+        self.stamp = now
+
+    def pop(self, now):
+        """
+            Returns the next item that may be sent now, or None.
+        """
+
+        self.refill(now)
+        for priority, lane in enumerate(self.lanes):
+            if lane and (self.tokens >= 1.0 or priority == SEND_URGENT):
+                self.tokens = max(self.tokens - 1.0, 0.0)
+                return lane.popleft()
+        return None
+
+    def delay(self, now):
+        """
+            Returns the amount of seconds until the next token is available.
+        """
+
+        self.refill(now)
+        return max((1.0 - self.tokens) / self.rate, 0.0)
+
+    def clear(self):
+        for lane in self.lanes:
+            lane.clear()
+
+CHANNEL_PREFIXES = '#&+!'
+
+def reason(params):
+    """
+        Formats the optional reason of a PART or KICK.
+    """
+    return " (%s)" % params[-1] if params and params[-1] else ""
 
-# Currently IPv4 only
 class YeOldeIRCClient(ManagedSocket):
+
+    # Seconds between client initiated lag probes
+    LAG_INTERVAL = 30.0
+
+    # Whether PING/PONG traffic is shown in the GUI
+    LOG_KEEPALIVE = False
+
+    # Channels joined after registration
+    CHANNELS = ('#deadline',)
+
+    # Name of the network this client is connected to, and the
+    # DeadRuleSet applied to its messages, assigned by the application.
+    network = None
+    rules = None
+
     def onConnect(self):
-        self.muxer.eq.scheduleEvent(DeferredCall(2.5, self.sendOpening))
-        self.muxer.msock = self
-        self.stream = ''
+        self.lines = YeOldeLineBuffer()
+        self.dispatch = self.buildDispatch()
+
+        # Channels and users, kept up to date by every message
+        self.state = YeOldeIRCState()
+
+        # Outbound flood control
+        self.sendq = YeOldeSendQueue()
+        self.sendq_eid = None
+
+        # Lag probe state
+        self.lag = None
+        self.lag_eid = None
+        self.lag_token = None
+        self.lag_sent = None
+
+        if not self.muxer.clientConnected(self):
+            return
+        self.sendOpening()
+
+    def buildDispatch(self):
+        """
+            Builds the command dispatch table from the handler methods
+            of this client, these are named 'on' followed by the upper
+            case command or numeric, e.g. onPRIVMSG or on001.
+        """
+
+        dispatch = {}
+        for name in dir(self):
+            command = name[2:]
+            if name.startswith('on') and \
+                    (command.isupper() or command.isdigit()):
+                dispatch[command] = getattr(self, name)
+        return dispatch
+
+    def registerHandler(self, command, handler):
+        """
+            Registers 'handler' for messages carrying 'command',
+            replacing any existing handler for it.
+        """
+        self.dispatch[command.upper()] = handler
 
     def sendOpening(self):
         self.sendRaw('USER deadline * 8: Deadline IRC')
         self.sendRaw('NICK hoi')
-        self.muxer.eq.scheduleEvent(DeferredCall(3.0, self.sendJoin,
-            channel = '#deadline'))
 
-    def sendRaw(self, cmd):
-        self.send(cmd + '\r\n')
-        self.muxer.debugSendRaw(cmd)
+    def sendRaw(self, cmd, log = True, priority = None):
+        """
+            Queues a raw line for sending, if no priority is given
+            it is derived from the command.
+        """
+
+        if priority is None:
+            priority = SEND_PRIORITIES.get(cmd.split(' ', 1)[0].upper(),
+                SEND_NORMAL)
+        self.sendq.push((cmd, log), priority)
+
+        # Urgent lines do not wait for the scheduled flush
+        if priority == SEND_URGENT and self.sendq_eid is not None:
+            self.muxer.eq.cancelEvent(self.sendq_eid)
+            self.sendq_eid = None
+        if self.sendq_eid is None:
+            self.flushSendQueue()
+
+    def flushSendQueue(self):
+        """
+            Sends as many queued lines as the token bucket allows, and
+            schedules itself for the remaining lines.
+        """
+
+        self.sendq_eid = None
+        now = monotonic()
+        item = self.sendq.pop(now)
+        while item is not None:
+            cmd, log = item
+            self.send(cmd + '\r\n')
+            if log:
+                self.muxer.debugSendRaw(self, cmd)
+            item = self.sendq.pop(now)
+        if self.sendq:
+            self.sendq_eid = self.muxer.eq.scheduleEvent(
+                DeferredCall(self.sendq.delay(now), self.flushSendQueue))
 
     def onRecv(self, data):
-        self.stream += data
-        i = self.stream.find('\r\n')
-        while i > -1:
-            cmd = self.stream[:i]
-            self.stream = self.stream[i + 2:]
+        self.lines.feed(data)
+        for cmd in self.lines:
             self.onRecvRaw(cmd)
-            i = self.stream.find('\r\n')
 
     def onRecvRaw(self, cmd):
-        self.muxer.debugRecvRaw(cmd)
+        # Answer server keepalives without parsing or logging them
+        if cmd.startswith('PING ') and not self.LOG_KEEPALIVE:
+            self.sendRaw('PONG ' + cmd[5:], False)
+            return
+
+        msg = parseMessage(cmd)
+        if msg is None:
+            self.muxer.debugRecvRaw(self, cmd)
+            return
+        if self.LOG_KEEPALIVE or msg.command not in ('PING', 'PONG'):
+            self.muxer.debugRecvRaw(self, cmd)
+        self.onMessage(msg)
+
+    def onMessage(self, msg):
+        """
+            Dispatches a parsed message to its command handler, after
+            updating the network state with it.
+        """
+
+        self.state.update(msg)
+        handler = self.dispatch.get(msg.command)
+        if handler is None:
+            return
+
+        # Handlers may be coroutines when running on an asyncio loop
+        result = handler(msg)
+        if asyncio is not None and asyncio.iscoroutine(result) and \
+                hasattr(self.muxer, 'runCoroutine'):
+            self.muxer.runCoroutine(result)
 
     def sendJoin(self, channel):
         self.sendRaw('JOIN :%s' % channel)
 
+    def sendMessage(self, target, text):
+        self.sendRaw('PRIVMSG %s :%s' % (target, text))
+
+    def onDisconnect(self):
+        if self.lag_eid is not None:
+            self.muxer.eq.cancelEvent(self.lag_eid)
+            self.lag_eid = None
+        if self.sendq_eid is not None:
+            self.muxer.eq.cancelEvent(self.sendq_eid)
+            self.sendq_eid = None
+        self.sendq.clear()
+        self.muxer.onClientDisconnect(self)
+
+    def on001(self, msg):
+        # Registered, join our channels and start measuring lag
+        for channel in self.CHANNELS:
+            self.sendJoin(channel)
+        self.sendLagProbe()
+
+    def onPING(self, msg):
+        if msg.params:
+            self.sendRaw('PONG :%s' % msg.params[-1], self.LOG_KEEPALIVE)
+        else:
+            self.sendRaw('PONG', self.LOG_KEEPALIVE)
+
+    def onPONG(self, msg):
+        if self.lag_token is not None and msg.params and \
+                msg.params[-1] == self.lag_token:
+            self.lag_token = None
+            self.setLag(monotonic() - self.lag_sent)
+
+    def onNICK(self, msg):
+        if self.rules is not None:
+            self.rules.access.forgetUser(msg.getNick())
+
+    def onQUIT(self, msg):
+        if self.rules is not None:
+            self.rules.access.forgetUser(msg.getNick())
+
+    def onJOIN(self, msg):
+        if msg.params and self.state.isMe(msg.getNick() or ''):
+            self.muxer.clientJoined(self, msg.params[0])
+
+    def onPART(self, msg):
+        if msg.params:
+            for channel in msg.params[0].split(','):
+                self.muxer.clientEvent(self, channel, "%s has left %s%s" %
+                    (msg.getNick(), channel, reason(msg.params[1:])))
+
+    def onKICK(self, msg):
+        if len(msg.params) >= 2:
+            self.muxer.clientEvent(self, msg.params[0],
+                "%s was kicked by %s%s" % (msg.params[1], msg.getNick(),
+                reason(msg.params[2:])))
+
+    def onTOPIC(self, msg):
+        if len(msg.params) >= 2:
+            self.muxer.clientEvent(self, msg.params[0],
+                "%s changed the topic to: %s" % (msg.getNick(),
+                msg.params[-1]))
+
+    def onNOTICE(self, msg):
+        # Notices to users stay in the network window
+        if len(msg.params) >= 2 and msg.params[0][:1] in CHANNEL_PREFIXES:
+            self.muxer.clientEvent(self, msg.params[0],
+                "-%s- %s" % (msg.getNick(), msg.params[-1]))
+
+    def onPRIVMSG(self, msg):
+        if len(msg.params) < 2:
+            return
+        target, text = msg.params[0], msg.params[-1]
+        nick = msg.getNick()
+        if target[:1] in CHANNEL_PREFIXES:
+            channel = reply = target
+        else:
+            channel, reply = None, nick
+
+        # Channel messages go to the window of the channel, private ones
+        # to that of the sender
+        self.muxer.clientMessage(self, reply, nick, text)
+
+        if self.rules is None:
+            return
+        for trigger, arg in self.rules.match(channel, nick, text,
+                msg.prefix):
+            self.runRule(trigger.rule, reply, nick, channel, arg)
+
+    def runRule(self, rule, reply, *args):
+        """
+            Runs a rule, sending whatever it returns to 'reply'.
+        """
+
+        callback = lambda result, error: \
+            self.onRuleResult(result, error, reply)
+        if not rule.run(self.muxer.pool, callback, *args):
+            self.muxer.clientNotice(self, "Rule dropped, worker pool is full")
+
+    def onRuleResult(self, result, error, reply):
+        """
+            Sends the result of a rule, being either a single line or a list
+            of lines, to 'reply'.
+        """
+
+        if error is not None:
+            self.muxer.clientNotice(self, "Rule failed: %r" % error)
+            return
+        if result is None:
+            return
+        if isinstance(result, basestring):
+            result = (result,)
+        for line in result:
+            self.sendMessage(reply, line)
+            self.muxer.clientMessage(self, reply, self.state.nick, line)
+
+    def sendLagProbe(self):
+        """
+            Sends a PING to the server to measure the round-trip latency,
+            and schedules the next probe.
+        """
+
+        now = monotonic()
+
+        # The previous probe is still unanswered, so the lag is at least
+        # the time since it was sent.
+        if self.lag_token is not None:
+            self.setLag(now - self.lag_sent)
+        else:
+            self.lag_sent = now
+            self.lag_token = 'LAG%d' % int(now * 1000)
+            self.sendRaw('PING :%s' % self.lag_token, self.LOG_KEEPALIVE)
+        self.lag_eid = self.muxer.eq.scheduleEvent(
+            DeferredCall(self.LAG_INTERVAL, self.sendLagProbe))
+
+    def setLag(self, lag):
+        self.lag = lag
+        self.muxer.updateLag(self, lag)
+
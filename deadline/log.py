@@ -0,0 +1,296 @@
+# Deadline scrollback logs
+
+import os
+import mmap
+import struct
+from Queue import Queue
+from threading import Thread, Lock
+
+from events import DeferredCall
+from wakeup import DeadWakeup
+
+# Index record: data offset, data length, timestamp and message type
+RECORD = struct.Struct('<QIdB3x')
+
+class DeadLog(object):
+    """
+        Append-only on-disk message log.
+
+        Message contents are appended to 'path'.log, and a fixed-size
+        record per message to 'path'.idx, so message 'seq' is found at
+        offset seq * RECORD.size of the index without reading anything
+        else. Old messages are read through mmap, leaving it to the
+        operating system which parts of the log are in memory.
+
+        Appended messages are buffered and written, then fsynced, every
+        FLUSH_INTERVAL seconds from the event queue. With a DeadLogWriter
+        this is done in its thread, so a slow disk does not block the
+        multiplexer, otherwise flushes happen in the multiplexer loop.
+    """
+
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(self, path, eq = None, writer = None):
+        self.path = path
+        self.eq = eq
+        self.writer = writer
+        self.data = open(path + '.log', 'ab+')
+        self.index = open(path + '.idx', 'ab+')
+
+        # Drop records written partially, or without their data, in case
+        # we were killed while flushing.
+        self.data_size = os.fstat(self.data.fileno()).st_size
+        count = os.fstat(self.index.fileno()).st_size / RECORD.size
+        while count:
+            self.index.seek((count - 1) * RECORD.size)
+            offset, length, _, _ = RECORD.unpack(self.index.read(RECORD.size))
+            if offset + length <= self.data_size:
+                break
+            count -= 1
+        self.index.truncate(count * RECORD.size)
+        self.count = count
+
+        # Messages not yet written, as (timestamp, type, content) tuples,
+        # and the batch handed to the writer, which holds 'lock' while
+        # writing.
+        self.pending = []
+        self.writing = None
+        self.lock = Lock()
+        self.flush_eid = None
+
+        # Read only maps of the first 'mapped' records and their data
+        self.index_map = None
+        self.data_map = None
+        self.mapped = 0
+        self.closed = False
+
+    def __len__(self):
+        writing = len(self.writing.entries) if self.writing else 0
+        return self.count + writing + len(self.pending)
+
+    def append(self, timestamp, type, content):
+        """
+            Appends a message, returns its sequence number.
+        """
+
+        self.pending.append((timestamp, type, content))
+        self.scheduleFlush()
+        return len(self) - 1
+
+    def scheduleFlush(self):
+        if self.flush_eid is None and self.eq is not None:
+            self.flush_eid = self.eq.scheduleEvent(
+                DeferredCall(DeadLog.FLUSH_INTERVAL, self.flushEvent))
+
+    def flushEvent(self):
+        """
+            Hands the pending messages to the writer, or flushes them
+            right away without one.
+        """
+
+        self.flush_eid = None
+        if self.writer is None:
+            return self.flush()
+
+        # The next batch is handed over once this one is written
+        if self.writing is None and self.pending:
+            self.writing = self.createBatch()
+            self.writer.write(self, self.writing)
+
+    def get(self, seq):
+        """
+            Returns message 'seq' as a (timestamp, type, content) tuple.
+        """
+
+        if self.closed:
+            raise ValueError("log %s is closed" % self.path)
+        if seq < 0 or seq >= len(self):
+            raise IndexError("sequence %d is not in the log" % seq)
+        if seq >= self.count:
+            seq -= self.count
+            if self.writing is not None:
+                if seq < len(self.writing.entries):
+                    return self.writing.entries[seq]
+                seq -= len(self.writing.entries)
+            return self.pending[seq]
+        if seq >= self.mapped:
+            self.remap()
+        offset, length, timestamp, type = \
+            RECORD.unpack_from(self.index_map, seq * RECORD.size)
+        return timestamp, type, self.data_map[offset:offset + length]
+
+    def remap(self):
+        self.unmap()
+        self.index_map = mmap.mmap(self.index.fileno(),
+            self.count * RECORD.size, access = mmap.ACCESS_READ)
+        if self.data_size:
+            self.data_map = mmap.mmap(self.data.fileno(), self.data_size,
+                access = mmap.ACCESS_READ)
+        else:
+            self.data_map = ''
+        self.mapped = self.count
+
+    def unmap(self):
+        if self.index_map is not None:
+            self.index_map.close()
+        if self.data_map:
+            self.data_map.close()
+        self.index_map = self.data_map = None
+        self.mapped = 0
+
+    def createBatch(self):
+        """
+            Takes the pending messages, to be written after the data
+            already on disk.
+        """
+
+        offset = self.data_size
+        records = []
+        chunks = []
+        for timestamp, type, content in self.pending:
+            records.append(RECORD.pack(offset, len(content), timestamp, type))
+            chunks.append(content)
+            offset += len(content)
+        batch = DeadLogBatch(self.pending, ''.join(chunks), ''.join(records),
+            offset)
+        self.pending = []
+        return batch
+
+    def writeBatch(self, batch):
+        """
+            Writes and syncs 'batch', data first, so the index never refers
+            to data that is not on disk. Called from the writer thread,
+            errors are kept in the batch.
+        """
+
+        with self.lock:
+            if not batch.done:
+                self.writeLocked(batch)
+
+    def writeLocked(self, batch):
+        batch.done = True
+        try:
+            self.data.write(batch.data)
+            self.data.flush()
+            os.fsync(self.data.fileno())
+            self.index.write(batch.records)
+            self.index.flush()
+            os.fsync(self.index.fileno())
+        except (IOError, OSError) as e:
+            batch.error = e
+
+    def written(self, batch):
+        """
+            Makes the messages of a batch written by the writer available
+            from disk.
+        """
+
+        if batch is not self.writing:
+            return
+        self.writing = None
+        self.applyBatch(batch)
+        if self.pending:
+            self.scheduleFlush()
+
+    def applyBatch(self, batch):
+        if batch.error is None:
+            self.count += len(batch.entries)
+            self.data_size = batch.end
+            return
+
+        # Drop whatever part was written, the messages are kept pending
+        # and are written again by the next flush.
+        self.data.truncate(self.data_size)
+        self.index.truncate(self.count * RECORD.size)
+        self.pending[:0] = batch.entries
+
+    def flush(self):
+        """
+            Writes and syncs all pending messages from the calling thread,
+            after waiting for the batch being written by the writer.
+        """
+
+        self.flush_eid = None
+        with self.lock:
+            batch = self.writing
+            if batch is not None:
+                self.writing = None
+                if not batch.done:
+                    self.writeLocked(batch)
+                self.applyBatch(batch)
+                if batch.error is not None:
+                    raise batch.error
+            if not self.pending:
+                return
+            batch = self.createBatch()
+            self.writeLocked(batch)
+            self.applyBatch(batch)
+            if batch.error is not None:
+                raise batch.error
+
+    def close(self):
+        if self.closed:
+            return
+        if self.flush_eid is not None:
+            self.eq.cancelEvent(self.flush_eid)
+            self.flush_eid = None
+        self.flush()
+        self.unmap()
+        self.data.close()
+        self.index.close()
+        self.closed = True
+
+class DeadLogBatch(object):
+    """
+        Messages written to a DeadLog in one go, with their data and index
+        records.
+    """
+
+    __slots__ = ('entries', 'data', 'records', 'end', 'done', 'error')
+
+    def __init__(self, entries, data, records, end):
+        self.entries = entries
+        self.data = data
+        self.records = records
+        self.end = end
+        self.done = False
+        self.error = None
+
+class DeadLogWriter(object):
+    """
+        Writes DeadLog batches in a thread of its own, since syncing them
+        to disk can take long. Completions are delivered from within the
+        multiplexer loop.
+    """
+
+    def __init__(self, muxer):
+        self.wakeup = DeadWakeup()
+        muxer.addReader(self.wakeup)
+        self.queue = Queue()
+        self.worker = Thread(target = self.work, name = "log-writer")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def write(self, log, batch):
+        self.queue.put((log, batch))
+
+    def work(self):
+        """
+            Writer thread main loop.
+        """
+
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            log, batch = job
+            log.writeBatch(batch)
+            self.wakeup.post(log.written, batch)
+
+    def close(self):
+        """
+            Stops the writer thread, close all logs first.
+        """
+
+        self.queue.put(None)
+        self.worker.join()
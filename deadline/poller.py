@@ -0,0 +1,438 @@
+# Deadline I/O readiness backends
+
+import os
+import select
+import signal
+import socket
+import errno
+from abc import ABCMeta, abstractmethod
+from math import ceil
+
+from events import DeadEventQueue
+
+POLL_READ, POLL_WRITE = 1, 2
+
+def milliseconds(timeout):
+    """
+        Converts 'timeout' to whole milliseconds, rounding up so short
+        timeouts do not turn into busy polling.
+    """
+    return int(ceil(timeout * 1000))
+
+class DeadPoller(object):
+    """
+        Base class of the readiness backends.
+
+        Interest is registered per file descriptor and only changes when
+        update() is called with a different event mask, so nothing needs
+        to be rebuilt between calls to poll().
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self.interest = {}
+
+    def __len__(self):
+        return len(self.interest)
+
+    def update(self, fd, events):
+        """
+            Sets the events of interest for 'fd', an empty mask removes it.
+            Does nothing if the interest did not change.
+        """
+
+        current = self.interest.get(fd, 0)
+        if events == current:
+            return False
+        if not events:
+            del self.interest[fd]
+            self.unregister(fd)
+        elif not current:
+            self.interest[fd] = events
+            self.register(fd, events)
+        else:
+            self.interest[fd] = events
+            self.modify(fd, events)
+        return True
+
+    @abstractmethod
+    def register(self, fd, events):
+        """
+            Starts watching 'fd', which is not registered yet.
+        """
+
+    @abstractmethod
+    def modify(self, fd, events):
+        """
+            Changes the events of interest of a registered 'fd'.
+        """
+
+    @abstractmethod
+    def unregister(self, fd):
+        """
+            Stops watching a registered 'fd'.
+        """
+
+    @abstractmethod
+    def poll(self, timeout = None):
+        """
+            Waits at most 'timeout' seconds, or forever if it is None, and
+            returns a list of (fd, events) tuples of ready descriptors.
+            Errors and hang-ups are reported as both readable and writable,
+            so the owner of the descriptor notices them.
+        """
+
+    def close(self):
+        pass
+
+class DeadSelectPoller(DeadPoller):
+    """
+        select() backend, limited to FD_SETSIZE descriptors.
+    """
+
+    def __init__(self):
+        DeadPoller.__init__(self)
+        self.readers = set()
+        self.writers = set()
+
+    def register(self, fd, events):
+        if events & POLL_READ:
+            self.readers.add(fd)
+        if events & POLL_WRITE:
+            self.writers.add(fd)
+
+    def modify(self, fd, events):
+        self.unregister(fd)
+        self.register(fd, events)
+
+    def unregister(self, fd):
+        self.readers.discard(fd)
+        self.writers.discard(fd)
+
+    def poll(self, timeout = None):
+        try:
+            r, w, x = select.select(self.readers, self.writers, (), timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        ready = dict.fromkeys(r, POLL_READ)
+        for fd in w:
+            ready[fd] = ready.get(fd, 0) | POLL_WRITE
+        return ready.items()
+
+class DeadPollPoller(DeadPoller):
+    """
+        poll() backend.
+    """
+
+    ERROR = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+    def __init__(self):
+        DeadPoller.__init__(self)
+        self.poller = select.poll()
+
+    def mask(self, events):
+        mask = 0
+        if events & POLL_READ:
+            mask |= select.POLLIN | select.POLLPRI
+        if events & POLL_WRITE:
+            mask |= select.POLLOUT
+        return mask
+
+    def register(self, fd, events):
+        self.poller.register(fd, self.mask(events))
+
+    def modify(self, fd, events):
+        self.poller.modify(fd, self.mask(events))
+
+    def unregister(self, fd):
+        self.poller.unregister(fd)
+
+    def poll(self, timeout = None):
+        if timeout is not None:
+            timeout = milliseconds(timeout)
+        try:
+            result = self.poller.poll(timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        ready = []
+        for fd, mask in result:
+            events = 0
+            if mask & (select.POLLIN | select.POLLPRI | self.ERROR):
+                events |= POLL_READ
+            if mask & (select.POLLOUT | self.ERROR):
+                events |= POLL_WRITE
+            ready.append((fd, events & self.interest.get(fd, 0)))
+        return ready
+
+class DeadEpollPoller(DeadPoller):
+    """
+        Linux epoll() backend, scales with the amount of ready descriptors
+        instead of the amount of registered ones.
+    """
+
+    def __init__(self):
+        DeadPoller.__init__(self)
+        self.poller = select.epoll()
+
+    def mask(self, events):
+        mask = 0
+        if events & POLL_READ:
+            mask |= select.EPOLLIN | select.EPOLLPRI
+        if events & POLL_WRITE:
+            mask |= select.EPOLLOUT
+        return mask
+
+    def register(self, fd, events):
+        self.poller.register(fd, self.mask(events))
+
+    def modify(self, fd, events):
+        self.poller.modify(fd, self.mask(events))
+
+    def unregister(self, fd):
+        self.poller.unregister(fd)
+
+    def poll(self, timeout = None):
+        if timeout is None:
+            timeout = -1
+        else:
+            # epoll truncates to milliseconds itself, pass it half a
+            # millisecond extra so it ends up at the rounded up amount.
+            timeout = (milliseconds(timeout) + 0.5) / 1000
+        try:
+            result = self.poller.poll(timeout)
+        except IOError as e:
+            if e.errno == errno.EINTR:
+                return []
+            raise
+        ready = []
+        error = select.EPOLLERR | select.EPOLLHUP
+        for fd, mask in result:
+            events = 0
+            if mask & (select.EPOLLIN | select.EPOLLPRI | error):
+                events |= POLL_READ
+            if mask & (select.EPOLLOUT | error):
+                events |= POLL_WRITE
+            ready.append((fd, events & self.interest.get(fd, 0)))
+        return ready
+
+    def close(self):
+        self.poller.close()
+
+POLLERS = {
+    'select' : DeadSelectPoller,
+    'poll' : DeadPollPoller,
+    'epoll' : DeadEpollPoller
+}
+
+def createPoller(name = None):
+    """
+        Creates the readiness backend called 'name', or the best one
+        available on this platform: epoll, then poll, then select.
+    """
+
+    if name is not None:
+        return POLLERS[name]()
+    if hasattr(select, 'epoll'):
+        return DeadEpollPoller()
+    if hasattr(select, 'poll'):
+        return DeadPollPoller()
+    return DeadSelectPoller()
+
+class PolledManagedSocket(object):
+    """
+        Non-blocking TCP socket standing in for ManagedSocket.
+
+        Put in front of a ManagedSocket subclass, see polledSocket(), it
+        calls onConnect, onRecv and onDisconnect from DeadMultiplexer.
+        Outgoing data is buffered, write interest is only registered while
+        the buffer is not empty.
+    """
+
+    RECV_SIZE = 4096
+
+    def __init__(self, muxer):
+        self.muxer = muxer
+        self.sock = None
+        self.connected = False
+        self.outgoing = bytearray()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def open(self, ip, port):
+        """
+            Starts connecting to 'ip', an IPv4 or IPv6 address.
+        """
+
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        error = self.sock.connect_ex((ip, port))
+        if error not in (0, errno.EINPROGRESS):
+            self.sock.close()
+            self.sock = None
+            raise socket.error(error, os.strerror(error))
+
+        # Writable once connected
+        self.muxer.setInterest(self, POLL_WRITE)
+
+    def send(self, data):
+        self.outgoing += data
+        if self.connected:
+            self.muxer.setInterest(self, POLL_READ | POLL_WRITE)
+
+    def handleRead(self):
+        try:
+            data = self.sock.recv(PolledManagedSocket.RECV_SIZE)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            data = ''
+        if not data:
+            return self.close()
+        self.onRecv(data)
+
+    def handleWrite(self):
+        if not self.connected:
+            return self.handleConnect()
+        try:
+            sent = self.sock.send(self.outgoing)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            return self.close()
+        del self.outgoing[:sent]
+        if not self.outgoing:
+            self.muxer.setInterest(self, POLL_READ)
+
+    def handleConnect(self):
+        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.muxer.setInterest(self, 0)
+            self.sock.close()
+            self.sock = None
+            self.muxer.onConnectError(self,
+                socket.error(error, os.strerror(error)))
+            return
+        self.connected = True
+        self.muxer.setInterest(self, POLL_READ)
+        self.onConnect()
+        if self.outgoing and self.sock is not None:
+            self.muxer.setInterest(self, POLL_READ | POLL_WRITE)
+
+    def close(self):
+        if self.sock is None:
+            return
+        self.muxer.setInterest(self, 0)
+        self.sock.close()
+        self.sock = None
+        self.outgoing = bytearray()
+        if self.connected:
+            self.connected = False
+            self.onDisconnect()
+
+polled_sockets = {}
+
+def polledSocket(cls):
+    """
+        Returns a variant of the ManagedSocket subclass 'cls' that runs on
+        DeadMultiplexer.
+    """
+
+    if cls not in polled_sockets:
+        polled_sockets[cls] = type('Polled' + cls.__name__,
+            (PolledManagedSocket, cls), {})
+    return polled_sockets[cls]
+
+class DeadMultiplexer(object):
+    """
+        SocketMultiplexer interface on top of a DeadPoller backend.
+
+        The loop waits for readiness until the next event of its
+        DeadEventQueue is due, so it only wakes up when there is something
+        to do. 'factory' is called with the multiplexer as its only
+        argument and should return a PolledManagedSocket, 'backend' names
+        the DeadPoller to use, the best one available by default.
+    """
+
+    def __init__(self, factory, backend = None):
+        self.factory = factory
+        self.poller = createPoller(backend)
+        self.eq = DeadEventQueue()
+
+        # File descriptor -> reader or socket
+        self.handlers = {}
+        self.running = False
+        self.signalled = False
+
+    def setInterest(self, handler, events):
+        """
+            Sets the events 'handler' is called for, its handleRead or
+            handleWrite method, an empty mask removes it.
+        """
+
+        fd = handler.fileno()
+        if events:
+            self.handlers[fd] = handler
+        elif self.handlers.get(fd) is handler:
+            del self.handlers[fd]
+        else:
+            return
+        self.poller.update(fd, events)
+
+    def addReader(self, reader):
+        self.setInterest(reader, POLL_READ)
+
+    def removeReader(self, reader):
+        self.setInterest(reader, 0)
+
+    def connect(self, ip, port):
+        sock = self.factory(self)
+        sock.open(ip, port)
+        return sock
+
+    def onConnectError(self, sock, error):
+        pass
+
+    def onSignal(self):
+        pass
+
+    def handleSignal(self, signum, frame):
+        # Handled from the loop, the poller returns early on EINTR
+        self.signalled = True
+
+    def runOnce(self):
+        """
+            Waits for readiness until the next event is due, handles the
+            ready descriptors, then runs the events that are due.
+        """
+
+        handlers = self.handlers
+        for fd, events in self.poller.poll(self.eq.getTimeout()):
+            handler = handlers.get(fd)
+            if handler is not None and events & POLL_READ:
+                handler.handleRead()
+            if events & POLL_WRITE and handlers.get(fd) is handler and \
+                    handler is not None:
+                handler.handleWrite()
+        if self.signalled:
+            self.signalled = False
+            self.onSignal()
+        self.eq.elapseTime()
+
+    def startMultiplex(self):
+        previous = signal.signal(signal.SIGWINCH, self.handleSignal)
+        self.running = True
+        try:
+            while self.running:
+                self.runOnce()
+        finally:
+            signal.signal(signal.SIGWINCH, previous)
+
+    def stopMultiplex(self):
+        self.running = False
@@ -0,0 +1,127 @@
+# Deadline worker pool
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+from events import DeferredCall
+from wakeup import DeadWakeup
+
+class DeadWorkerPool(object):
+    """
+        Runs CPU heavy jobs on a thread or process pool.
+
+        Results are handed back to the multiplexer loop through a wake-up
+        pipe, so job callbacks run in the main thread like any other event.
+        At most 'maxpending' jobs can be pending, further submits are
+        refused until some finish. Jobs can be given a timeout, and can be
+        cancelled by their job ID.
+
+        Jobs on a process pool must be picklable, module level functions.
+    """
+
+    WORKERS = 4
+    MAX_PENDING = 64
+
+    def __init__(self, muxer, workers = None, processes = False,
+            maxpending = None):
+        if futures is None:
+            raise ImportError("DeadWorkerPool requires concurrent.futures")
+        if workers is None:
+            workers = DeadWorkerPool.WORKERS
+        if maxpending is None:
+            maxpending = DeadWorkerPool.MAX_PENDING
+        if processes:
+            self.executor = futures.ProcessPoolExecutor(workers)
+        else:
+            self.executor = futures.ThreadPoolExecutor(workers)
+        self.maxpending = maxpending
+        self.muxer = muxer
+        self.wakeup = DeadWakeup()
+        muxer.addReader(self.wakeup)
+
+        # Job ID -> (future, callback, timeout EID), and the futures of
+        # jobs that timed out or were cancelled while running, which keep
+        # their worker busy until they finish.
+        self.jobs = {}
+        self.orphans = {}
+        self.next_jid = 0
+
+    def __len__(self):
+        return len(self.jobs) + len(self.orphans)
+
+    def isFull(self):
+        return len(self) >= self.maxpending
+
+    def submit(self, func, args = (), callback = None, timeout = None):
+        """
+            Runs func(*args) on the pool, and calls callback(result, error)
+            from the multiplexer loop when done. 'error' is None on success,
+            a futures.TimeoutError if the job took more than 'timeout'
+            seconds, a futures.CancelledError if it was cancelled, or the
+            exception raised by the job.
+
+            Returns the job ID, or None if too many jobs are pending.
+        """
+
+        if self.isFull():
+            return None
+        jid = self.next_jid
+        self.next_jid += 1
+        future = self.executor.submit(func, *args)
+        eid = None
+        if timeout is not None:
+            eid = self.muxer.eq.scheduleEvent(DeferredCall(timeout,
+                self.expire, jid = jid))
+        self.jobs[jid] = (future, callback, eid)
+
+        # Done callbacks run in a worker thread, move to the main loop
+        future.add_done_callback(
+            lambda f: self.wakeup.post(self.finish, jid))
+        return jid
+
+    def cancel(self, jid):
+        """
+            Cancels the job carrying 'jid'. Jobs that are already running
+            can not be stopped, but their result is discarded. They count
+            as pending until they finish.
+        """
+        return self.abort(jid, futures.CancelledError())
+
+    def expire(self, jid):
+        self.abort(jid, futures.TimeoutError())
+
+    def abort(self, jid, error):
+        job = self.jobs.pop(jid, None)
+        if job is None:
+            return False
+        future, callback, eid = job
+        if not future.cancel():
+            self.orphans[jid] = future
+        if eid is not None and not isinstance(error, futures.TimeoutError):
+            self.muxer.eq.cancelEvent(eid)
+        if callback is not None:
+            callback(None, error)
+        return True
+
+    def finish(self, jid):
+        self.orphans.pop(jid, None)
+        job = self.jobs.pop(jid, None)
+
+        # Cancelled or timed out already
+        if job is None:
+            return
+        future, callback, eid = job
+        if eid is not None:
+            self.muxer.eq.cancelEvent(eid)
+        if callback is None:
+            return
+        error = future.exception()
+        if error is not None:
+            callback(None, error)
+        else:
+            callback(future.result(), None)
+
+    def close(self):
+        self.executor.shutdown(False)
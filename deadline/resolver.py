@@ -0,0 +1,111 @@
+# Deadline asynchronous host name resolver
+
+import socket
+from Queue import Queue
+from threading import Thread
+from time import time
+
+from wakeup import DeadWakeup
+
+class DeadResolver(object):
+    """
+        Asynchronous host name resolver.
+
+        Lookups are done with getaddrinfo by a small pool of worker
+        threads, so a slow name server never blocks the multiplexer.
+        Both IPv4 (A) and IPv6 (AAAA) addresses are resolved.
+        Results are delivered from within the multiplexer loop and are
+        cached for CACHE_TTL seconds, since getaddrinfo does not expose
+        the TTL of the records.
+    """
+
+    WORKERS = 2
+    CACHE_TTL = 300.0
+
+    def __init__(self, muxer, workers = None):
+        self.wakeup = DeadWakeup()
+        muxer.addReader(self.wakeup)
+
+        # (host, port, family) -> (expires, addresses)
+        self.cache = {}
+
+        # (host, port, family) -> [(callback, kwargs), ...]
+        # Concurrent lookups of the same host share a single query.
+        self.pending = {}
+
+        self.queue = Queue()
+        if workers is None:
+            workers = DeadResolver.WORKERS
+        self.workers = []
+        for i in xrange(workers):
+            worker = Thread(target = self.work, name = "resolver-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def resolve(self, host, port, callback, family = socket.AF_UNSPEC,
+            **kwargs):
+        """
+            Resolves 'host', and calls callback(addresses, error, **kwargs)
+            when done. 'addresses' is a list of (family, sockaddr) tuples,
+            or None when the lookup failed, in which case 'error' contains
+            the exception.
+
+            Cached results are delivered immediately.
+        """
+
+        key = (host, port, family)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if cached[0] > time():
+                callback(cached[1], None, **kwargs)
+                return
+            del self.cache[key]
+
+        if key in self.pending:
+            self.pending[key].append((callback, kwargs))
+            return
+        self.pending[key] = [(callback, kwargs)]
+        self.queue.put(key)
+
+    def work(self):
+        """
+            Worker thread main loop.
+        """
+
+        while True:
+            key = self.queue.get()
+            if key is None:
+                return
+            host, port, family = key
+            try:
+                addresses = []
+                for info in socket.getaddrinfo(host, port, family,
+                        socket.SOCK_STREAM):
+                    address = (info[0], info[4])
+                    if address not in addresses:
+                        addresses.append(address)
+                error = None
+            except socket.error as e:
+                addresses, error = None, e
+            self.wakeup.post(self.deliver, key, addresses, error)
+
+    def deliver(self, key, addresses, error):
+        if error is None:
+            self.cache[key] = (time() + DeadResolver.CACHE_TTL, addresses)
+        for callback, kwargs in self.pending.pop(key, ()):
+            callback(addresses, error, **kwargs)
+
+    def close(self):
+        """
+            Stops all worker threads.
+        """
+
+        for worker in self.workers:
+            self.queue.put(None)
+
+        # Idle workers exit right away, those stuck in a lookup are left
+        # behind, they are daemon threads.
+        for worker in self.workers:
+            worker.join(0.1)
+        self.workers = []
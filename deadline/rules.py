@@ -0,0 +1,294 @@
+# Deadline rules library
+
+import re
+import sre_parse
+from sre_constants import LITERAL
+
+from acl import DeadAccess
+
+def offloaded(timeout = None):
+    """
+        Decorator marking a rule handler as CPU heavy, rules using it are
+        run on the worker pool instead of in the multiplexer loop, and are
+        abandoned after 'timeout' seconds.
+    """
+
+    def mark(handler):
+        handler.offload = True
+        handler.offload_timeout = timeout
+        return handler
+    return mark
+
+class DeadRule(object):
+    """
+        A bot rule, pairing a handler with the way it is run.
+
+        Handlers of offloaded rules run on a DeadWorkerPool. They must not
+        touch the GUI or any socket, instead they return a result, which is
+        passed to the completion callback from within the multiplexer loop.
+
+        Rules with an 'acl' only run for users allowed by the ACL of that
+        name in the DeadAccess of the rule set.
+    """
+
+    def __init__(self, handler, offload = None, timeout = None, acl = None):
+        if offload is None:
+            offload = getattr(handler, 'offload', False)
+        if timeout is None:
+            timeout = getattr(handler, 'offload_timeout', None)
+        self.handler = handler
+        self.offload = offload
+        self.timeout = timeout
+        self.acl = acl
+
+    def run(self, pool, callback, *args):
+        """
+            Runs the handler with 'args' and calls callback(result, error).
+
+            Offloaded rules run inline when no pool is available. Exceptions
+            raised by the handler are passed on as 'error'.
+            Returns False if the rule could not be run because the pool
+            has too many jobs pending.
+        """
+
+        if self.offload and pool is not None:
+            return pool.submit(self.handler, args, callback,
+                self.timeout) is not None
+        try:
+            result = self.handler(*args)
+        except Exception as e:
+            callback(None, e)
+        else:
+            callback(result, None)
+        return True
+
+class DeadTrigger(object):
+    """
+        Binds a rule to either a keyword or a regular expression, and
+        optionally limits it to a set of channels and/or users.
+    """
+
+    __slots__ = ('rule', 'keyword', 'regex', 'channels', 'users')
+
+    def __init__(self, rule, keyword = None, regex = None, channels = None,
+            users = None):
+        self.rule = rule
+        self.keyword = keyword
+        self.regex = regex
+        self.channels = channels
+        self.users = users
+
+    def appliesTo(self, channel, nick):
+        if channel is None:
+            if self.channels is not None:
+                return False
+        elif self.channels is not None and channel not in self.channels:
+            return False
+        return self.users is None or nick in self.users
+
+# Patterns using backreferences can not be merged with other patterns,
+# since their group numbers would change.
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+DEFAULT_FLAGS = re.compile('').flags
+
+def requiredLiteral(regex):
+    """
+        Returns the longest literal string that any match of the compiled
+        'regex' must contain, or an empty string if there is none.
+    """
+
+    if regex.flags & re.IGNORECASE:
+        return ''
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return ''
+    best = run = ''
+    for op, av in parsed:
+        if op == LITERAL:
+            run += unichr(av) if isinstance(regex.pattern, unicode) \
+                else chr(av)
+        else:
+            if len(run) > len(best):
+                best = run
+            run = ''
+    if len(run) > len(best):
+        best = run
+    return best
+
+class DeadRuleIndex(object):
+    """
+        Compiled form of the triggers that apply to a single scope.
+
+        Keyword triggers are kept in a dict by keyword. Regex triggers are
+        prefiltered by a literal string their matches must contain, these
+        are indexed by one of their three character substrings, so only
+        regexes of which the literal occurs in the message are run. The remaining
+        regexes are guarded by a single alternation of their patterns.
+    """
+
+    def __init__(self, triggers):
+        self.keywords = {}
+        self.order = {}
+        self.literals = {}
+        self.unfiltered = []
+        self.guard = None
+
+        patterns = []
+        for trigger in triggers:
+            self.order[trigger] = len(self.order)
+            if trigger.keyword is not None:
+                self.keywords.setdefault(trigger.keyword, []). \
+                    append(trigger)
+                continue
+
+            regex = trigger.regex
+            literal = requiredLiteral(regex)
+            if len(literal) >= 3:
+                # Index by the least used substring, so literals sharing
+                # a common prefix do not end up in the same bucket.
+                key = min((literal[i:i + 3]
+                    for i in xrange(len(literal) - 2)),
+                    key = lambda k: len(self.literals.get(k, ())))
+                self.literals.setdefault(key, []).append((literal, trigger))
+                continue
+
+            self.unfiltered.append(trigger)
+            if patterns is not None and regex.flags == DEFAULT_FLAGS and \
+                    not BACKREFERENCE.search(regex.pattern):
+                patterns.append('(?:%s)' % regex.pattern)
+            else:
+                # Anything not mergeable disables the guard
+                patterns = None
+
+        if patterns:
+            try:
+                self.guard = re.compile('|'.join(patterns))
+            except re.error:
+                self.guard = None
+
+    def match(self, nick, text):
+        """
+            Returns the (trigger, argument) tuples of all triggers matching
+            'text', see DeadRuleSet.match.
+        """
+
+        matches = []
+        if text.startswith('.'):
+            parts = text[1:].split(None, 1)
+            if parts:
+                for trigger in self.keywords.get(parts[0].lower(), ()):
+                    if trigger.users is None or nick in trigger.users:
+                        matches.append((trigger,
+                            parts[1] if len(parts) > 1 else ''))
+
+        # Collect the regexes that might match
+        candidates = []
+        if self.literals:
+            literals = self.literals
+            seen = set()
+            for i in xrange(len(text) - 2):
+                entries = literals.get(text[i:i + 3])
+                if entries is None:
+                    continue
+                for literal, trigger in entries:
+                    if trigger not in seen and literal in text:
+                        seen.add(trigger)
+                        candidates.append(trigger)
+        if self.unfiltered and \
+                (self.guard is None or self.guard.search(text)):
+            candidates.extend(self.unfiltered)
+        if len(candidates) > 1:
+            candidates.sort(key = self.order.get)
+
+        for trigger in candidates:
+            if trigger.users is not None and nick not in trigger.users:
+                continue
+            m = trigger.regex.search(text)
+            if m is not None:
+                matches.append((trigger, (m.group(0),) + m.groups()))
+        return matches
+
+class DeadRuleSet(object):
+    """
+        The rules applied to incoming messages.
+
+        Triggers are compiled into a DeadRuleIndex per channel, or per user
+        for private messages, the first time a message arrives there, so
+        matching cost stays nearly flat as the amount of rules grows.
+        User restrictions of triggers in channels are checked on match,
+        as are the ACLs of rules, against 'access'.
+    """
+
+    # Maximum amount of compiled scopes kept around
+    MAX_SCOPES = 1024
+
+    def __init__(self):
+        self.triggers = []
+        self.scopes = {}
+        self.access = DeadAccess()
+
+    def addKeyword(self, keyword, rule, channels = None, users = None):
+        """
+            Adds a rule triggered by messages starting with '.keyword'.
+        """
+        return self.addTrigger(DeadTrigger(rule, keyword = keyword.lower(),
+            channels = self.nameSet(channels), users = self.nameSet(users)))
+
+    def addRegex(self, pattern, rule, channels = None, users = None,
+            flags = 0):
+        """
+            Adds a rule triggered by messages matching 'pattern'.
+        """
+        return self.addTrigger(DeadTrigger(rule,
+            regex = re.compile(pattern, flags),
+            channels = self.nameSet(channels), users = self.nameSet(users)))
+
+    def addTrigger(self, trigger):
+        self.triggers.append(trigger)
+        self.scopes.clear()
+        return trigger
+
+    def removeTrigger(self, trigger):
+        self.triggers.remove(trigger)
+        self.scopes.clear()
+
+    def nameSet(self, names):
+        if names is None:
+            return None
+        if isinstance(names, basestring):
+            names = (names,)
+        return frozenset(name.lower() for name in names)
+
+    def match(self, channel, nick, text, hostmask = None):
+        """
+            Matches a message said by 'nick' in 'channel', or in private if
+            'channel' is None. Rules with an ACL never match if 'hostmask'
+            is None.
+
+            Returns a list of (trigger, argument) tuples, the argument being
+            the text following the keyword for keyword triggers, or the
+            matched text followed by all groups for regex triggers.
+        """
+
+        nick = nick.lower()
+        if channel is not None:
+            channel = channel.lower()
+            scope = channel
+        else:
+            scope = (nick,)
+
+        index = self.scopes.get(scope)
+        if index is None:
+            if len(self.scopes) >= DeadRuleSet.MAX_SCOPES:
+                self.scopes.clear()
+            index = DeadRuleIndex([t for t in self.triggers
+                if t.appliesTo(channel, nick)])
+            self.scopes[scope] = index
+        matches = index.match(nick, text)
+        for i in xrange(len(matches) - 1, -1, -1):
+            acl = matches[i][0].rule.acl
+            if acl is not None and (hostmask is None or
+                    not self.access.check(hostmask, acl)):
+                del matches[i]
+        return matches
@@ -0,0 +1,259 @@
+# Deadline scrollback search
+
+import re
+from array import array
+from bisect import bisect_left
+from time import localtime
+
+from events import DeferredCall
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """
+        Returns the set of lower case words in 'text'.
+    """
+    return set(TOKEN.findall(text.lower()))
+
+class DeadSearchIndex(object):
+    """
+        Inverted index of the messages of a window.
+
+        Every token maps to an [array, start] pair, the array holding the
+        ascending sequence numbers of the messages containing the token
+        from offset 'start' on. Messages are always added newest and
+        removed oldest, so both cost O(tokens of the message).
+    """
+
+    def __init__(self, first = 0):
+        self.postings = {}
+
+        # Sequence number from which on all messages are indexed
+        self.first = first
+
+    def add(self, seq, text):
+        postings = self.postings
+        for token in tokenize(text):
+            posting = postings.get(token)
+            if posting is None:
+                postings[token] = [array('l', (seq,)), 0]
+            else:
+                posting[0].append(seq)
+
+    def remove(self, seq, text):
+        """
+            Removes message 'seq', which must be the oldest one indexed.
+        """
+
+        self.first = seq + 1
+        postings = self.postings
+        for token in tokenize(text):
+            posting = postings.get(token)
+            if posting is None:
+                continue
+            seqs, start = posting
+            if seqs[start] == seq:
+                start += 1
+            if start == len(seqs):
+                del postings[token]
+            elif start > len(seqs) / 2:
+                posting[0], posting[1] = seqs[start:], 0
+            else:
+                posting[1] = start
+
+    def lookup(self, tokens):
+        """
+            Returns the postings of 'tokens' as [array, start] pairs,
+            shortest first, or None if any token is not indexed.
+        """
+
+        result = []
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                return None
+            result.append(posting)
+        result.sort(key = lambda posting: len(posting[0]) - posting[1])
+        return result
+
+def contains(posting, seq):
+    seqs, start = posting
+    i = bisect_left(seqs, seq, start)
+    return i < len(seqs) and seqs[i] == seq
+
+class DeadSearch(object):
+    """
+        The /search command.
+
+        Searches run as a job on the event queue, handling CHUNK_SIZE
+        candidate messages per event, so searching a large scrollback
+        never blocks the GUI. Indexed messages are found by intersecting
+        postings, starting from the rarest token. Messages in logs that
+        predate the index are scanned instead. Results, newest first, are
+        shown in a dedicated window.
+    """
+
+    CHUNK_SIZE = 1000
+    MAX_RESULTS = 100
+
+    def __init__(self, gui):
+        self.gui = gui
+        self.window = None
+
+        # (tokens, windows left, results) of the search in progress, and
+        # its state within the last window left
+        self.job = None
+        self.postings = None
+        self.seq = None
+        self.found = 0
+
+    def searchCall(self, args):
+        """
+            /search [-here] <words>
+        """
+
+        words = (args or '').split()
+        windows = None
+        if words and words[0] == '-here':
+            windows = [self.gui.getCurrentWindow()]
+            words = words[1:]
+        if not words:
+            self.gui.getCurrentWindow().addNotice(
+                "Usage: /search [-here] <words>")
+            return
+        tokens = tokenize(' '.join(words))
+        if not tokens:
+            self.gui.getCurrentWindow().addNotice(
+                "Nothing to search for in '%s'" % ' '.join(words))
+            return
+        if windows is None:
+            windows = list(self.gui.windows)
+
+        if self.window is None:
+            self.window = self.gui.createWindow("Search")
+        windows = [w for w in windows if w is not self.window]
+        self.window.setTitle("Search: %s" % ' '.join(words))
+        self.window.addNotice("Searching for '%s'" % ' '.join(words))
+        self.gui.setCurrentWindow(self.window)
+
+        # Replaces any search in progress
+        self.job = (tokens, windows, [])
+        if self.startWindow():
+            self.schedule()
+        else:
+            self.finish()
+
+    def schedule(self):
+        if self.gui.eq is None:
+            while self.step():
+                pass
+        else:
+            self.gui.eq.scheduleEvent(DeferredCall(0, self.resume,
+                job = self.job))
+
+    def resume(self, job):
+        # Searches replaced by a newer one are dropped
+        if job is self.job and self.step():
+            self.schedule()
+
+    def forgetWindow(self, window):
+        """
+            Drops 'window' from the search in progress, call this before
+            closing it. Closing the search window cancels the search.
+        """
+
+        if window is self.window:
+            self.window = None
+            self.job = None
+            return
+        if self.job is None:
+            return
+        tokens, windows, results = self.job
+        results[:] = [result for result in results if result[0] is not window]
+        if window in windows:
+            searching = windows[-1] is window
+            windows.remove(window)
+            if searching:
+                self.startWindow()
+
+    def startWindow(self):
+        """
+            Sets up the search of the last window left, returns False if
+            all windows are done.
+        """
+
+        tokens, windows, results = self.job
+        if not windows:
+            return False
+        window = windows[-1]
+        self.postings = window.search.lookup(tokens)
+        self.seq = window.messages.end - 1
+        self.found = len(results)
+        return True
+
+    def step(self):
+        """
+            Searches the next chunk of messages, returns False when the
+            search is done.
+        """
+
+        tokens, windows, results = self.job
+        if not windows:
+            self.finish()
+            return False
+        window = windows[-1]
+        index = window.search
+        count = DeadSearch.CHUNK_SIZE
+        seq = self.seq
+
+        if self.postings is not None and seq >= index.first:
+            # Indexed messages, walking the rarest posting backwards
+            rarest, others = self.postings[0], self.postings[1:]
+            seqs, start = rarest
+            i = bisect_left(seqs, seq + 1, start) - 1
+            while i >= start and count:
+                if all(contains(posting, seqs[i]) for posting in others):
+                    results.append((window, seqs[i]))
+                i -= 1
+                count -= 1
+            seq = seqs[i] if i >= start else index.first - 1
+        else:
+            # Logged messages from before the index
+            seq = min(seq, index.first - 1)
+            first = 0 if window.log is not None else index.first
+            while seq >= first and count:
+                if tokens <= tokenize(window.log.get(seq)[2]):
+                    results.append((window, seq))
+                seq -= 1
+                count -= 1
+            if seq < first:
+                seq = None
+        self.seq = seq
+
+        if seq is None or \
+                len(results) - self.found >= DeadSearch.MAX_RESULTS:
+            windows.pop()
+            if not self.startWindow():
+                self.finish()
+                return False
+        return True
+
+    def finish(self):
+        tokens, windows, results = self.job
+        self.job = None
+
+        # Without a log, messages might have been evicted in the meantime
+        results = [(window, seq) for window, seq in results
+            if window.log is not None or seq >= window.messages.first]
+        results.sort(key = lambda result:
+            result[0].getMessage(result[1]).timestamp, reverse = True)
+        del results[DeadSearch.MAX_RESULTS:]
+
+        for window, seq in results:
+            message = window.getMessage(seq)
+            clock = localtime(message.timestamp)
+            self.window.addNotice("%s %02d-%02d %02d:%02d %s" % (window.name,
+                clock.tm_mday, clock.tm_mon, clock.tm_hour, clock.tm_min,
+                message.content))
+        self.window.addNotice("%d result(s)" % len(results))
+        self.gui.scheduleRender()
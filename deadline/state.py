@@ -0,0 +1,438 @@
+# Deadline IRC network state tracker
+
+import string
+
+# Case mappings as advertised by the CASEMAPPING token of RPL_ISUPPORT
+CASEMAPPINGS = {
+    'ascii': string.maketrans(string.ascii_uppercase,
+        string.ascii_lowercase),
+    'rfc1459': string.maketrans(string.ascii_uppercase + '[]\\~',
+        string.ascii_lowercase + '{}|^'),
+    'strict-rfc1459': string.maketrans(string.ascii_uppercase + '[]\\',
+        string.ascii_lowercase + '{}|'),
+}
+
+class YeOldeIRCUser(object):
+    """
+        A user sharing at least one channel with us.
+
+        'channels' is the set of (case mapped) names of those channels,
+        the reverse index of the channel member tables and of the NAMES
+        replies in progress.
+    """
+
+    __slots__ = ('id', 'nick', 'user', 'host', 'channels')
+
+    def __init__(self, id, nick):
+        self.id = id
+        self.nick = nick
+        self.user = None
+        self.host = None
+        self.channels = set()
+
+    def getMask(self):
+        return '%s!%s@%s' % (self.nick, self.user or '*', self.host or '*')
+
+class YeOldeIRCChannel(object):
+    """
+        A channel we are in.
+
+        'members' maps the nick ids of its users to their mode bits,
+        'modes' maps the channel modes that are set to their argument,
+        or True for modes without one. List modes (bans, etc.) are not
+        tracked.
+    """
+
+    __slots__ = ('name', 'members', 'modes', 'topic', 'names')
+
+    def __init__(self, name):
+        self.name = name
+        self.members = {}
+        self.modes = {}
+        self.topic = None
+
+        # Members collected from a NAMES reply in progress
+        self.names = None
+
+class YeOldeIRCState(object):
+    """
+        Tracks the channels we are in and the users in them.
+
+        Nicks are interned as small integer ids, so channel member tables
+        map ids to mode bits and a nick change only updates one entry.
+        Together with the channels set of every user, QUIT and NICK cost
+        O(channels of that user) instead of a scan of all channels.
+        The tracker is fed every message through update() and never
+        touches the GUI, so large NAMES bursts cost nothing but the table
+        updates themselves.
+    """
+
+    def __init__(self):
+        # Our own nick
+        self.nick = None
+
+        # Case mapped nick -> id, id -> YeOldeIRCUser
+        self.nicks = {}
+        self.users = {}
+        self.next_id = 0
+
+        # Case mapped name -> YeOldeIRCChannel
+        self.channels = {}
+
+        # Server features, defaults of RFC 1459
+        self.casemap = CASEMAPPINGS['rfc1459']
+        self.setPrefix('(ov)@+')
+        self.chanmodes = ('beI', 'k', 'l', 'imnpst')
+
+        self.handlers = {
+            '001': self.on001,
+            '005': self.on005,
+            'JOIN': self.onJOIN,
+            'PART': self.onPART,
+            'KICK': self.onKICK,
+            'QUIT': self.onQUIT,
+            'NICK': self.onNICK,
+            'MODE': self.onMODE,
+            'TOPIC': self.onTOPIC,
+            '324': self.on324,
+            '332': self.on332,
+            '353': self.on353,
+            '366': self.on366,
+        }
+
+    def lower(self, name):
+        return name.translate(self.casemap)
+
+    def isMe(self, nick):
+        return self.nick is not None and self.lower(nick) == \
+            self.lower(self.nick)
+
+    def setPrefix(self, prefix):
+        """
+            Sets the member modes from a PREFIX token such as
+            '(qaohv)~&@%+', modes listed first get the highest bits.
+        """
+
+        modes, _, chars = prefix[1:].partition(')')
+        count = len(modes)
+        self.prefix_modes = modes
+        self.prefix_chars = chars
+        self.mode_bits = dict((m, 1 << (count - i - 1))
+            for i, m in enumerate(modes))
+        self.char_bits = dict((c, 1 << (count - i - 1))
+            for i, c in enumerate(chars))
+
+    def prefixOf(self, bits):
+        """
+            Returns the prefix character of the highest mode in 'bits'.
+        """
+
+        for i, char in enumerate(self.prefix_chars):
+            if bits & (1 << (len(self.prefix_chars) - i - 1)):
+                return char
+        return ''
+
+    def update(self, msg):
+        handler = self.handlers.get(msg.command)
+        if handler is not None:
+            handler(msg)
+
+    # Queries
+
+    def getUser(self, nick):
+        id = self.nicks.get(self.lower(nick))
+        if id is None:
+            return None
+        return self.users[id]
+
+    def getChannel(self, name):
+        return self.channels.get(self.lower(name))
+
+    def getMembers(self, name):
+        """
+            Returns (nick, mode bits) tuples for all users in channel
+            'name', or None if we are not in it.
+        """
+
+        channel = self.getChannel(name)
+        if channel is None:
+            return None
+        users = self.users
+        return [(users[id].nick, bits)
+            for id, bits in channel.members.iteritems()]
+
+    def getModes(self, name, nick):
+        """
+            Returns the mode bits of 'nick' in channel 'name', or None if
+            'nick' is not in it.
+        """
+
+        channel = self.getChannel(name)
+        id = self.nicks.get(self.lower(nick))
+        if channel is None or id is None:
+            return None
+        return channel.members.get(id)
+
+    # Table maintenance
+
+    def intern(self, nick):
+        key = self.lower(nick)
+        id = self.nicks.get(key)
+        if id is None:
+            id = self.next_id
+            self.next_id += 1
+            self.nicks[key] = id
+            self.users[id] = YeOldeIRCUser(id, nick)
+        return self.users[id]
+
+    def release(self, user):
+        """
+            Forgets a user that no longer shares any channel with us.
+        """
+
+        if user.channels or self.isMe(user.nick):
+            return
+        del self.users[user.id]
+        del self.nicks[self.lower(user.nick)]
+
+    def addMember(self, channel, user, bits = 0):
+        channel.members[user.id] = bits
+        if channel.names is not None:
+            channel.names[user.id] = bits
+        user.channels.add(self.lower(channel.name))
+
+    def removeMember(self, channel, user):
+        channel.members.pop(user.id, None)
+        if channel.names is not None:
+            channel.names.pop(user.id, None)
+        user.channels.discard(self.lower(channel.name))
+        self.release(user)
+
+    def removeChannel(self, key):
+        channel = self.channels.pop(key, None)
+        if channel is None:
+            return
+        users = self.users
+        for id in channel.members:
+            user = users[id]
+            user.channels.discard(key)
+            self.release(user)
+        for id in channel.names or ():
+            user = users.get(id)
+            if user is not None:
+                user.channels.discard(key)
+                self.release(user)
+
+    def reset(self):
+        self.nicks.clear()
+        self.users.clear()
+        self.channels.clear()
+
+    # Message handlers
+
+    def on001(self, msg):
+        self.reset()
+        if msg.params:
+            self.nick = msg.params[0]
+            self.intern(self.nick)
+
+    def on005(self, msg):
+        for token in msg.params[1:-1]:
+            name, _, value = token.partition('=')
+            if name == 'PREFIX' and value.startswith('('):
+                self.setPrefix(value)
+            elif name == 'CHANMODES':
+                modes = value.split(',')
+                if len(modes) >= 4:
+                    self.chanmodes = tuple(modes[:4])
+            elif name == 'CASEMAPPING' and value in CASEMAPPINGS and \
+                    not self.channels:
+                # Only safe to switch before any names are keyed
+                self.casemap = CASEMAPPINGS[value]
+                self.nicks = dict((self.lower(u.nick), u.id)
+                    for u in self.users.itervalues())
+
+    def onJOIN(self, msg):
+        if not msg.params or msg.prefix is None:
+            return
+        nick = msg.getNick()
+        name = msg.params[0]
+        key = self.lower(name)
+        channel = self.channels.get(key)
+        if channel is None:
+            if not self.isMe(nick):
+                return
+            channel = self.channels[key] = YeOldeIRCChannel(name)
+        user = self.intern(nick)
+        _, _, mask = msg.prefix.partition('!')
+        if mask:
+            user.user, _, user.host = mask.partition('@')
+        self.addMember(channel, user)
+
+    def onPART(self, msg):
+        if not msg.params:
+            return
+        user = self.getUser(msg.getNick() or '')
+        if user is None:
+            return
+        for name in msg.params[0].split(','):
+            self.leave(self.lower(name), user)
+
+    def onKICK(self, msg):
+        if len(msg.params) < 2:
+            return
+        user = self.getUser(msg.params[1])
+        if user is not None:
+            self.leave(self.lower(msg.params[0]), user)
+
+    def leave(self, key, user):
+        if self.isMe(user.nick):
+            self.removeChannel(key)
+            return
+        channel = self.channels.get(key)
+        if channel is not None:
+            self.removeMember(channel, user)
+
+    def onQUIT(self, msg):
+        user = self.getUser(msg.getNick() or '')
+        if user is None or self.isMe(user.nick):
+            return
+        channels = self.channels
+        for key in user.channels:
+            channel = channels[key]
+            channel.members.pop(user.id, None)
+            if channel.names is not None:
+                channel.names.pop(user.id, None)
+        user.channels.clear()
+        self.release(user)
+
+    def onNICK(self, msg):
+        if not msg.params:
+            return
+        old = msg.getNick() or ''
+        new = msg.params[0]
+        id = self.nicks.pop(self.lower(old), None)
+        if self.isMe(old):
+            self.nick = new
+        if id is None:
+            return
+        self.nicks[self.lower(new)] = id
+        self.users[id].nick = new
+
+    def onMODE(self, msg):
+        if len(msg.params) < 2:
+            return
+        channel = self.getChannel(msg.params[0])
+        if channel is not None:
+            self.applyModes(channel, msg.params[1], msg.params[2:])
+
+    def applyModes(self, channel, modes, args):
+        """
+            Applies a channel mode string such as '+ov-k' with its
+            arguments.
+        """
+
+        lists, always, onset, never = self.chanmodes
+        args = iter(args)
+        adding = True
+        for mode in modes:
+            if mode == '+':
+                adding = True
+            elif mode == '-':
+                adding = False
+            elif mode in self.mode_bits:
+                user = self.getUser(next(args, ''))
+                if user is None or user.id not in channel.members:
+                    continue
+                bits = channel.members[user.id]
+                if adding:
+                    bits |= self.mode_bits[mode]
+                else:
+                    bits &= ~self.mode_bits[mode]
+                channel.members[user.id] = bits
+            elif mode in lists:
+                next(args, None)
+            elif mode in always or (adding and mode in onset):
+                arg = next(args, None)
+                if adding:
+                    channel.modes[mode] = arg
+                else:
+                    channel.modes.pop(mode, None)
+            elif adding:
+                channel.modes[mode] = True
+            else:
+                channel.modes.pop(mode, None)
+
+    def onTOPIC(self, msg):
+        if len(msg.params) >= 2:
+            channel = self.getChannel(msg.params[0])
+            if channel is not None:
+                channel.topic = msg.params[-1]
+
+    def on324(self, msg):
+        if len(msg.params) >= 3:
+            channel = self.getChannel(msg.params[1])
+            if channel is not None:
+                channel.modes.clear()
+                self.applyModes(channel, msg.params[2], msg.params[3:])
+
+    def on332(self, msg):
+        if len(msg.params) >= 3:
+            channel = self.getChannel(msg.params[1])
+            if channel is not None:
+                channel.topic = msg.params[-1]
+
+    def on353(self, msg):
+        # <me> [<type>] <channel> :<names>
+        if len(msg.params) < 3:
+            return
+        channel = self.getChannel(msg.params[-2])
+        if channel is None:
+            return
+        if channel.names is None:
+            channel.names = {}
+        names = channel.names
+        char_bits = self.char_bits
+        intern = self.intern
+
+        # Users listed count as members right away, so they are not
+        # released when they leave another channel before the burst ends.
+        key = self.lower(channel.name)
+        for name in msg.params[-1].split():
+            # Multiple prefixes with multi-prefix
+            bits = 0
+            i = 0
+            while i < len(name) and name[i] in char_bits:
+                bits |= char_bits[name[i]]
+                i += 1
+            nick, _, mask = name[i:].partition('!')
+            user = intern(nick)
+            if mask:
+                user.user, _, user.host = mask.partition('@')
+            names[user.id] = bits
+            user.channels.add(key)
+
+    def on366(self, msg):
+        # End of NAMES, replaces the member table of the channel
+        if len(msg.params) < 2:
+            return
+        channel = self.getChannel(msg.params[1])
+        if channel is None or channel.names is None:
+            return
+        key = self.lower(channel.name)
+        names = channel.names
+        users = self.users
+        for id in channel.members:
+            if id not in names:
+                user = users[id]
+                user.channels.discard(key)
+                self.release(user)
+        for id in names.keys():
+            user = users.get(id)
+            if user is None:
+                # Quit before the end of the burst
+                del names[id]
+            else:
+                user.channels.add(key)
+        channel.members = names
+        channel.names = None
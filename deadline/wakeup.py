@@ -0,0 +1,56 @@
+# Deadline thread wake-up pipe
+
+import os
+import errno
+import fcntl
+from collections import deque
+
+class DeadWakeup(object):
+    """
+        Self-pipe reader for SocketMultiplexer.
+
+        Other threads can post calls with post(), these are executed from
+        within the multiplexer loop as soon as the pipe becomes readable.
+        Register an instance using SocketMultiplexer.addReader.
+    """
+
+    def __init__(self):
+        self.rfd, self.wfd = os.pipe()
+        for fd in (self.rfd, self.wfd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        # deque.append and deque.popleft are thread safe
+        self.calls = deque()
+
+    def fileno(self):
+        return self.rfd
+
+    def post(self, func, *args):
+        """
+            Schedules func(*args) to be called from the multiplexer loop,
+            this method may be called from any thread.
+        """
+
+        self.calls.append((func, args))
+        try:
+            os.write(self.wfd, b'x')
+        except OSError as e:
+            # A full pipe already guarantees a wake-up
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def handleRead(self):
+        try:
+            while os.read(self.rfd, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        while self.calls:
+            func, args = self.calls.popleft()
+            func(*args)
+
+    def close(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
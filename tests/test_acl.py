@@ -0,0 +1,104 @@
+# Deadline access control list tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from acl import DeadACL, DeadAccess, splitMask, compileMask
+
+class MaskTest(unittest.TestCase):
+    def testSplit(self):
+        self.assertEqual(splitMask('nick!user@host'), ('nick', 'user', 'host'))
+        self.assertEqual(splitMask('nick'), ('nick', '*', '*'))
+        self.assertEqual(splitMask('*!@'), ('*', '*', '*'))
+        self.assertEqual(splitMask('n!u@x@host'), ('n', 'u@x', 'host'))
+
+    def testCompile(self):
+        regex = compileMask('n?ck!*@*.example.org')
+        self.assertTrue(regex.match('NICK!user@irc.Example.org'))
+        self.assertFalse(regex.match('nick!user@example.org'))
+        self.assertFalse(regex.match('nick!user@irc.example.org.evil'))
+
+        # Regex syntax in masks is literal
+        self.assertFalse(compileMask('a.c').match('abc'))
+
+class DeadACLTest(unittest.TestCase):
+    def testAllow(self):
+        acl = DeadACL()
+        self.assertFalse(acl.check('nick!user@host'))
+        acl.allow('Nick')
+        acl.allow('*!*@*.uva.nl')
+        acl.allow('*!admin@*')
+        self.assertEqual(len(acl), 3)
+        self.assertTrue(acl.check('nick!user@host'))
+        self.assertTrue(acl.check('other!user@staff.UvA.nl'))
+        self.assertTrue(acl.check('other!admin@host'))
+        self.assertFalse(acl.check('other!user@uva.nl.example'))
+        self.assertFalse(acl.check('other!user@host'))
+
+    def testDenyWins(self):
+        acl = DeadACL()
+        acl.allow('*!*@*.uva.nl')
+        acl.deny('eve!*@*')
+        self.assertTrue(acl.check('bob!u@science.uva.nl'))
+        self.assertFalse(acl.check('eve!u@science.uva.nl'))
+
+    def testRemove(self):
+        acl = DeadACL()
+        acl.allow('bob')
+        self.assertTrue(acl.check('bob!u@h'))
+        self.assertTrue(acl.remove('BOB!*@*'))
+        self.assertFalse(acl.remove('bob'))
+        self.assertFalse(acl.check('bob!u@h'))
+
+    def testCandidates(self):
+        acl = DeadACL()
+        acl.allow('bob')
+        acl.allow('*!*@*.uva.nl')
+        acl.allow('*!*@*.example.org')
+        acl.allow('*!admin@*')
+        self.assertEqual([entry.mask for entry in
+            acl.candidates('bob', 'a.uva.nl')],
+            ['bob!*@*', '*!*@*.uva.nl', '*!admin@*'])
+
+class DeadAccessTest(unittest.TestCase):
+    def setUp(self):
+        self.access = DeadAccess()
+        self.access.allow('ops', 'bob')
+
+    def testUnknown(self):
+        self.assertFalse(self.access.check('bob!u@h', 'admins'))
+
+    def testCached(self):
+        self.assertTrue(self.access.check('bob!u@h', 'ops'))
+
+        # Editing the ACL directly leaves the cached decision in place
+        self.access.getACL('ops').deny('bob')
+        self.assertTrue(self.access.check('bob!u@h', 'ops'))
+        self.access.invalidate()
+        self.assertFalse(self.access.check('bob!u@h', 'ops'))
+
+    def testChange(self):
+        self.assertTrue(self.access.check('bob!u@h', 'ops'))
+        self.access.deny('ops', '*!*@h')
+        self.assertFalse(self.access.check('bob!u@h', 'ops'))
+        self.assertTrue(self.access.remove('ops', '*!*@h'))
+        self.assertTrue(self.access.check('bob!u@h', 'ops'))
+
+    def testForgetUser(self):
+        self.access.check('bob!u@h', 'ops')
+        self.access.check('eve!u@h', 'ops')
+        self.access.forgetUser('Bob')
+        self.assertEqual(self.access.cache.keys(), [('eve!u@h', 'ops')])
+        self.assertEqual(self.access.users.keys(), ['eve'])
+
+    def testCacheSize(self):
+        size = DeadAccess.CACHE_SIZE
+        for n in xrange(size + 10):
+            self.access.check('user%d!u@h' % n, 'ops')
+        self.assertEqual(len(self.access.cache), size)
+        self.assertEqual(len(self.access.users), size)
+        self.assertFalse('user0' in self.access.users)
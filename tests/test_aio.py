@@ -0,0 +1,121 @@
+# Deadline asyncio adapter tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import socket
+import unittest
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from aio import asyncio, AsyncioEventQueue, AsyncioMultiplexer, \
+    asyncioSocket
+from events import DeferredCall
+
+class Recorder(object):
+    """
+        Stands in for a ManagedSocket subclass, its callbacks are recorded
+        by the multiplexer.
+    """
+
+    def onConnect(self):
+        self.muxer.calls.append('connect')
+
+    def onRecv(self, data):
+        self.muxer.calls.append(data)
+        self.muxer.stopMultiplex()
+
+    def onDisconnect(self):
+        self.muxer.calls.append('disconnect')
+
+class RecordingMultiplexer(AsyncioMultiplexer):
+    def __init__(self, loop):
+        AsyncioMultiplexer.__init__(self, asyncioSocket(Recorder), loop)
+        self.calls = []
+        self.errors = []
+
+    def onConnectError(self, sock, error):
+        self.errors.append(error)
+        self.stopMultiplex()
+
+@unittest.skipIf(asyncio is None, "requires asyncio or trollius")
+class AsyncioTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+        # Never hang the test run
+        self.loop.call_later(5.0, self.loop.stop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def testEventQueue(self):
+        eq = AsyncioEventQueue(self.loop)
+        fired = []
+        eq.scheduleEvent(DeferredCall(0.01, lambda: fired.append('a')))
+        eid = eq.scheduleEvent(DeferredCall(0, lambda: fired.append('b')))
+        eq.scheduleEvent(DeferredCall(0.02, self.loop.stop))
+        self.assertEqual(len(eq), 3)
+        self.assertTrue(eq.cancelEvent(eid))
+        self.assertFalse(eq.cancelEvent(eid))
+        self.assertEqual(eq.getTimeout(), None)
+
+        self.loop.run_forever()
+        self.assertEqual(fired, ['a'])
+        self.assertEqual(len(eq), 0)
+
+    def testSocketClass(self):
+        cls = asyncioSocket(Recorder)
+        self.assertTrue(asyncioSocket(Recorder) is cls)
+        self.assertTrue(issubclass(cls, asyncio.Protocol))
+        self.assertTrue(issubclass(cls, Recorder))
+
+    def testConnect(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        try:
+            muxer = RecordingMultiplexer(self.loop)
+            sock = muxer.connect('127.0.0.1', server.getsockname()[1])
+            accept = threading.Thread(target = self.greet, args = (server,))
+            accept.start()
+            self.loop.run_forever()
+            accept.join()
+            self.assertEqual(muxer.calls[:1], ['connect'])
+            self.assertEqual(''.join(muxer.calls[1:]), 'hi')
+            sock.close()
+        finally:
+            server.close()
+
+    def greet(self, server):
+        conn = server.accept()[0]
+        conn.sendall('hi')
+        conn.close()
+
+    def testConnectError(self):
+        # Grab a port nobody listens on
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        server.close()
+
+        muxer = RecordingMultiplexer(self.loop)
+        muxer.connect('127.0.0.1', port)
+        self.loop.run_forever()
+        self.assertEqual(len(muxer.errors), 1)
+        self.assertEqual(muxer.calls, [])
+
+    def testRunCoroutine(self):
+        muxer = RecordingMultiplexer(self.loop)
+        done = []
+
+        @asyncio.coroutine
+        def coro():
+            done.append(True)
+            self.loop.stop()
+
+        future = muxer.runCoroutine(coro())
+        self.loop.run_forever()
+        self.assertEqual(done, [True])
+        self.assertTrue(future.done())
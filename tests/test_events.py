@@ -0,0 +1,83 @@
+# Deadline event queue tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+from time import sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+import events
+from events import DeadEventQueue, DeferredCall
+
+class DeadEventQueueTest(unittest.TestCase):
+    def setUp(self):
+        # Deadlines are taken from a clock the tests control
+        self.now = 1000.0
+        self.monotonic = events.monotonic
+        events.monotonic = lambda: self.now
+        self.eq = DeadEventQueue()
+        self.fired = []
+
+    def tearDown(self):
+        events.monotonic = self.monotonic
+
+    def schedule(self, delay, name):
+        return self.eq.scheduleEvent(DeferredCall(delay,
+            lambda: self.fired.append(name)))
+
+    def testOrder(self):
+        self.schedule(3.0, 'c')
+        self.schedule(1.0, 'a')
+        self.schedule(2.0, 'b')
+        self.schedule(1.0, 'a2')
+        self.now += 2.0
+        self.eq.elapseTime()
+        self.assertEqual(self.fired, ['a', 'a2', 'b'])
+        self.assertEqual(len(self.eq), 1)
+
+    def testCancel(self):
+        eid = self.schedule(1.0, 'a')
+        self.schedule(2.0, 'b')
+        self.assertTrue(self.eq.cancelEvent(eid))
+        self.assertFalse(self.eq.cancelEvent(eid))
+        self.assertEqual(self.eq.getTimeout(), 2.0)
+        self.now += 5.0
+        self.eq.elapseTime()
+        self.assertEqual(self.fired, ['b'])
+
+    def testCancelledCompaction(self):
+        eids = [self.schedule(1.0, n) for n in xrange(100)]
+        for eid in eids[:60]:
+            self.eq.cancelEvent(eid)
+        self.assertTrue(len(self.eq.heap) < 100)
+        self.now += 1.0
+        self.eq.elapseTime()
+        self.assertEqual(self.fired, range(60, 100))
+
+    def testRescheduleWaitsForNextCall(self):
+        def again():
+            self.fired.append('again')
+            self.eq.scheduleEvent(DeferredCall(0, again))
+        self.eq.scheduleEvent(DeferredCall(0, again))
+        self.eq.elapseTime()
+        self.eq.elapseTime()
+        self.assertEqual(self.fired, ['again', 'again'])
+
+    def testTimeout(self):
+        self.assertEqual(self.eq.getTimeout(), None)
+        self.schedule(1.5, 'a')
+        self.assertEqual(self.eq.getTimeout(), 1.5)
+        self.now += 2.0
+        self.assertEqual(self.eq.getTimeout(), 0.0)
+
+class MonotonicTest(unittest.TestCase):
+    def testAdvances(self):
+        start = events.monotonic()
+        sleep(0.01)
+        elapsed = events.monotonic() - start
+        self.assertTrue(0.005 < elapsed < 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
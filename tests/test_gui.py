@@ -0,0 +1,671 @@
+# Deadline GUI tests
+#
+# Windows are drawn onto a fake curses screen, which fails on writes
+# outside of it just like curses does.
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import curses, curses.ascii
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+import events
+import gui as guimodule
+from events import DeadEventQueue
+from history import DeadHistory
+from gui import DeadGUI, DeadWindow, DeadMessage, DeadRing, DeadGapBuffer, \
+    DM_NOTICE, ACTIVITY_TEXT
+
+class FakeScreen(object):
+    def __init__(self, height, width):
+        self.height, self.width = height, width
+        self.rows = [[' '] * width for y in xrange(height)]
+        self.region = (0, height - 1)
+        self.scrolling = False
+        self.cursor = (0, 0)
+        self.input = []
+        self.refreshes = 0
+
+    def getch(self):
+        if not self.input:
+            return -1
+        return self.input.pop(0)
+
+    def noutrefresh(self):
+        self.refreshes += 1
+
+    refresh = noutrefresh
+
+    def addstr(self, y, x, text, attr = 0):
+        if y < 0 or y >= self.height or x < 0 or x + len(text) > self.width:
+            raise curses.error("addstr out of range at %d, %d" % (y, x))
+        self.rows[y][x:x + len(text)] = list(text)
+
+    def addch(self, y, x, char, attr = 0):
+        self.addstr(y, x, char, attr)
+
+    def insch(self, y, x, char):
+        row = self.rows[y]
+        row[x:] = [char] + row[x:-1]
+
+    def delch(self, y, x):
+        row = self.rows[y]
+        row[x:] = row[x + 1:] + [' ']
+
+    def move(self, y, x):
+        if y < 0 or y >= self.height or x < 0 or x >= self.width:
+            raise curses.error("move out of range at %d, %d" % (y, x))
+        self.cursor = (y, x)
+
+    def clrtoeol(self):
+        y, x = self.cursor
+        self.rows[y][x:] = [' '] * (self.width - x)
+
+    def setscrreg(self, top, bottom):
+        self.region = (top, bottom)
+
+    def scrollok(self, flag):
+        self.scrolling = bool(flag)
+
+    def scroll(self, lines):
+        assert self.scrolling
+        top, bottom = self.region
+        region = self.rows[top:bottom + 1]
+        region = region[lines:] + [[' '] * self.width
+            for y in xrange(min(lines, len(region)))]
+        self.rows[top:bottom + 1] = region
+
+    def getRows(self, top, bottom):
+        return [''.join(row) for row in self.rows[top:bottom]]
+
+class FakeGUI(object):
+    infobarcolour = infohookcolour = 0
+    noticecolour = incomingcolour = outgoingcolour = 0
+
+    def __init__(self, height, width):
+        self.height, self.width = height, width
+        self.stdscr = FakeScreen(height, width)
+
+    def getActivity(self):
+        return []
+
+def wrapped(message, width):
+    text = message.content
+    wrap = message.getWrap(width)
+    return [(text[wrap[i]:wrap[i + 1]], wrap[i + 2])
+        for i in xrange(0, len(wrap), 3)]
+
+class DeadMessageWrapTest(unittest.TestCase):
+    def testShort(self):
+        message = DeadMessage(DM_NOTICE, "hello world")
+        self.assertEqual(wrapped(message, 30), [("hello world", 9)])
+        self.assertEqual(message.getRenderSpec(30), 1)
+
+    def testWords(self):
+        message = DeadMessage(DM_NOTICE, "aaaa bbbb cccc")
+        self.assertEqual(wrapped(message, 19),
+            [("aaaa bbbb", 9), ("cccc", 9)])
+
+    def testSpaces(self):
+        message = DeadMessage(DM_NOTICE, "aaaa    bbbb")
+        self.assertEqual(wrapped(message, 15), [("aaaa", 9), ("bbbb", 9)])
+
+    def testHardBreak(self):
+        # Lines continuing a word that did not fit use the full width
+        message = DeadMessage(DM_NOTICE, "x" * 25)
+        self.assertEqual(wrapped(message, 19),
+            [("x" * 10, 9), ("x" * 15, 0)])
+        self.assertEqual(message.getRenderSpec(19), 2)
+
+    def testCached(self):
+        message = DeadMessage(DM_NOTICE, "some words " * 20)
+        wrap = message.getWrap(40)
+        self.assertTrue(message.getWrap(40) is wrap)
+        self.assertNotEqual(message.getWrap(30), wrap)
+        self.assertEqual(message.getRenderSpec(30),
+            len(message.getWrap(30)) / 3)
+
+    def testNarrow(self):
+        # Narrower than the prefix, every line still shows a character
+        for content in ("", "a", "aaaa bbbb", "x" * 25):
+            message = DeadMessage(DM_NOTICE, content)
+            for width in xrange(-1, 12):
+                count = message.getRenderSpec(width)
+                lines = wrapped(message, width)
+                self.assertEqual(count, len(lines))
+                self.assertEqual(''.join(text for text, indent in lines).
+                    replace(' ', ''), content.replace(' ', ''))
+                if content:
+                    self.assertTrue(all(text for text, indent in lines))
+
+class DeadRingTest(unittest.TestCase):
+    def testAppend(self):
+        ring = DeadRing(3)
+        for n in xrange(3):
+            self.assertEqual(ring.append(n), None)
+        self.assertEqual(list(ring), [0, 1, 2])
+        self.assertEqual((ring.first, ring.end), (0, 3))
+
+    def testEvict(self):
+        ring = DeadRing(3)
+        for n in xrange(3):
+            ring.append(n)
+        self.assertEqual(ring.append(3), 0)
+        self.assertEqual(ring.append(4), 1)
+        self.assertEqual(list(ring), [2, 3, 4])
+        self.assertEqual(len(ring), 3)
+
+        # Sequence numbers stay put while the storage wraps around
+        self.assertEqual([ring[seq] for seq in xrange(2, 5)], [2, 3, 4])
+
+    def testFirst(self):
+        ring = DeadRing(2, 10)
+        ring.append('a')
+        self.assertEqual(ring[10], 'a')
+        self.assertEqual(ring.end, 11)
+
+    def testIndexError(self):
+        ring = DeadRing(2)
+        for n in xrange(3):
+            ring.append(n)
+        self.assertRaises(IndexError, ring.__getitem__, 0)
+        self.assertRaises(IndexError, ring.__getitem__, 3)
+        self.assertRaises(IndexError, ring.__setitem__, 0, 'x')
+
+    def testSet(self):
+        ring = DeadRing(2)
+        for n in xrange(3):
+            ring.append(n)
+        ring[2] = 'x'
+        self.assertEqual(list(ring), [1, 'x'])
+
+class DeadWindowScrollbackTest(unittest.TestCase):
+    def testEvict(self):
+        window = DeadWindow("test", 5)
+        window.setArea(0, 0, 12, 40)
+        for n in xrange(8):
+            window.addMessage(DeadMessage(DM_NOTICE, "message %d" % n))
+        self.assertEqual(len(window.messages), 5)
+        self.assertEqual([m.content for m in window.messages],
+            ["message %d" % n for n in xrange(3, 8)])
+        self.assertEqual(window.getLineCount(), 5)
+
+class DeadGapBufferTest(unittest.TestCase):
+    def testInsert(self):
+        buf = DeadGapBuffer(16, 'hello')
+        self.assertEqual(buf.insert(5, ' world'), 6)
+        self.assertEqual(buf.insert(0, '> '), 2)
+        self.assertEqual(str(buf), '> hello world')
+        self.assertEqual(len(buf), 13)
+
+    def testFull(self):
+        buf = DeadGapBuffer(8, 'abcdef')
+        self.assertEqual(buf.insert(3, 'XYZ'), 2)
+        self.assertEqual(str(buf), 'abcXYdef')
+        self.assertEqual(buf.insert(0, 'Q'), 0)
+
+    def testDelete(self):
+        buf = DeadGapBuffer(16, 'hello world')
+        buf.delete(5, 6)
+        self.assertEqual(str(buf), 'hello')
+        buf.delete(0, 1)
+        self.assertEqual(str(buf), 'ello')
+
+        # Deleting past the end only removes what is there
+        buf.delete(2, 10)
+        self.assertEqual(str(buf), 'el')
+        self.assertEqual(buf.insert(2, 'bow'), 3)
+        self.assertEqual(str(buf), 'elbow')
+
+    def testSet(self):
+        buf = DeadGapBuffer(8, 'abc')
+        buf.insert(1, 'xx')
+        buf.set('new')
+        self.assertEqual((str(buf), len(buf)), ('new', 3))
+
+    def testSlice(self):
+        buf = DeadGapBuffer(16, 'abcdefgh')
+        buf.moveGap(4)
+        for start in xrange(9):
+            for end in xrange(12):
+                self.assertEqual(buf.slice(start, end), 'abcdefgh'[start:end])
+
+class DeadGUIPromptTest(unittest.TestCase):
+    def setUp(self):
+        self.gui = DeadGUI()
+        self.gui.height, self.gui.width = 24, 80
+        self.gui.stdscr = FakeScreen(24, 80)
+
+    def getPrompt(self):
+        return self.gui.stdscr.getRows(23, 24)[0].rstrip()
+
+    def testEdit(self):
+        gui = self.gui
+        gui.promptInsert('hello world')
+        gui.promptLeft()
+        gui.promptLeft()
+        gui.promptInput('X')
+        gui.promptBackspace()
+        gui.promptBackspace()
+        self.assertEqual(str(gui.buffer), 'hello wold')
+        self.assertEqual(gui.position, 8)
+        self.assertEqual(self.getPrompt(), '[Main] hello wold')
+        self.assertEqual(gui.stdscr.cursor, (23, 15))
+
+    def testLongLine(self):
+        gui = self.gui
+        gui.promptInsert('x' * 200)
+        self.assertEqual(len(gui.buffer), 200)
+        self.assertTrue(gui.view > 0)
+        self.assertEqual(gui.stdscr.cursor[1], len(gui.prompt) + 1 +
+            gui.position - gui.view)
+
+    def testCapacity(self):
+        gui = self.gui
+        gui.promptInsert('x' * (DeadGUI.PROMPT_BLOCK_SIZE + 10))
+        self.assertEqual(len(gui.buffer), DeadGUI.PROMPT_BLOCK_SIZE)
+
+class DeadGUIInputTest(unittest.TestCase):
+    def setUp(self):
+        self.doupdate = curses.doupdate
+        curses.doupdate = lambda: None
+        self.gui = DeadGUI()
+        self.gui.height, self.gui.width = 24, 80
+        self.gui.stdscr = FakeScreen(24, 80)
+        self.gui.special = {
+            ord('\r') : self.gui.promptExecute,
+            curses.KEY_LEFT : self.gui.promptLeft,
+            ord(curses.ascii.ctrl('R')) : self.gui.promptSearch,
+            ord(curses.ascii.ctrl('H')) : self.gui.promptBackspace
+        }
+        self.executed = []
+        self.gui.onNoExecute = self.executed.append
+
+    def tearDown(self):
+        curses.doupdate = self.doupdate
+
+    def type(self, *keys):
+        for key in keys:
+            if isinstance(key, str):
+                self.gui.stdscr.input.extend(ord(c) for c in key)
+            else:
+                self.gui.stdscr.input.append(key)
+        return self.gui.inputEvent()
+
+    def testBatch(self):
+        self.assertFalse(self.type())
+        self.assertTrue(self.type('helo', curses.KEY_LEFT, 'l', '\r', 'x'))
+        self.assertEqual(self.executed, ['hello'])
+        self.assertEqual(str(self.gui.buffer), 'x')
+
+        # The terminal is updated once for the whole batch
+        self.assertEqual(self.gui.stdscr.refreshes, 1)
+
+    def testPaste(self):
+        self.type(DeadGUI.PASTE_START, 'one\r\ntwo\n\x1bthree',
+            DeadGUI.PASTE_END, '!')
+        self.assertEqual(self.executed, ['one', 'two'])
+        self.assertEqual(str(self.gui.buffer), '\x1bthree!')
+
+    def testPasteEvents(self):
+        eq = DeadEventQueue()
+        self.gui.setEventQueue(eq)
+        self.type(DeadGUI.PASTE_START, 'one\ntwo\nthree\nfour',
+            DeadGUI.PASTE_END)
+        self.assertEqual(self.executed, ['one'])
+
+        # One line per event, the last one is left in the prompt
+        eq.elapseTime()
+        self.assertEqual(self.executed, ['one', 'two'])
+        eq.elapseTime()
+        eq.elapseTime()
+        self.assertEqual(self.executed, ['one', 'two', 'three'])
+        self.assertEqual(str(self.gui.buffer), 'four')
+        self.assertEqual(len(eq), 0)
+
+    def testEscape(self):
+        # Not a paste, the keys read ahead are typed as usual
+        self.type('\x1b[2x')
+        self.assertEqual(str(self.gui.buffer), '[2x')
+        self.assertEqual(self.gui.paste, None)
+
+    def testAltDigit(self):
+        window = self.gui.createWindow('second')
+        self.type('\x1b2')
+        self.assertTrue(self.gui.getCurrentWindow() is window)
+        self.assertEqual(str(self.gui.buffer), '')
+
+    def testSearch(self):
+        for line in ('/join #one', 'hello', '/join #two'):
+            self.type(line, '\r')
+        ctrl_r, ctrl_h = ord(curses.ascii.ctrl('R')), ord(curses.ascii.ctrl('H'))
+        self.type('draft', ctrl_r, 'join')
+        self.assertEqual(str(self.gui.buffer), '/join #two')
+        self.assertEqual(self.gui.prompt, "(search)'join'")
+
+        # Search further back, then for something that is not there
+        self.type(ctrl_r)
+        self.assertEqual(str(self.gui.buffer), '/join #one')
+        self.type('x')
+        self.assertEqual(self.gui.prompt, "(failed search)'joinx'")
+        self.type(ctrl_h)
+        self.assertEqual(self.gui.prompt, "(search)'join'")
+
+        # Escape restores the prompt as it was
+        self.type('\x1b')
+        self.assertEqual(str(self.gui.buffer), 'draft')
+        self.assertEqual(self.gui.prompt, '[Main]')
+
+    def testSearchExecute(self):
+        self.type('hello', '\r')
+        self.type(ord(curses.ascii.ctrl('R')), 'ell', '\r')
+        self.assertEqual(self.executed, ['hello', 'hello'])
+        self.assertEqual(self.gui.isearch, None)
+
+    def testLoadedHistory(self):
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        path = os.path.join(dir, 'history')
+        with open(path, 'w') as f:
+            f.write('stored\n')
+
+        self.type('typed', '\r')
+        store = DeadHistory(path)
+        self.gui.setHistoryStore(store)
+        self.assertEqual([entry.string for entry in self.gui.history],
+            ['stored', 'typed'])
+        self.gui.promptUp()
+        self.assertEqual(str(self.gui.buffer), 'typed')
+        self.gui.promptUp()
+        self.assertEqual(str(self.gui.buffer), 'stored')
+
+class DeadWindowLineIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.window = DeadWindow("test", 100)
+        self.window.setArea(0, 0, 12, 40)
+        for n in xrange(30):
+            text = "message %d " % n + "word " * (n % 4 * 7)
+            self.window.addMessage(DeadMessage(DM_NOTICE, text))
+
+    def heights(self, width = 40):
+        return [message.getRenderSpec(width)
+            for message in self.window.messages]
+
+    def bruteFindLine(self, line):
+        for msg, h in enumerate(self.heights()):
+            if line < h:
+                return msg, line
+            line -= h
+
+    def testLineCount(self):
+        self.assertEqual(self.window.getLineCount(), sum(self.heights()))
+
+    def testFindLine(self):
+        for line in xrange(self.window.getLineCount()):
+            self.assertEqual(self.window.findLine(line),
+                self.bruteFindLine(line))
+
+    def testResize(self):
+        self.window.setArea(0, 0, 12, 60)
+        self.window.finishReflow()
+        self.assertEqual(self.window.getLineCount(), sum(self.heights(60)))
+
+    def testScroll(self):
+        window = self.window
+        bottom = window.getLineCount() - 10
+        self.assertEqual(window.getTopLine(), bottom)
+        window.scrollMessageArea(-3)
+        self.assertEqual(window.getTopLine(), bottom - 3)
+        self.assertEqual(window.scroll, window.findLine(bottom - 3))
+        window.scrollMessageArea(-1000)
+        self.assertEqual(window.getTopLine(), 0)
+
+        # Sticks to the bottom again
+        window.scrollMessageArea(1000)
+        self.assertEqual(window.scroll, None)
+        self.assertEqual(window.getTopLine(), bottom)
+
+    def testScrolledStaysPut(self):
+        window = self.window
+        window.scrollMessageArea(-5)
+        scroll = window.scroll
+        window.addMessage(DeadMessage(DM_NOTICE, "new"))
+        self.assertEqual(window.scroll, scroll)
+
+class DeadWindowReflowTest(unittest.TestCase):
+    def setUp(self):
+        self.window = DeadWindow("test", 1000)
+        for n in xrange(500):
+            text = "message %d " % n + "word " * (n % 5 * 9)
+            self.window.addMessage(DeadMessage(DM_NOTICE, text))
+
+    def checkIndex(self, width):
+        window = self.window
+        first = window.getFirstLine()
+        line = window.lines_end
+        for seq in xrange(window.messages.end - 1, first - 1, -1):
+            line -= window.messages[seq].getRenderSpec(width)
+            self.assertEqual(window.lines[seq], line)
+
+    def testPartial(self):
+        window = self.window
+        window.setArea(0, 0, 12, 40)
+
+        # Only the messages on screen are indexed right away
+        self.assertTrue(window.reflow > window.messages.first)
+        self.assertTrue(window.getLineCount() >= 10)
+        self.checkIndex(40)
+
+        self.assertTrue(window.reflowChunk(10))
+        self.checkIndex(40)
+        window.finishReflow()
+        self.assertEqual(window.getFirstLine(), window.messages.first)
+        self.assertEqual(window.getLineCount(), sum(message.getRenderSpec(40)
+            for message in window.messages))
+        self.checkIndex(40)
+
+    def testScrolled(self):
+        window = self.window
+        window.setArea(0, 0, 12, 40)
+        window.finishReflow()
+        window.scrollMessageArea(-200)
+        msg = window.scroll[0]
+        first = window.messages.first
+        window.scrollToLine(window.lines[msg] - window.lines[first])
+        self.assertEqual(window.scroll, (msg, 0))
+        window.setArea(0, 0, 12, 60)
+
+        # The index reaches up to the message scrolled to
+        self.assertTrue(window.messages.first < window.reflow <= msg)
+        self.assertEqual(window.scroll[0], msg)
+        self.checkIndex(60)
+
+    def testAppendWhileReflowing(self):
+        window = self.window
+        window.setArea(0, 0, 12, 40)
+        window.addMessage(DeadMessage(DM_NOTICE, "word " * 30))
+        window.finishReflow()
+        self.checkIndex(40)
+
+    def testRenderSpecDoesNotWrap(self):
+        message = DeadMessage(DM_NOTICE, "word " * 30)
+        count = message.getRenderSpec(30)
+        self.assertNotEqual(message.wrap_width, 30)
+        self.assertEqual(count, len(message.getWrap(30)) / 3)
+
+    def testNarrowReflow(self):
+        gui = DeadGUI()
+        gui.setEventQueue(DeadEventQueue())
+        self.window.setArea(0, 0, 12, 5)
+        gui.scheduleReflow(self.window)
+        while gui.eq:
+            gui.eq.elapseTime()
+        self.assertEqual(self.window.getFirstLine(),
+            self.window.messages.first)
+        self.checkIndex(5)
+
+    def testReflowEvents(self):
+        chunk = DeadWindow.REFLOW_CHUNK
+        DeadWindow.REFLOW_CHUNK = 50
+        self.addCleanup(setattr, DeadWindow, 'REFLOW_CHUNK', chunk)
+
+        gui = DeadGUI()
+        gui.setEventQueue(DeadEventQueue())
+        self.window.setArea(0, 0, 12, 40)
+        gui.scheduleReflow(self.window)
+        gui.scheduleReflow(self.window)
+        self.assertEqual(len(gui.eq), 1)
+        events = 0
+        while gui.eq:
+            gui.eq.elapseTime()
+            events += 1
+        self.assertEqual(events, 10)
+        self.assertFalse(self.window in gui.reflowing)
+        self.assertEqual(self.window.getFirstLine(),
+            self.window.messages.first)
+        self.checkIndex(40)
+
+class DeadWindowDrawTest(unittest.TestCase):
+    def createWindow(self, height, width = 40):
+        gui = FakeGUI(height, width)
+        window = DeadWindow("test", 100)
+        window.visible = True
+        window.setArea(0, 0, height, width)
+        window.redrawFromScratch(gui)
+        return gui, window
+
+    def addLines(self, window, count):
+        for n in xrange(count):
+            message = DeadMessage(DM_NOTICE, "line %d" % n)
+            message.timestamp = 0
+            window.addMessage(message)
+
+    def assertMatchesRedraw(self, gui, window):
+        window.redrawDamaged(gui)
+        drawn = gui.stdscr.getRows(1, window.height - 1)
+        fresh = FakeGUI(gui.height, gui.width)
+        window.redrawFromScratch(fresh)
+        self.assertEqual(drawn, fresh.stdscr.getRows(1, window.height - 1))
+
+    def testAppendToEmpty(self):
+        gui, window = self.createWindow(12)
+        self.addLines(window, 3)
+        self.assertMatchesRedraw(gui, window)
+
+    def testAppendScrolls(self):
+        gui, window = self.createWindow(12)
+        self.addLines(window, 10)
+        window.redrawDamaged(gui)
+        self.addLines(window, 4)
+        self.assertMatchesRedraw(gui, window)
+
+    def testAppendOverflowsPartlyFilled(self):
+        # 5 lines on screen, followed by more lines than there are rows
+        gui, window = self.createWindow(12)
+        self.addLines(window, 5)
+        window.redrawDamaged(gui)
+        self.addLines(window, 12)
+        self.assertMatchesRedraw(gui, window)
+
+    def testAppendFillsPartlyFilled(self):
+        gui, window = self.createWindow(12)
+        self.addLines(window, 5)
+        window.redrawDamaged(gui)
+        self.addLines(window, 7)
+        self.assertMatchesRedraw(gui, window)
+
+class DeadGUIRenderTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.monotonic = events.monotonic
+        events.monotonic = lambda: self.now
+        guimodule.monotonic = lambda: self.now
+        self.gui = DeadGUI()
+        self.frames = 0
+        self.gui.redrawDamaged = self.redrawDamaged
+
+    def tearDown(self):
+        events.monotonic = self.monotonic
+        guimodule.monotonic = self.monotonic
+
+    def redrawDamaged(self):
+        self.frames += 1
+        return False
+
+    def testImmediate(self):
+        self.assertTrue(self.gui.scheduleRender())
+        self.assertEqual(self.frames, 1)
+
+    def testCoalesce(self):
+        eq = DeadEventQueue()
+        self.gui.setEventQueue(eq)
+        self.assertTrue(self.gui.scheduleRender())
+        self.assertFalse(self.gui.scheduleRender())
+        self.assertFalse(self.gui.scheduleRender())
+        self.assertEqual(len(eq), 1)
+        self.assertEqual(self.frames, 0)
+
+        eq.elapseTime()
+        self.assertEqual(self.frames, 1)
+        self.assertFalse(self.gui.render_pending)
+
+    def testRate(self):
+        eq = DeadEventQueue()
+        self.gui.setEventQueue(eq)
+        self.gui.scheduleRender()
+        eq.elapseTime()
+
+        # The next frame waits out the rest of the frame interval
+        self.assertTrue(self.gui.scheduleRender())
+        timeout = eq.getTimeout()
+        self.assertAlmostEqual(timeout, 1.0 / DeadGUI.RENDER_RATE)
+        eq.elapseTime()
+        self.assertEqual(self.frames, 1)
+        self.now += timeout
+        eq.elapseTime()
+        self.assertEqual(self.frames, 2)
+
+class DeadGUIWindowsTest(unittest.TestCase):
+    def setUp(self):
+        self.gui = DeadGUI()
+
+        # Not shown, only the prompt needs the size of the terminal
+        self.gui.height, self.gui.width = 24, 80
+        self.windows = [self.gui.createWindow(name) for name in 'abc']
+
+    def testSwitch(self):
+        self.gui.windowCall('3')
+        self.assertTrue(self.gui.getCurrentWindow() is self.windows[1])
+        self.gui.windowCall('c')
+        self.assertTrue(self.gui.getCurrentWindow() is self.windows[2])
+        self.assertTrue(self.windows[2].visible)
+        self.assertFalse(self.windows[1].visible)
+
+    def testActivity(self):
+        self.windows[1].addNotice("hidden")
+        self.assertEqual(self.gui.getActivity(), [(3, ACTIVITY_TEXT)])
+        self.gui.setCurrentWindow(self.windows[1])
+        self.assertEqual(self.gui.getActivity(), [])
+
+    def testRemoveCurrent(self):
+        self.gui.setCurrentWindow(self.windows[1])
+        self.assertTrue(self.gui.removeWindow(self.windows[1]))
+        self.assertTrue(self.gui.getCurrentWindow() is self.windows[0])
+        self.assertEqual(len(self.gui.windows), 3)
+
+    def testRemoveOther(self):
+        self.gui.setCurrentWindow(self.windows[2])
+        self.gui.removeWindow(self.windows[0])
+        self.assertTrue(self.gui.getCurrentWindow() is self.windows[2])
+        self.windows[1].addNotice("hidden")
+        self.assertEqual(self.gui.getActivity(), [(2, ACTIVITY_TEXT)])
+
+    def testRemoveMain(self):
+        self.assertFalse(self.gui.removeWindow(self.gui.getMainWindow()))
+
+if __name__ == '__main__':
+    unittest.main()
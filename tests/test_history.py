@@ -0,0 +1,129 @@
+# Deadline prompt history tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+import events
+from events import DeadEventQueue
+from history import DeadHistory
+
+class DeadHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'history')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def testMemory(self):
+        store = DeadHistory()
+        store.append('one')
+        store.append('two\nlines')
+        self.assertEqual(store.lines, ['one', 'two lines'])
+        loaded = []
+        store.load(loaded.append)
+        self.assertEqual(loaded, [[]])
+
+    def testFlush(self):
+        store = DeadHistory(self.path)
+        store.load()
+        store.append('one')
+        store.append('two')
+        self.assertEqual(self.read(), 'one\ntwo\n')
+
+    def testScheduledFlush(self):
+        now = [1000.0]
+        monotonic = events.monotonic
+        events.monotonic = lambda: now[0]
+        self.addCleanup(setattr, events, 'monotonic', monotonic)
+
+        eq = DeadEventQueue()
+        store = DeadHistory(self.path, eq)
+        store.load()
+        store.append('one')
+        store.append('two')
+        self.assertEqual(len(eq), 1)
+        self.assertFalse(os.path.exists(self.path))
+        now[0] += DeadHistory.FLUSH_INTERVAL
+        eq.elapseTime()
+        self.assertEqual(self.read(), 'one\ntwo\n')
+
+        store.append('three')
+        store.close()
+        self.assertEqual(len(eq), 0)
+        self.assertEqual(self.read(), 'one\ntwo\nthree\n')
+
+    def testLoad(self):
+        with open(self.path, 'w') as f:
+            f.write(''.join('line %d\n' % n for n in xrange(25)))
+
+        chunk = DeadHistory.LOAD_CHUNK
+        DeadHistory.LOAD_CHUNK = 10
+        self.addCleanup(setattr, DeadHistory, 'LOAD_CHUNK', chunk)
+
+        eq = DeadEventQueue()
+        store = DeadHistory(self.path, eq)
+        loaded = []
+        store.load(loaded.append)
+
+        # Read in chunks, lines executed meanwhile go after the file
+        self.assertEqual(len(store), 10)
+        store.append('early')
+        while not loaded:
+            eq.elapseTime()
+        self.assertEqual(loaded[0], ['line %d' % n for n in xrange(25)])
+        self.assertEqual(store.lines[-1], 'early')
+        self.assertEqual(store.search('early'), 25)
+        store.close()
+        self.assertEqual(self.read().splitlines()[-1], 'early')
+
+    def testAppendBeforeLoad(self):
+        with open(self.path, 'w') as f:
+            f.write('stored\n')
+        store = DeadHistory(self.path)
+        store.append('typed')
+        loaded = []
+        store.load(loaded.append)
+
+        # Written after reading the file, so it is not read back
+        self.assertEqual(loaded, [['stored']])
+        self.assertEqual(store.lines, ['stored', 'typed'])
+        self.assertEqual(self.read(), 'stored\ntyped\n')
+
+    def testMissingFile(self):
+        store = DeadHistory(self.path)
+        loaded = []
+        store.load(loaded.append)
+        self.assertEqual(loaded, [[]])
+        self.assertTrue(store.loaded)
+
+    def testSearch(self):
+        store = DeadHistory()
+        for line in ('/connect irc.example.org', '/join #deadline',
+                'hello', '/join #other', 'say hello'):
+            store.append(line)
+        self.assertEqual(store.search('/join'), 3)
+        self.assertEqual(store.search('/join', 3), 1)
+        self.assertEqual(store.search('/join', 1), None)
+        self.assertEqual(store.search('hello'), 4)
+        self.assertEqual(store.search('hello', 4), 2)
+        self.assertEqual(store.search('nothing'), None)
+
+    def testShortQuery(self):
+        store = DeadHistory()
+        for line in ('ab', 'x', 'abc'):
+            store.append(line)
+        self.assertEqual(store.search('ab'), 2)
+        self.assertEqual(store.search('ab', 2), 0)
+        self.assertEqual(store.search(''), 2)
+        self.assertEqual(store.search('q'), None)
@@ -0,0 +1,324 @@
+# Deadline IRC library tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+import irc
+from irc import YeOldeIRCClient, YeOldeSendQueue, YeOldeLineBuffer, \
+    parseMessage, parseTags, unescapeTag, SEND_URGENT, SEND_NORMAL, SEND_BULK
+from events import DeadEventQueue
+from aio import asyncio
+
+class FakeMuxer(object):
+    """
+        Records the calls clients make to the application.
+    """
+
+    def __init__(self, accept = True):
+        self.eq = DeadEventQueue()
+        self.accept = accept
+        self.pool = None
+        self.calls = []
+
+    def clientConnected(self, client):
+        self.calls.append(('connected', client))
+        return self.accept
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name,) + args)
+
+def createClient(muxer):
+    # Leaves the socket itself alone, sent data is only recorded
+    client = YeOldeIRCClient.__new__(YeOldeIRCClient)
+    client.muxer = muxer
+    client.sent = []
+    client.send = client.sent.append
+    client.close = lambda: client.sent.append(None)
+    client.network = 'test'
+    return client
+
+class ParseMessageTest(unittest.TestCase):
+    def testCommand(self):
+        msg = parseMessage('ping')
+        self.assertEqual((msg.command, msg.params, msg.prefix, msg.tags),
+            ('PING', [], None, None))
+
+    def testParams(self):
+        msg = parseMessage(':nick!user@host PRIVMSG #chan :hello :world ')
+        self.assertEqual(msg.prefix, 'nick!user@host')
+        self.assertEqual(msg.getNick(), 'nick')
+        self.assertEqual(msg.command, 'PRIVMSG')
+        self.assertEqual(msg.params, ['#chan', 'hello :world '])
+
+    def testMiddleParams(self):
+        msg = parseMessage(':server  005  me  PREFIX=(ov)@+ :are supported')
+        self.assertEqual(msg.command, '005')
+        self.assertEqual(msg.params, ['me', 'PREFIX=(ov)@+', 'are supported'])
+
+    def testEmptyTrailing(self):
+        self.assertEqual(parseMessage('TOPIC #chan :').params, ['#chan', ''])
+
+    def testTags(self):
+        msg = parseMessage('@id=1;a\\sb=x\\:y\\s;flag :n PING :t')
+        self.assertEqual(msg.tags, {'id' : '1', 'a\\sb' : 'x;y ',
+            'flag' : ''})
+        self.assertEqual((msg.prefix, msg.command, msg.params),
+            ('n', 'PING', ['t']))
+
+    def testInvalid(self):
+        for line in ('', ':prefix', '@tags', ':prefix ', '@a=b :prefix',
+                ' PING', ' :trailing', '   '):
+            self.assertEqual(parseMessage(line), None)
+
+    def testUnescape(self):
+        self.assertEqual(unescapeTag('plain'), 'plain')
+        self.assertEqual(unescapeTag('a\\r\\n\\\\b'), 'a\r\n\\b')
+
+        # Unknown escapes drop the backslash, a trailing one is dropped
+        self.assertEqual(unescapeTag('\\xy\\'), 'xy')
+
+    def testParseTags(self):
+        self.assertEqual(parseTags('a=1;;b;c='), {'a' : '1', 'b' : '',
+            'c' : ''})
+
+class YeOldeLineBufferTest(unittest.TestCase):
+    def testLines(self):
+        lines = YeOldeLineBuffer()
+        lines.feed('PING :a\r\nPING :b\nPI')
+        self.assertEqual(list(lines), ['PING :a', 'PING :b'])
+        self.assertEqual(lines.readLine(), None)
+
+        # The partial line is completed by the next read
+        lines.feed('NG :c\r')
+        self.assertEqual(list(lines), [])
+        lines.feed('\n')
+        self.assertEqual(list(lines), ['PING :c'])
+
+    def testEmpty(self):
+        lines = YeOldeLineBuffer()
+        lines.feed('\r\n\n')
+        self.assertEqual(list(lines), ['', ''])
+
+    def testCompact(self):
+        lines = YeOldeLineBuffer()
+        lines.feed('a\nb')
+        self.assertEqual(list(lines), ['a'])
+        lines.feed('c\n')
+        self.assertEqual(str(lines.buffer), 'bc\n')
+        self.assertEqual(list(lines), ['bc'])
+
+    def testTooLong(self):
+        lines = YeOldeLineBuffer(maxlength = 8)
+        lines.feed('123456789\nok\n')
+        self.assertEqual(list(lines), ['ok'])
+        self.assertEqual(lines.overflows, 1)
+
+        # CRLF does not count towards the length
+        lines.feed('12345678\r\n')
+        self.assertEqual(list(lines), ['12345678'])
+
+    def testTooLongPartial(self):
+        lines = YeOldeLineBuffer(maxlength = 8)
+        lines.feed('123456789')
+        self.assertEqual(list(lines), [])
+        self.assertEqual(len(lines.buffer) - lines.offset, 0)
+
+        # The rest of the line is skipped as well
+        lines.feed('abc\nok\n')
+        self.assertEqual(list(lines), ['ok'])
+        self.assertEqual(lines.overflows, 1)
+
+class YeOldeSendQueueTest(unittest.TestCase):
+    def createQueue(self):
+        queue = YeOldeSendQueue(rate = 0.5, burst = 5.0)
+        queue.stamp = 0.0
+        return queue
+
+    def testBurst(self):
+        queue = self.createQueue()
+        for n in xrange(8):
+            queue.push(n)
+        self.assertEqual([queue.pop(0.0) for n in xrange(6)],
+            [0, 1, 2, 3, 4, None])
+        self.assertEqual(queue.delay(0.0), 2.0)
+        self.assertEqual(queue.pop(2.0), 5)
+
+    def testPriorities(self):
+        queue = self.createQueue()
+        queue.push('bulk', SEND_BULK)
+        queue.push('normal', SEND_NORMAL)
+        queue.push('urgent', SEND_URGENT)
+        self.assertEqual([queue.pop(0.0) for n in xrange(3)],
+            ['urgent', 'normal', 'bulk'])
+
+    def testUrgentWhenEmpty(self):
+        queue = self.createQueue()
+        for n in xrange(5):
+            queue.push(n)
+            queue.pop(0.0)
+        queue.push('pong', SEND_URGENT)
+        self.assertEqual(queue.pop(0.0), 'pong')
+
+    def testUrgentBurstDoesNotStall(self):
+        queue = self.createQueue()
+        for n in xrange(50):
+            queue.push(n, SEND_URGENT)
+        self.assertEqual(len([queue.pop(0.0) for n in xrange(50)]), 50)
+        self.assertEqual(queue.tokens, 0.0)
+
+        # Normal traffic only waits for a single token
+        queue.push('privmsg', SEND_BULK)
+        self.assertEqual(queue.delay(0.0), 2.0)
+        self.assertEqual(queue.pop(2.0), 'privmsg')
+
+class YeOldeIRCClientTest(unittest.TestCase):
+    def testConnect(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        self.assertEqual(muxer.calls[0], ('connected', client))
+        self.assertEqual(client.sent[:2],
+            ['USER deadline * 8: Deadline IRC\r\n', 'NICK hoi\r\n'])
+
+    def testConnectRefused(self):
+        muxer = FakeMuxer(False)
+        client = createClient(muxer)
+        client.onConnect()
+        self.assertEqual(client.sent, [])
+
+    def testDispatch(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        self.assertEqual(client.dispatch['PRIVMSG'], client.onPRIVMSG)
+        self.assertEqual(client.dispatch['001'], client.on001)
+        self.assertFalse('Message' in client.dispatch)
+        self.assertFalse('Connect' in client.dispatch)
+
+    def testRegisterHandler(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        received = []
+        client.registerHandler('privmsg', received.append)
+        client.onRecv(':n PRIVMSG #chan :hi\r\n:n WHATEVER x\r\n')
+        self.assertEqual([msg.params for msg in received], [['#chan', 'hi']])
+        self.assertFalse([call for call in muxer.calls
+            if call[0] == 'clientMessage'])
+
+    def testPing(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        del client.sent[:], muxer.calls[:]
+        client.onRecv('PING :server.example\r\n')
+        self.assertEqual(client.sent, ['PONG :server.example\r\n'])
+        self.assertFalse([call for call in muxer.calls
+            if call[0] in ('debugRecvRaw', 'debugSendRaw')])
+
+    def testLag(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        del client.sent[:]
+        client.sendLagProbe()
+        token = client.lag_token
+        self.assertEqual(client.sent, ['PING :%s\r\n' % token])
+        self.assertEqual(len(muxer.eq), 1)
+
+        # Unrelated PONGs are ignored
+        client.onRecv(':server PONG server :other\r\n')
+        self.assertEqual(client.lag, None)
+        client.onRecv(':server PONG server :%s\r\n' % token)
+        self.assertTrue(client.lag >= 0.0)
+        self.assertEqual(client.lag_token, None)
+        self.assertEqual(muxer.calls[-1], ('updateLag', client, client.lag))
+
+    def testLagUnanswered(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        client.sendLagProbe()
+        client.lag_sent -= 10.0
+        del client.sent[:]
+
+        # No new probe while the old one is outstanding
+        client.sendLagProbe()
+        self.assertEqual(client.sent, [])
+        self.assertTrue(client.lag >= 10.0)
+
+    def testClock(self):
+        # Lag and send rate follow the monotonic clock, not the wall clock
+        now = [100.0]
+        monotonic = irc.monotonic
+        irc.monotonic = lambda: now[0]
+        self.addCleanup(setattr, irc, 'monotonic', monotonic)
+        wallclock = time.time
+        time.time = lambda: 0.0
+        self.addCleanup(setattr, time, 'time', wallclock)
+
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        client.sendLagProbe()
+        now[0] += 0.25
+        client.onRecv(':server PONG server :%s\r\n' % client.lag_token)
+        self.assertEqual(client.lag, 0.25)
+
+        del client.sent[:]
+        for n in xrange(10):
+            client.sendRaw('PRIVMSG #chan :%d' % n)
+        sent = len(client.sent)
+        now[0] += 2.0
+        client.flushSendQueue()
+        self.assertEqual(len(client.sent), sent + 1)
+
+    def testHandlerResult(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        client.registerHandler('TEST', lambda msg: True)
+        client.onMessage(parseMessage('TEST'))
+        self.assertFalse([call for call in muxer.calls
+            if call[0] == 'runCoroutine'])
+
+    @unittest.skipIf(asyncio is None, "requires asyncio or trollius")
+    def testHandlerCoroutine(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+
+        @asyncio.coroutine
+        def handler(msg):
+            yield
+
+        client.registerHandler('TEST', handler)
+        client.onMessage(parseMessage('TEST'))
+        calls = [call for call in muxer.calls if call[0] == 'runCoroutine']
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(asyncio.iscoroutine(calls[0][1]))
+        calls[0][1].close()
+
+    def testChannelEvents(self):
+        muxer = FakeMuxer()
+        client = createClient(muxer)
+        client.onConnect()
+        for line in (':a!u@h PART #chan :bye', ':a!u@h PART #chan',
+                ':op!u@h KICK #chan b :flood', ':op!u@h TOPIC #chan :news',
+                ':op!u@h NOTICE #chan :hi', ':op!u@h NOTICE hoi :private'):
+            client.onMessage(parseMessage(line))
+        self.assertEqual([call[2:] for call in muxer.calls
+            if call[0] == 'clientEvent'], [
+            ('#chan', "a has left #chan (bye)"),
+            ('#chan', "a has left #chan"),
+            ('#chan', "b was kicked by op (flood)"),
+            ('#chan', "op changed the topic to: news"),
+            ('#chan', "-op- hi")])
+
+if __name__ == '__main__':
+    unittest.main()
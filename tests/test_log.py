@@ -0,0 +1,253 @@
+# Deadline scrollback log tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import unittest
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+import events
+from log import DeadLog, DeadLogWriter, RECORD
+from events import DeadEventQueue
+from gui import DeadWindow, DeadMessage, DM_NOTICE
+
+class DeadLogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testAppend(self):
+        log = DeadLog(self.path)
+        self.assertEqual(log.append(1.0, DM_NOTICE, 'one'), 0)
+        self.assertEqual(log.append(2.0, DM_NOTICE, ''), 1)
+        self.assertEqual(log.get(0), (1.0, DM_NOTICE, 'one'))
+        log.flush()
+        self.assertEqual(log.append(3.0, DM_NOTICE, 'three'), 2)
+        self.assertEqual([log.get(seq) for seq in xrange(3)],
+            [(1.0, DM_NOTICE, 'one'), (2.0, DM_NOTICE, ''),
+            (3.0, DM_NOTICE, 'three')])
+        self.assertRaises(IndexError, log.get, 3)
+        self.assertRaises(IndexError, log.get, -1)
+        log.close()
+
+    def testClosed(self):
+        log = DeadLog(self.path)
+        log.append(0, DM_NOTICE, 'a')
+        log.close()
+        log.close()
+        self.assertRaises(ValueError, log.get, 0)
+
+    def testReopen(self):
+        log = DeadLog(self.path)
+        for n in xrange(10):
+            log.append(n, DM_NOTICE, 'message %d' % n)
+        log.close()
+
+        log = DeadLog(self.path)
+        self.assertEqual(len(log), 10)
+        self.assertEqual(log.get(9), (9.0, DM_NOTICE, 'message 9'))
+        log.append(10, DM_NOTICE, 'message 10')
+        log.flush()
+        self.assertEqual(log.get(10), (10.0, DM_NOTICE, 'message 10'))
+        log.close()
+
+    def testTornIndex(self):
+        log = DeadLog(self.path)
+        log.append(0, DM_NOTICE, 'kept')
+        log.close()
+
+        # A record without its data, followed by half a record
+        with open(self.path + '.idx', 'ab') as f:
+            f.write(RECORD.pack(4, 100, 1.0, DM_NOTICE))
+            f.write('\0' * (RECORD.size / 2))
+        log = DeadLog(self.path)
+        self.assertEqual(len(log), 1)
+        self.assertEqual(os.path.getsize(self.path + '.idx'), RECORD.size)
+        self.assertEqual(log.append(1, DM_NOTICE, 'new'), 1)
+        log.flush()
+        self.assertEqual(log.get(1), (1.0, DM_NOTICE, 'new'))
+        log.close()
+
+    def testScheduledFlush(self):
+        now = [1000.0]
+        monotonic = events.monotonic
+        events.monotonic = lambda: now[0]
+        self.addCleanup(setattr, events, 'monotonic', monotonic)
+
+        eq = DeadEventQueue()
+        log = DeadLog(self.path, eq)
+        log.append(0, DM_NOTICE, 'a')
+        log.append(1, DM_NOTICE, 'b')
+        self.assertEqual(len(eq), 1)
+        self.assertEqual(os.path.getsize(self.path + '.log'), 0)
+        now[0] += DeadLog.FLUSH_INTERVAL
+        eq.elapseTime()
+        self.assertEqual(os.path.getsize(self.path + '.log'), 2)
+
+        log.append(2, DM_NOTICE, 'c')
+        log.close()
+        self.assertEqual(len(eq), 0)
+        self.assertEqual(os.path.getsize(self.path + '.log'), 3)
+
+class FakeMuxer(object):
+    def addReader(self, reader):
+        self.reader = reader
+
+class DeadLogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test')
+        now = [1000.0]
+        monotonic = events.monotonic
+        events.monotonic = lambda: now[0]
+        self.addCleanup(setattr, events, 'monotonic', monotonic)
+        self.now = now
+
+        self.muxer = FakeMuxer()
+        self.writer = DeadLogWriter(self.muxer)
+        self.eq = DeadEventQueue()
+        self.log = DeadLog(self.path, self.eq, self.writer)
+
+    def tearDown(self):
+        self.log.close()
+        self.writer.close()
+        self.muxer.reader.close()
+        shutil.rmtree(self.dir)
+
+    def elapse(self):
+        self.now[0] += DeadLog.FLUSH_INTERVAL
+        self.eq.elapseTime()
+
+    def waitWritten(self):
+        while self.log.writing is not None:
+            self.muxer.reader.handleRead()
+            if self.log.writing is not None:
+                threading.Event().wait(0.01)
+
+    def testFlush(self):
+        # Writing from the loop thread would block it on fsync
+        writes = []
+        writeLocked = self.log.writeLocked
+        def record(batch):
+            writes.append(threading.current_thread())
+            writeLocked(batch)
+        self.log.writeLocked = record
+
+        self.log.append(0, DM_NOTICE, 'a')
+        self.log.append(1, DM_NOTICE, 'b')
+        self.elapse()
+        self.assertEqual(len(self.eq), 0)
+
+        # Messages being written are still served, and new ones go after
+        self.assertEqual(self.log.get(1), (1.0, DM_NOTICE, 'b'))
+        self.assertEqual(self.log.append(2, DM_NOTICE, 'c'), 2)
+        self.waitWritten()
+        self.assertEqual(self.log.count, 2)
+        self.assertEqual(os.path.getsize(self.path + '.log'), 2)
+        self.assertEqual(writes, [self.writer.worker])
+        self.assertEqual([self.log.get(seq)[2] for seq in xrange(3)],
+            ['a', 'b', 'c'])
+
+        # The rest follows with the next flush
+        self.assertEqual(len(self.eq), 1)
+        self.elapse()
+        self.waitWritten()
+        self.assertEqual(self.log.count, 3)
+        self.assertEqual(writes, [self.writer.worker] * 2)
+
+    def testCloseWhileWriting(self):
+        # Hold the writer off, close writes the batch itself
+        self.log.append(0, DM_NOTICE, 'a')
+        with self.log.lock:
+            self.elapse()
+            self.log.append(1, DM_NOTICE, 'b')
+        self.log.close()
+        self.assertEqual(os.path.getsize(self.path + '.log'), 2)
+
+        # The late completion is ignored
+        self.writer.close()
+        self.muxer.reader.handleRead()
+        self.log = DeadLog(self.path)
+        self.assertEqual([self.log.get(seq)[2] for seq in xrange(2)],
+            ['a', 'b'])
+
+    def testError(self):
+        class FullFile(object):
+            def __init__(self, f):
+                self.f = f
+            def write(self, data):
+                raise IOError(errno.ENOSPC, 'No space left on device')
+            def __getattr__(self, name):
+                return getattr(self.f, name)
+
+        self.log.append(0, DM_NOTICE, 'a')
+        data = self.log.data
+        self.log.data = FullFile(data)
+        self.elapse()
+        self.waitWritten()
+
+        # Kept pending, to be written again
+        self.assertEqual(self.log.count, 0)
+        self.assertEqual(self.log.get(0), (0.0, DM_NOTICE, 'a'))
+        self.log.data = data
+        self.assertEqual(len(self.eq), 1)
+        self.elapse()
+        self.waitWritten()
+        self.assertEqual(self.log.count, 1)
+        self.assertEqual(self.log.get(0), (0.0, DM_NOTICE, 'a'))
+
+class DeadWindowHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = DeadLog(os.path.join(self.dir, 'test'))
+        self.log.append(0, DM_NOTICE, 'before')
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.dir)
+
+    def testNumbering(self):
+        window = DeadWindow("test", 5, self.log)
+        window.addMessage(DeadMessage(DM_NOTICE, "message"))
+        self.assertEqual(window.messages.first, 1)
+        self.assertEqual(self.log.get(1)[2], "message")
+
+    def testPaging(self):
+        window = DeadWindow("test", 5, self.log)
+        window.setArea(0, 0, 5, 40)
+        for n in xrange(20):
+            window.addMessage(DeadMessage(DM_NOTICE, "message %d" % n))
+        self.assertEqual(window.messages.first, 16)
+        self.assertFalse(window.inHistory())
+
+        # Scroll past the messages in memory, up to the first logged one
+        window.scrollMessageArea(-10)
+        self.assertTrue(window.inHistory())
+        self.assertEqual(window.scroll, (8, 0))
+        self.assertEqual(window.getMessage(8).content, "message 7")
+        window.scrollMessageArea(-100)
+        self.assertEqual(window.scroll, (0, 0))
+        self.assertEqual(window.getMessage(0).content, "before")
+
+        # And back down again
+        window.scrollMessageArea(100)
+        self.assertFalse(window.inHistory())
+        self.assertEqual(window.scroll, None)
+
+    def testPageCache(self):
+        window = DeadWindow("test", 5, self.log)
+        for n in xrange(DeadWindow.PAGE_CACHE_SIZE + 10):
+            window.addMessage(DeadMessage(DM_NOTICE, "message %d" % n))
+        self.log.flush()
+        for seq in xrange(window.messages.first):
+            self.assertEqual(window.getMessage(seq).content,
+                self.log.get(seq)[2])
+        self.assertTrue(len(window.paged) <= DeadWindow.PAGE_CACHE_SIZE)
@@ -0,0 +1,173 @@
+# Deadline readiness backend and multiplexer tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import socket
+import unittest
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from poller import DeadPoller, DeadMultiplexer, POLLERS, POLL_READ, \
+    POLL_WRITE, createPoller, milliseconds, polledSocket
+from events import DeferredCall
+
+def backends():
+    for name in sorted(POLLERS):
+        try:
+            yield createPoller(name)
+        except AttributeError:
+            # Not available on this platform
+            pass
+
+class DeadPollerTest(unittest.TestCase):
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def testAbstract(self):
+        self.assertRaises(TypeError, DeadPoller)
+
+    def testMilliseconds(self):
+        self.assertEqual(milliseconds(0), 0)
+        self.assertEqual(milliseconds(0.0001), 1)
+        self.assertEqual(milliseconds(0.25), 250)
+
+    def testReadiness(self):
+        for poller in backends():
+            poller.update(self.rfd, POLL_READ)
+            poller.update(self.wfd, POLL_WRITE)
+            self.assertEqual(poller.poll(0), [(self.wfd, POLL_WRITE)])
+            os.write(self.wfd, 'x')
+            self.assertEqual(sorted(poller.poll(0)),
+                [(self.rfd, POLL_READ), (self.wfd, POLL_WRITE)])
+            os.read(self.rfd, 1)
+            poller.update(self.wfd, 0)
+            self.assertEqual(poller.poll(0.001), [])
+            self.assertEqual(len(poller), 1)
+            poller.close()
+
+    def testShortTimeoutWaits(self):
+        for poller in backends():
+            poller.update(self.rfd, POLL_READ)
+            start = time()
+            poller.poll(0.0005)
+            self.assertTrue(time() - start >= 0.0004)
+            poller.close()
+
+    def testInterestChanges(self):
+        for poller in backends():
+            changes = [poller.update(self.rfd, events) for events in
+                (POLL_READ, POLL_READ, POLL_READ | POLL_WRITE,
+                POLL_READ | POLL_WRITE, 0, 0)]
+            self.assertEqual(changes, [True, False, True, False, True, False])
+            poller.close()
+
+class Client(object):
+    """
+        ManagedSocket subclass stand-in, reporting to the multiplexer.
+    """
+
+    def onConnect(self):
+        self.muxer.events.append('connect')
+
+    def onRecv(self, data):
+        self.muxer.events.append(data)
+
+    def onDisconnect(self):
+        self.muxer.events.append('disconnect')
+
+class Multiplexer(DeadMultiplexer):
+    def __init__(self, backend):
+        DeadMultiplexer.__init__(self, polledSocket(Client), backend)
+        self.events = []
+
+    def onConnectError(self, sock, error):
+        self.events.append('error')
+
+    def runUntil(self, done, timeout = 2.0):
+        # Never waits forever, even without ready descriptors
+        eid = self.eq.scheduleEvent(DeferredCall(timeout, lambda: None))
+        start = time()
+        while not done() and time() - start < timeout:
+            self.runOnce()
+        self.eq.cancelEvent(eid)
+        return done()
+
+class DeadMultiplexerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+
+    def testConnection(self):
+        for name in sorted(POLLERS):
+            muxer = Multiplexer(name)
+            client = muxer.connect('127.0.0.1', self.port)
+            conn, _ = self.server.accept()
+            self.assertTrue(muxer.runUntil(lambda: muxer.events))
+            self.assertEqual(muxer.events, ['connect'])
+
+            client.send('hello')
+            self.assertTrue(muxer.runUntil(lambda: not client.outgoing))
+            self.assertEqual(conn.recv(5), 'hello')
+            self.assertEqual(len(muxer.poller), 1)
+
+            conn.send('world')
+            self.assertTrue(muxer.runUntil(lambda: len(muxer.events) > 1))
+            self.assertEqual(muxer.events[1], 'world')
+
+            conn.close()
+            self.assertTrue(muxer.runUntil(lambda: len(muxer.events) > 2))
+            self.assertEqual(muxer.events[2], 'disconnect')
+            self.assertEqual(len(muxer.poller), 0)
+
+    def testConnectionIPv6(self):
+        try:
+            server = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+            server.bind(('::1', 0))
+        except socket.error:
+            # No IPv6 here
+            return
+        server.listen(1)
+        muxer = Multiplexer(None)
+        muxer.connect('::1', server.getsockname()[1])
+        conn, _ = server.accept()
+        self.assertTrue(muxer.runUntil(lambda: muxer.events))
+        self.assertEqual(muxer.events, ['connect'])
+        conn.close()
+        server.close()
+
+    def testConnectError(self):
+        self.server.close()
+        muxer = Multiplexer(None)
+        try:
+            muxer.connect('127.0.0.1', self.port)
+        except socket.error:
+            # Refused right away
+            return
+        self.assertTrue(muxer.runUntil(lambda: muxer.events))
+        self.assertEqual(muxer.events, ['error'])
+        self.assertEqual(len(muxer.poller), 0)
+
+    def testEventTimeout(self):
+        muxer = Multiplexer(None)
+        fired = []
+        muxer.eq.scheduleEvent(DeferredCall(0.05, lambda: fired.append(1)))
+        start = time()
+
+        # Waits until the event is due
+        muxer.runOnce()
+        self.assertEqual(fired, [1])
+        self.assertTrue(time() - start < 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Deadline worker pool tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+from threading import Event
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from pool import DeadWorkerPool, futures
+from poller import DeadMultiplexer
+from events import DeferredCall
+
+def double(n):
+    return n * 2
+
+def fail():
+    raise ValueError("failed")
+
+@unittest.skipIf(futures is None, "requires concurrent.futures")
+class DeadWorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.muxer = DeadMultiplexer(None)
+        self.pool = DeadWorkerPool(self.muxer, workers = 1, maxpending = 2)
+        self.results = []
+        self.started = Event()
+        self.release = Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.close()
+
+    def callback(self, result, error):
+        self.results.append((result, error))
+
+    def block(self):
+        self.started.set()
+        self.release.wait(5.0)
+        return 'late'
+
+    def runUntil(self, done, timeout = 5.0):
+        eid = self.muxer.eq.scheduleEvent(DeferredCall(timeout, lambda: None))
+        start = time()
+        while not done() and time() - start < timeout:
+            self.muxer.runOnce()
+        self.muxer.eq.cancelEvent(eid)
+        return done()
+
+    def testResult(self):
+        self.pool.submit(double, (21,), self.callback)
+        self.assertTrue(self.runUntil(lambda: self.results))
+        self.assertEqual(self.results, [(42, None)])
+        self.assertEqual(len(self.pool), 0)
+
+    def testError(self):
+        self.pool.submit(fail, (), self.callback)
+        self.assertTrue(self.runUntil(lambda: self.results))
+        self.assertTrue(isinstance(self.results[0][1], ValueError))
+
+    def testFull(self):
+        self.assertNotEqual(self.pool.submit(self.block), None)
+        self.assertNotEqual(self.pool.submit(self.block), None)
+        self.assertEqual(self.pool.submit(self.block), None)
+
+    def testCancelQueued(self):
+        self.pool.submit(self.block)
+        jid = self.pool.submit(double, (1,), self.callback)
+        self.assertTrue(self.pool.cancel(jid))
+        self.assertTrue(isinstance(self.results[0][1],
+            futures.CancelledError))
+        self.assertEqual(len(self.pool), 1)
+
+    def testTimeoutKeepsRunningJobCounted(self):
+        self.pool.submit(self.block, (), self.callback, timeout = 0.01)
+        self.assertTrue(self.started.wait(5.0))
+        self.assertTrue(self.runUntil(lambda: self.results))
+        self.assertTrue(isinstance(self.results[0][1], futures.TimeoutError))
+
+        # The worker is still busy, so the job still counts
+        self.assertEqual(len(self.pool), 1)
+        self.pool.submit(self.block)
+        self.assertTrue(self.pool.isFull())
+
+        # Its result is discarded once it finishes
+        self.release.set()
+        self.assertTrue(self.runUntil(lambda: len(self.pool) == 0))
+        self.assertEqual(len(self.results), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# Deadline host name resolver tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import socket
+import unittest
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from resolver import DeadResolver
+from poller import DeadMultiplexer
+from events import DeferredCall
+
+class DeadResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.muxer = DeadMultiplexer(None)
+        self.resolver = DeadResolver(self.muxer)
+        self.results = []
+
+    def tearDown(self):
+        self.resolver.close()
+
+    def callback(self, addresses, error, tag = None):
+        self.results.append((addresses, error, tag))
+
+    def runUntil(self, count, timeout = 5.0):
+        eid = self.muxer.eq.scheduleEvent(DeferredCall(timeout, lambda: None))
+        start = time()
+        while len(self.results) < count and time() - start < timeout:
+            self.muxer.runOnce()
+        self.muxer.eq.cancelEvent(eid)
+
+    def testResolve(self):
+        self.resolver.resolve('127.0.0.1', 6667, self.callback, tag = 1)
+        self.runUntil(1)
+        addresses, error, tag = self.results[0]
+        self.assertEqual(error, None)
+        self.assertEqual(tag, 1)
+        self.assertTrue((socket.AF_INET, ('127.0.0.1', 6667)) in addresses)
+
+    def testCached(self):
+        self.resolver.resolve('127.0.0.1', 6667, self.callback)
+        self.runUntil(1)
+        self.resolver.resolve('127.0.0.1', 6667, self.callback)
+        self.assertEqual(len(self.results), 2)
+        self.assertEqual(self.results[0], self.results[1])
+
+    def testSharedLookup(self):
+        for tag in xrange(3):
+            self.resolver.resolve('127.0.0.1', 6667, self.callback,
+                tag = tag)
+        self.assertTrue(self.resolver.queue.qsize() <= 1)
+        self.runUntil(3)
+        self.assertEqual(sorted(tag for _, _, tag in self.results), [0, 1, 2])
+
+    def testFailure(self):
+        self.resolver.resolve('no-such-host.invalid', 6667, self.callback)
+        self.runUntil(1)
+        addresses, error, tag = self.results[0]
+        self.assertEqual(addresses, None)
+        self.assertTrue(isinstance(error, socket.error))
+
+if __name__ == '__main__':
+    unittest.main()
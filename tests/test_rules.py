@@ -0,0 +1,127 @@
+# Deadline rules tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from rules import DeadRule, DeadRuleSet, requiredLiteral, offloaded
+
+def handler(*args):
+    return args
+
+class DeadRuleSetTest(unittest.TestCase):
+    def setUp(self):
+        self.rules = DeadRuleSet()
+
+    def matches(self, channel, nick, text):
+        return [(trigger.rule, arg) for trigger, arg in
+            self.rules.match(channel, nick, text)]
+
+    def testKeyword(self):
+        rule = DeadRule(handler)
+        self.rules.addKeyword('Seen', rule)
+        self.assertEqual(self.matches('#chan', 'nick', '.seen bob'),
+            [(rule, 'bob')])
+        self.assertEqual(self.matches('#chan', 'nick', '.SEEN'),
+            [(rule, '')])
+        self.assertEqual(self.matches('#chan', 'nick', 'seen bob'), [])
+        self.assertEqual(self.matches('#chan', 'nick', '.seenbob'), [])
+
+    def testRegex(self):
+        rule = DeadRule(handler)
+        self.rules.addRegex(r'https?://(\S+)', rule)
+        self.assertEqual(self.matches(None, 'nick', 'see http://x.org/ ok'),
+            [(rule, ('http://x.org/', 'x.org/'))])
+        self.assertEqual(self.matches(None, 'nick', 'see ftp://x.org/'), [])
+
+    def testOrder(self):
+        # Prefiltered, guarded and unmergeable regexes keep their order
+        rules = [DeadRule(handler) for n in xrange(4)]
+        self.rules.addRegex(r'(a)\1', rules[0])
+        self.rules.addRegex(r'needle', rules[1])
+        self.rules.addRegex(r'a+', rules[2])
+        self.rules.addRegex(r'NEEDLE', rules[3], flags = re.IGNORECASE)
+        self.assertEqual([rule for rule, arg in
+            self.matches('#chan', 'nick', 'aa needle')], rules)
+        self.assertEqual([rule for rule, arg in
+            self.matches('#chan', 'nick', 'b needle')], [rules[1], rules[3]])
+
+    def testChannels(self):
+        rule = DeadRule(handler)
+        self.rules.addKeyword('op', rule, channels = '#Ops')
+        self.assertEqual(len(self.matches('#ops', 'nick', '.op')), 1)
+        self.assertEqual(len(self.matches('#other', 'nick', '.op')), 0)
+        self.assertEqual(len(self.matches(None, 'nick', '.op')), 0)
+
+    def testUsers(self):
+        rule = DeadRule(handler)
+        self.rules.addRegex('deploy', rule, users = ('Alice', 'bob'))
+        self.assertEqual(len(self.matches('#chan', 'alice', 'deploy')), 1)
+        self.assertEqual(len(self.matches('#chan', 'BOB', 'deploy')), 1)
+        self.assertEqual(len(self.matches('#chan', 'eve', 'deploy')), 0)
+        self.assertEqual(len(self.matches(None, 'eve', 'deploy')), 0)
+
+    def testRemove(self):
+        rule = DeadRule(handler)
+        trigger = self.rules.addKeyword('x', rule)
+        self.assertEqual(len(self.matches('#chan', 'nick', '.x')), 1)
+        self.rules.removeTrigger(trigger)
+        self.assertEqual(self.matches('#chan', 'nick', '.x'), [])
+
+    def testACL(self):
+        rule = DeadRule(handler, acl = 'ops')
+        self.rules.addKeyword('kick', rule)
+        self.rules.access.allow('ops', '*!*@admin.example.org')
+        self.assertEqual(len(self.rules.match('#chan', 'nick', '.kick',
+            'nick!u@admin.example.org')), 1)
+        self.assertEqual(len(self.rules.match('#chan', 'nick', '.kick',
+            'nick!u@example.org')), 0)
+        self.assertEqual(len(self.rules.match('#chan', 'nick', '.kick')), 0)
+
+    def testScopeLimit(self):
+        self.rules.addKeyword('x', DeadRule(handler))
+        for n in xrange(DeadRuleSet.MAX_SCOPES + 1):
+            self.rules.match('#c%d' % n, 'nick', '.x')
+        self.assertTrue(len(self.rules.scopes) <= DeadRuleSet.MAX_SCOPES)
+
+    def testRequiredLiteral(self):
+        self.assertEqual(requiredLiteral(re.compile(r'ab+cdef?')), 'cde')
+        self.assertEqual(requiredLiteral(re.compile(r'a|b')), '')
+        self.assertEqual(requiredLiteral(re.compile(r'abc', re.I)), '')
+
+class DeadRuleTest(unittest.TestCase):
+    def runRule(self, rule, pool = None):
+        results = []
+        ran = rule.run(pool, lambda result, error:
+            results.append((result, error)), 'a', 'b')
+        return ran, results
+
+    def testInline(self):
+        self.assertEqual(self.runRule(DeadRule(handler)),
+            (True, [(('a', 'b'), None)]))
+
+    def testError(self):
+        error = ValueError('broken')
+        def fail(*args):
+            raise error
+        self.assertEqual(self.runRule(DeadRule(fail)),
+            (True, [(None, error)]))
+
+    def testOffloaded(self):
+        rule = DeadRule(offloaded(2.5)(handler))
+        self.assertTrue(rule.offload)
+        self.assertEqual(rule.timeout, 2.5)
+
+        # Runs inline without a pool
+        self.assertEqual(self.runRule(rule), (True, [(('a', 'b'), None)]))
+
+    def testPoolFull(self):
+        class FullPool(object):
+            def submit(self, func, args, callback, timeout):
+                return None
+        rule = DeadRule(handler, offload = True)
+        self.assertEqual(self.runRule(rule, FullPool()), (False, []))
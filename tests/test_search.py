@@ -0,0 +1,144 @@
+# Deadline scrollback search tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from search import DeadSearch, DeadSearchIndex, tokenize
+from gui import DeadGUI
+from log import DeadLog
+from events import DeadEventQueue
+
+class DeadSearchIndexTest(unittest.TestCase):
+    def testTokenize(self):
+        self.assertEqual(tokenize("Hello, hello world :)"),
+            set(['hello', 'world']))
+        self.assertEqual(tokenize(":) --"), set())
+
+    def testLookup(self):
+        index = DeadSearchIndex()
+        index.add(0, "foo bar")
+        index.add(1, "bar baz")
+        index.add(2, "foo baz")
+        postings = index.lookup(['foo', 'baz'])
+        self.assertEqual([list(seqs[start:]) for seqs, start in postings],
+            [[0, 2], [1, 2]])
+        self.assertEqual(index.lookup(['foo', 'qux']), None)
+
+    def testRemove(self):
+        index = DeadSearchIndex()
+        for seq in xrange(10):
+            index.add(seq, "common word%d" % seq)
+        for seq in xrange(8):
+            index.remove(seq, "common word%d" % seq)
+        self.assertEqual(index.first, 8)
+        self.assertEqual(index.lookup(['word3']), None)
+        seqs, start = index.lookup(['common'])[0]
+        self.assertEqual(list(seqs[start:]), [8, 9])
+
+class DeadSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.gui = DeadGUI()
+
+        # Not shown, only the prompt needs the size of the terminal
+        self.gui.height, self.gui.width = 24, 80
+        self.search = DeadSearch(self.gui)
+
+    def tearDown(self):
+        for window in self.gui.windows:
+            if window.log is not None:
+                window.log.close()
+        shutil.rmtree(self.dir)
+
+    def getResults(self):
+        return [message.content for message in self.search.window.messages]
+
+    def testNoTokens(self):
+        self.search.searchCall(':)')
+        self.assertEqual(self.search.window, None)
+        messages = self.gui.getMainWindow().messages
+        self.assertTrue("Nothing to search for" in
+            messages[messages.end - 1].content)
+
+    def testSearch(self):
+        window = self.gui.createWindow("chan")
+        window.addNotice("http://example.org posted")
+        window.addNotice("nothing here")
+        self.search.searchCall('example')
+        results = self.getResults()
+        self.assertEqual(results[-1], "1 result(s)")
+        self.assertTrue(results[-2].endswith("http://example.org posted"))
+
+    def testLoggedWindowIndexIsBounded(self):
+        log = DeadLog(os.path.join(self.dir, 'chan'))
+        window = self.gui.createWindow("chan", 10, log)
+        for n in xrange(100):
+            window.addNotice("message number%d" % n)
+        self.assertEqual(window.search.first, 90)
+        self.assertEqual(len(window.search.postings), 11)
+
+        # Older messages are found in the log
+        self.gui.setCurrentWindow(window)
+        self.search.searchCall('-here number5')
+        self.assertEqual(self.getResults()[-1], "1 result(s)")
+
+    def startLoggedSearch(self):
+        chunk = DeadSearch.CHUNK_SIZE
+        DeadSearch.CHUNK_SIZE = 10
+        self.addCleanup(setattr, DeadSearch, 'CHUNK_SIZE', chunk)
+        self.gui.setEventQueue(DeadEventQueue())
+
+        windows = []
+        for name in ('one', 'two'):
+            log = DeadLog(os.path.join(self.dir, name))
+            window = self.gui.createWindow(name, 10, log)
+            for n in xrange(100):
+                window.addNotice("%s number%d" % (name, n % 10))
+            windows.append(window)
+        self.search.searchCall('number5')
+        self.assertTrue(self.search.job is not None)
+        return windows
+
+    def closeWindow(self, window):
+        # As Deadline.closeWindow does
+        self.search.forgetWindow(window)
+        if window.log is not None:
+            window.log.close()
+        self.gui.removeWindow(window)
+
+    def runEvents(self):
+        while self.gui.eq:
+            self.gui.eq.elapseTime()
+
+    def testCloseWindowWhileSearching(self):
+        one, two = self.startLoggedSearch()
+        self.gui.eq.elapseTime()
+        self.closeWindow(two)
+        self.runEvents()
+        self.assertEqual(self.search.job, None)
+        results = self.getResults()
+        self.assertEqual(results[-1], "10 result(s)")
+        self.assertTrue(all(' one number5' in line for line in results[1:-1]))
+
+    def testCloseWaitingWindowWhileSearching(self):
+        one, two = self.startLoggedSearch()
+        self.gui.eq.elapseTime()
+        self.closeWindow(one)
+        self.runEvents()
+        self.assertEqual(self.getResults()[-1], "10 result(s)")
+
+    def testCloseSearchWindowWhileSearching(self):
+        self.startLoggedSearch()
+        self.closeWindow(self.search.window)
+        self.runEvents()
+        self.assertEqual(self.search.job, None)
+        self.assertEqual(self.search.window, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# Deadline IRC state tracker tests
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'deadline'))
+from irc import parseMessage
+from state import YeOldeIRCState
+
+class YeOldeIRCStateTest(unittest.TestCase):
+    def setUp(self):
+        self.state = YeOldeIRCState()
+        self.feed(':server 001 me :Welcome',
+            ':me!u@h JOIN #chan')
+
+    def feed(self, *lines):
+        for line in lines:
+            self.state.update(parseMessage(line))
+
+    def members(self, channel = '#chan'):
+        members = self.state.getMembers(channel)
+        return None if members is None else dict(members)
+
+    def testJoin(self):
+        self.feed(':bob!b@host JOIN #chan', ':eve!e@host JOIN #other')
+        self.assertEqual(self.members(), {'me' : 0, 'bob' : 0})
+        self.assertEqual(self.state.getUser('BOB').getMask(), 'bob!b@host')
+        self.assertEqual(self.state.getUser('eve'), None)
+        self.assertEqual(self.state.getChannel('#other'), None)
+
+    def testPart(self):
+        self.feed(':bob!b@host JOIN #chan', ':bob!b@host PART #chan :bye')
+        self.assertEqual(self.members(), {'me' : 0})
+
+        # Users sharing no channel are forgotten
+        self.assertEqual(self.state.getUser('bob'), None)
+
+        self.feed(':me!u@h PART #chan')
+        self.assertEqual(self.members(), None)
+        self.assertEqual(self.state.getUser('me').nick, 'me')
+
+    def testKick(self):
+        self.feed(':bob!b@host JOIN #chan', ':bob!b@host KICK #chan me :out')
+        self.assertEqual(self.state.getChannel('#chan'), None)
+        self.assertEqual(self.state.getUser('bob'), None)
+
+    def testQuit(self):
+        self.feed(':me!u@h JOIN #two', ':bob!b@host JOIN #chan',
+            ':bob!b@host JOIN #two', ':bob!b@host QUIT :gone')
+        self.assertEqual(self.members(), {'me' : 0})
+        self.assertEqual(self.members('#two'), {'me' : 0})
+        self.assertEqual(self.state.getUser('bob'), None)
+
+    def testNick(self):
+        self.feed(':bob!b@host JOIN #chan', ':bob!b@host NICK :robert',
+            ':me!u@h NICK :myself')
+        self.assertEqual(self.members(), {'myself' : 0, 'robert' : 0})
+        self.assertEqual(self.state.nick, 'myself')
+        self.assertEqual(self.state.getUser('bob'), None)
+        self.assertTrue(self.state.isMe('MYSELF'))
+
+    def testCaseMapping(self):
+        self.feed(':b[]b!b@host JOIN #Chan')
+        self.assertEqual(self.state.getUser('B{}B').nick, 'b[]b')
+        self.assertEqual(self.state.getModes('#CHAN', 'b{}b'), 0)
+
+    def testNames(self):
+        self.feed(':bob!b@host JOIN #chan',
+            ':server 353 me = #chan :@me +alice @+carol!c@host',
+            ':server 353 me = #chan :dave')
+        # Members are only replaced at the end of the burst
+        self.assertEqual(self.members(), {'me' : 0, 'bob' : 0})
+
+        self.feed(':server 366 me #chan :End of /NAMES list.')
+        self.assertEqual(self.members(), {'me' : 2, 'alice' : 1,
+            'carol' : 3, 'dave' : 0})
+        self.assertEqual(self.state.getUser('bob'), None)
+        self.assertEqual(self.state.getUser('carol').host, 'host')
+        self.assertEqual(self.state.prefixOf(3), '@')
+        self.assertEqual(self.state.getUser('dave').channels, set(['#chan']))
+
+    def testQuitDuringNames(self):
+        self.feed(':server 353 me = #chan :me alice bob',
+            ':alice!a@host QUIT :gone',
+            ':server 366 me #chan :End of /NAMES list.')
+        self.assertEqual(self.members(), {'me' : 0, 'bob' : 0})
+        self.assertEqual(self.state.getUser('alice'), None)
+
+    def testPartDuringNames(self):
+        self.feed(':me!u@h JOIN #b', ':bob!b@host JOIN #chan',
+            ':server 353 me = #b :me bob',
+            ':bob!b@host PART #chan',
+            ':server 366 me #b :End of /NAMES list.')
+        self.assertEqual(self.members('#b'), {'me' : 0, 'bob' : 0})
+        self.assertEqual(self.state.getUser('bob').channels, set(['#b']))
+
+    def testKickDuringNames(self):
+        self.feed(':me!u@h JOIN #b', ':bob!b@host JOIN #chan',
+            ':server 353 me = #b :me bob',
+            ':me!u@h KICK #chan bob',
+            ':server 366 me #b :End of /NAMES list.')
+        self.assertEqual(self.members('#b'), {'me' : 0, 'bob' : 0})
+
+    def testLeaveDuringNames(self):
+        self.feed(':me!u@h JOIN #b', ':server 353 me = #b :me bob',
+            ':me!u@h PART #b')
+        self.assertEqual(self.state.getChannel('#b'), None)
+        self.assertEqual(self.state.getUser('bob'), None)
+
+    def testPrefix(self):
+        self.feed(':server 005 me PREFIX=(qaohv)~&@%+ :are supported',
+            ':server 353 me = #chan :~me %bob')
+        self.feed(':server 366 me #chan :End')
+        self.assertEqual(self.members(), {'me' : 16, 'bob' : 2})
+        self.assertEqual(self.state.prefixOf(2), '%')
+
+    def testCaseMappingToken(self):
+        # Only switched before joining any channel
+        self.feed(':server 005 me CASEMAPPING=ascii :are supported')
+        self.assertEqual(self.state.lower('A[]'), 'a{}')
+
+        state = self.state = YeOldeIRCState()
+        self.feed(':server 001 me :Welcome',
+            ':server 005 me CASEMAPPING=ascii :are supported')
+        self.assertEqual(state.lower('A[]'), 'a[]')
+        self.assertTrue(state.isMe('ME'))
+
+    def testMode(self):
+        self.feed(':bob!b@host JOIN #chan',
+            ':me!u@h MODE #chan +okl-v bob key 10 bob',
+            ':me!u@h MODE #chan +bm *!*@spam')
+        self.assertEqual(self.state.getModes('#chan', 'bob'), 2)
+        self.assertEqual(self.state.getChannel('#chan').modes,
+            {'k' : 'key', 'l' : '10', 'm' : True})
+
+        self.feed(':me!u@h MODE #chan -ol+v-k-lm bob bob key')
+        self.assertEqual(self.state.getModes('#chan', 'bob'), 1)
+        self.assertEqual(self.state.getChannel('#chan').modes, {})
+
+    def testTopic(self):
+        self.feed(':server 332 me #chan :old topic')
+        self.assertEqual(self.state.getChannel('#chan').topic, 'old topic')
+        self.feed(':bob!b@host TOPIC #chan :new topic')
+        self.assertEqual(self.state.getChannel('#chan').topic, 'new topic')